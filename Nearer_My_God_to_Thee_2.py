@@ -7,9 +7,16 @@ Basato sulla logica del file originale "Nearer My God to Thee 2.py",
 adattato per funzionare sia come script standalone sia come modulo importabile.
 """
 
+import os
+
 import pandas as pd
 import numpy as np
-import yfinance as yf
+
+from batch_eval import METRICS, eval_next_open_batch
+from feature_store import feature
+from indicators import rolling_mean
+from instrumentation import download_span, span
+from price_store import default_store, fetch_many
 
 # ================= PARAMETRI =================
 MAIN_TICKER = "FTSEMIB.MI"
@@ -27,30 +34,83 @@ TICKERS = {
     "NEXI": "NEXI.MI",
 }
 
+# Ticker alternativi provati se il principale non restituisce dati
+FALLBACK_TICKERS = {
+    "STELLANTIS": ["STLA.MI"],
+}
+
+# Universo alternativo da CSV "nome,ticker[,fallback...]" (es. tutti i
+# titoli del FTSE MIB): sostituisce TICKERS e FALLBACK_TICKERS
+UNIVERSE_FILE = os.environ.get("FTSEMIB_UNIVERSE") or None
+
 # Fattori volume (come da versione allegata)
 VOL_MA10_FACTOR = 0.90
 VOL_MA5_FACTOR  = 0.90
 
+# Colonne effettivamente usate dal modello, per sorgente
+FTSE_COLUMNS  = ["Open", "Close", "Volume"]
+STOCK_COLUMNS = ["Volume"]
+SPX_COLUMNS   = ["Close"]
+
+# Modalità compatta: prezzi float32, volumi interi (uint32 se entrano)
+COMPACT = os.environ.get("FTSEMIB_COMPACT", "") == "1"
+
+def load_universe(path: str) -> tuple[dict, dict]:
+    """(TICKERS, FALLBACK_TICKERS) da un CSV "nome,ticker[,fallback...]"."""
+    tickers, fallback = {}, {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = [p.strip() for p in line.split(",") if p.strip()]
+            if len(parts) < 2 or parts[0].startswith("#") or parts[0].lower() == "nome":
+                continue
+            tickers[parts[0]] = parts[1]
+            if len(parts) > 2:
+                fallback[parts[0]] = parts[2:]
+    return tickers, fallback
+
+if UNIVERSE_FILE:
+    TICKERS, FALLBACK_TICKERS = load_universe(UNIVERSE_FILE)
+
+# ================= PATTERN VOLUMI (dichiarativi) =================
+# Pattern in OR: (titolo, finestra media, fattore) => Volume <= fattore * media
+PATTERNS = [(n, 10, VOL_MA10_FACTOR) for n in TICKERS] + [("PIRELLI", 5, VOL_MA5_FACTOR)]
+# Condizioni composte, in OR con i pattern: nome -> pattern in AND
+COMPOSITES = {
+    "POSTE_AND_UNIPOL": [("POSTE", 10, VOL_MA10_FACTOR), ("UNIPOL", 10, VOL_MA10_FACTOR)],
+}
+# Pattern dell'indice, sempre presente
+FTSE_PATTERN = ("FTSE", 10, VOL_MA10_FACTOR)
+
 # ================= FUNZIONI BASE =================
-def download_ohlcv(ticker: str) -> pd.DataFrame | None:
-    df = yf.download(
-        ticker,
-        start=START_DATE,
-        interval="1d",
-        auto_adjust=AUTO_ADJUST,
-        progress=False
-    )
+def download_ohlcv(ticker: str, auto_adjust: bool = AUTO_ADJUST,
+                   start: str = START_DATE) -> pd.DataFrame | None:
+    # Letto attraverso la cache locale: da Yahoo arrivano solo le barre nuove
+    df = default_store().get(ticker, start, auto_adjust)
     if df is None or df.empty:
         print(f"[WARN] Nessun dato per {ticker}")
         return None
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = df.columns.get_level_values(0)
     need = ["Open", "High", "Low", "Close", "Volume"]
-    if not all(c in df.columns for c in need):
-        print(f"[WARN] Colonne mancanti per {ticker}: {df.columns}")
-        return None
     return df[need].dropna()
 
+def column(data: pd.DataFrame, name: str) -> np.ndarray:
+    """Colonna come array float64 con NaN per i mancanti (anche da dtype compatti)."""
+    if name not in data.columns:
+        return np.full(len(data), np.nan)
+    return data[name].to_numpy(dtype=float, na_value=np.nan)
+
+def compact_dtype(s: pd.Series, kind: str) -> pd.Series:
+    """float32 per i prezzi; per i volumi interi UInt32/Int64 (nullable se ci sono buchi)."""
+    if kind != "Volume":
+        return s.astype(np.float32)
+    v = s.to_numpy(dtype=float)
+    ok = v[~np.isnan(v)]
+    if ok.size and (np.any(ok != np.round(ok)) or ok.min() < 0):
+        return s  # volumi frazionari: nessuna compattazione senza perdita
+    big = ok.size and ok.max() >= 2**32
+    if ok.size == len(v):
+        return s.astype(np.int64 if big else np.uint32)
+    return s.astype("Int64" if big else "UInt32")
+
 def bool_series(x, idx):
     s = pd.Series(x, index=idx)
     return s.fillna(False).astype(bool)
@@ -66,7 +126,7 @@ def slope_log_equity(equity: np.ndarray) -> float:
     eq = np.asarray(equity, float)
     if len(eq) < 10:
         return 0.0
-    eq = np.where(eq <= 0, np.nan)
+    eq = np.where(eq <= 0, np.nan, eq)
     s = pd.Series(eq).dropna()
     if len(s) < 10:
         return 0.0
@@ -99,103 +159,157 @@ def eval_next_open(ret_next: pd.Series,
     Strategia:
       - signal[t] True => trade su Open[t+1]
       - ret_next[t] = Open[t+1] / Close[t] - 1
+    Caso a una colonna di batch_eval.eval_next_open_batch.
     """
     sig = bool_series(signal, idx)
-    valid = ~ret_next.isna()
-    trade_mask = sig & valid
-
-    if trade_mask.sum() == 0:
-        equity = np.ones(len(idx))
-        return {
-            "n_trades": 0,
-            "winrate_%": 0.0,
-            "avg_trade_%": 0.0,
-            "avg_trade_pts": 0.0,
-            "total_ret_%": 0.0,
-            "sharpe": 0.0,
-            "sortino": 0.0,
-            "max_dd_%": 0.0,
-            "slope": 0.0,
-            "cagr_%": 0.0,
-            "equity": equity,
-            "daily_returns": np.zeros(len(idx)),
-        }
-
-    # Ritorni solo nelle date con trade, 0 altrove
-    daily_returns = np.where(trade_mask.values,
-                             ret_next.fillna(0.0).values,
-                             0.0)
-    equity = np.cumprod(1.0 + daily_returns)
-    trade_rets = ret_next[trade_mask].values
-
-    winrate = float((trade_rets > 0).mean() * 100.0)
-    avg_trade_pct = float(trade_rets.mean() * 100.0)
-    avg_trade_pts = float(trade_rets.mean() * 40000.0)  # size future indicativo
-    total_ret_pct = float((np.prod(1.0 + trade_rets) - 1.0) * 100.0)
-    sharpe, sortino = sharpe_sortino(trade_rets)
-    mdd = max_dd(equity)
-    slp = slope_log_equity(equity)
-
-    # CAGR
-    n_days = (idx[-1] - idx[0]).days
-    if n_days <= 0 or equity[-1] <= 0:
-        cagr_pct = 0.0
-    else:
-        years = n_days / 365.25
-        cagr = equity[-1] ** (1.0 / years) - 1.0
-        cagr_pct = float(cagr * 100.0)
+    res = eval_next_open_batch(ret_next.values, sig.values, idx, with_equity=True)
+    out = {k: float(v[0]) for k, v in res.items() if k in METRICS}
+    out["n_trades"] = int(res["n_trades"][0])
+    out["equity"] = res["equity"][:, 0]
+    out["daily_returns"] = res["daily_returns"][:, 0]
+    return out
 
-    return {
-        "n_trades": int(trade_mask.sum()),
-        "winrate_%": winrate,
-        "avg_trade_%": avg_trade_pct,
-        "avg_trade_pts": avg_trade_pts,
-        "total_ret_%": total_ret_pct,
-        "sharpe": sharpe,
-        "sortino": sortino,
-        "max_dd_%": mdd,
-        "slope": slp,
-        "cagr_%": cagr_pct,
-        "equity": equity,
-        "daily_returns": daily_returns,
-    }
+# ================= PATTERN VOLUMI =================
+def vol_ma_le_factor(data: pd.DataFrame, prefix: str, ma_window: int, factor: float) -> pd.Series:
+    idx = data.index
+    col = f"{prefix}_Volume"
+    if col not in data.columns:
+        return pd.Series(False, index=idx)
+    v = column(data, col)
+    ma = feature("rolling_mean", rolling_mean, idx, [v], {"window": ma_window}, lookback=ma_window)
+    with np.errstate(invalid="ignore"):
+        return bool_series(v <= factor * ma, idx)
 
-def run_model() -> dict:
+def pattern_name(pattern: tuple) -> str:
+    name, window, factor = pattern
+    return f"{name}_VOL_MA{window}_LE_{factor * 100:.0f}"
+
+def active_patterns(used: list, patterns: list | None = None,
+                    composites: dict | None = None) -> tuple[list, dict]:
+    """Pattern e composte dei soli titoli in `used` (più il pattern FTSE)."""
+    patterns = PATTERNS if patterns is None else patterns
+    composites = COMPOSITES if composites is None else composites
+    ok = set(used) | {"FTSE"}
+    single = [tuple(p) for p in patterns if p[0] in ok]
+    if FTSE_PATTERN not in single:
+        single.append(FTSE_PATTERN)
+    comp = {k: [tuple(p) for p in v] for k, v in composites.items() if all(p[0] in ok for p in v)}
+    return single, comp
+
+def volume_matrix(data: pd.DataFrame, names: list) -> np.ndarray:
+    """Volumi date × titoli (float64, NaN per i mancanti)."""
+    if not names:
+        return np.zeros((len(data), 0))
+    return np.column_stack([column(data, f"{n}_Volume") for n in names])
+
+def pattern_masks(data: pd.DataFrame, patterns: list) -> np.ndarray:
     """
-    Esegue il modello completo e restituisce:
-      - data: DataFrame con FTSE + titoli + SPX
-      - idx: index date
-      - sig_final: Serie booleana segnali
-      - metrics: dict con metriche e equity
+    Condizioni Volume <= fattore * media (date × pattern, bool). Una media
+    mobile 2-D per finestra, su tutti i titoli che la usano (dal feature store).
     """
-    print("[INFO] Scarico FTSEMIB (master timeline)...")
-    ftse = download_ohlcv(MAIN_TICKER)
-    if ftse is None:
-        raise SystemExit("Impossibile scaricare FTSEMIB.MI")
-    ftse.columns = [f"FTSE_{c}" for c in ftse.columns]
-    data = ftse.copy()
+    out = np.zeros((len(data), len(patterns)), dtype=bool)
+    for w in sorted({p[1] for p in patterns}):
+        cols = [j for j, p in enumerate(patterns) if p[1] == w]
+        vol = volume_matrix(data, [patterns[j][0] for j in cols])
+        factor = np.array([patterns[j][2] for j in cols])
+        with np.errstate(invalid="ignore"):
+            ma = feature("rolling_mean", rolling_mean, data.index, [vol], {"window": w}, lookback=w)
+            out[:, cols] = vol <= factor * ma  # NaN => False
+    return out
 
-    print("[INFO] Scarico titoli per pattern volumi (LEFT JOIN su FTSE)...")
-    used = []
-    for name, ticker in TICKERS.items():
-        d = download_ohlcv(ticker)
-        if (d is None or d.empty) and name == "STELLANTIS":
-            print("[INFO] Retry STELLANTIS con STLA.MI...")
-            d = download_ohlcv("STLA.MI")
+def volume_conditions(data: pd.DataFrame, used: list, patterns: list | None = None,
+                      composites: dict | None = None) -> dict:
+    """Pattern volumi (una Serie booleana per condizione) da mettere in OR."""
+    single, comp = active_patterns(used, patterns, composites)
+    parts = {p for v in comp.values() for p in v} - set(single)
+    allp = single + sorted(parts)
+    masks = pattern_masks(data, allp)
+    col = {p: masks[:, j] for j, p in enumerate(allp)}
+    idx = data.index
+    conds = {pattern_name(p): pd.Series(col[p], index=idx) for p in single}
+    for name, v in comp.items():
+        conds[f"{name}_VOL"] = pd.Series(np.logical_and.reduce([col[p] for p in v]), index=idx)
+    return conds
+
+def build_signal(data: pd.DataFrame, conds: dict) -> pd.Series:
+    """OR dei pattern volumi AND filtro SPX (aggiunge SPX_Ret_1d_% a data)."""
+    idx = data.index
+    # OR dei pattern
+    sig_or = pd.Series(np.logical_or.reduce([c.to_numpy(dtype=bool) for c in conds.values()]),
+                       index=idx)
+
+    # ================= FILTRO SPX =================
+    data["SPX_Ret_1d_%"] = data["SPX_Close"].astype(float).pct_change(fill_method=None) * 100.0
+    filtro_spx = bool_series(data["SPX_Ret_1d_%"] >= 0.0, idx)
+
+    return sig_or & filtro_spx
+
+def align(ftse: pd.DataFrame, ftse_columns: list, sources: dict,
+          compact: bool = False) -> pd.DataFrame:
+    """
+    Allinea sulla timeline FTSE (LEFT JOIN) solo le colonne indicate:
+    `sources` = {prefisso: (frame, colonne)}. Un solo reindex per sorgente
+    e una sola costruzione del DataFrame finale.
+    """
+    idx = ftse.index
+    cols = {f"FTSE_{c}": ftse[c] for c in ftse_columns}
+    for name, (d, columns) in sources.items():
+        for c in columns:
+            cols[f"{name}_{c}"] = d[c].reindex(idx)
+    if compact:
+        cols = {k: compact_dtype(v, k.rsplit("_", 1)[1]) for k, v in cols.items()}
+    return pd.DataFrame(cols, index=idx)
+
+def assemble(ftse: pd.DataFrame, frames: dict, spx: pd.DataFrame,
+             compact: bool = False) -> tuple[pd.DataFrame, list]:
+    """FTSE Open/Close/Volume, Volume dei titoli disponibili e Close SPX."""
+    sources, used = {}, []
+    for name, d in frames.items():
         if d is None or d.empty:
             print(f"[WARN] Escludo {name}")
             continue
-        d = d.add_prefix(f"{name}_")
-        data = data.join(d, how="left")
+        sources[name] = (d, STOCK_COLUMNS)
         used.append(name)
+    sources["SPX"] = (spx, SPX_COLUMNS)
+    return align(ftse, FTSE_COLUMNS, sources, compact), used
+
+def fetch_data(compact: bool | None = None) -> tuple[pd.DataFrame, list]:
+    """
+    Scarica in parallelo FTSE, titoli del paniere e SPX e li unisce
+    in LEFT JOIN sulla timeline FTSE. Restituisce (data, titoli usati).
+    `compact` (default COMPACT) riduce i dtype, vedi compact_dtype.
+    """
+    print("[INFO] Scarico FTSEMIB, titoli e SPX in parallelo...")
+    symbols = {"FTSE": [MAIN_TICKER]}
+    for name, ticker in TICKERS.items():
+        symbols[name] = [ticker] + FALLBACK_TICKERS.get(name, [])
+    symbols["SPX"] = [SPX_TICKER]
+    with download_span("download", default_store()):
+        frames = fetch_many(symbols, download_ohlcv)
 
-    print("[INFO] Scarico SPX (LEFT JOIN su FTSE)...")
-    spx = download_ohlcv(SPX_TICKER)
+    ftse = frames.pop("FTSE")
+    if ftse is None:
+        raise SystemExit("Impossibile scaricare FTSEMIB.MI")
+    spx = frames.pop("SPX")
     if spx is None:
         raise SystemExit("Impossibile scaricare SPX")
-    spx = spx.rename(columns={"Close": "SPX_Close"})
-    data = data.join(spx["SPX_Close"], how="left")
 
+    with span("join") as s:
+        data, used = assemble(ftse, frames, spx, COMPACT if compact is None else compact)
+        s.rows = len(data)
+        s.frame_bytes = int(data.memory_usage(index=False).sum())
+    return data, used
+
+def run_model() -> dict:
+    """
+    Esegue il modello completo e restituisce:
+      - data: DataFrame con FTSE + titoli + SPX
+      - used: titoli effettivamente usati
+      - idx: index date
+      - sig_final: Serie booleana segnali
+      - metrics: dict con metriche e equity
+    """
+    data, used = fetch_data()
     # Pulisci solo righe con FTSE valido
     data = data.dropna(subset=["FTSE_Close"]).copy()
     idx = data.index
@@ -203,62 +317,33 @@ def run_model() -> dict:
         raise SystemExit("Nessuna data valida dopo merge.")
     print(f"[INFO] Range dati FTSE: {idx[0].date()} -> {idx[-1].date()}")
     print(f"[INFO] Titoli effettivamente usati: {used}")
+    return model_results(data, used)
 
-    # ================= PATTERN VOLUMI =================
-    def vol_ma_le_factor(prefix, ma_window, factor):
-        col = f"{prefix}_Volume"
-        if col not in data.columns:
-            return pd.Series(False, index=idx)
-        v = data[col]
-        ma = v.rolling(ma_window).mean()
-        return bool_series(v <= factor * ma, idx)
-
-    conds = {}
-    if "POSTE" in used:
-        conds["POSTE_VOL_MA10_LE_70"] = vol_ma_le_factor("POSTE", 10, VOL_MA10_FACTOR)
-    if "UNIPOL" in used:
-        conds["UNIPOL_VOL_MA10_LE_70"] = vol_ma_le_factor("UNIPOL", 10, VOL_MA10_FACTOR)
-    if "PIRELLI" in used:
-        conds["PIRELLI_VOL_MA10_LE_70"] = vol_ma_le_factor("PIRELLI", 10, VOL_MA10_FACTOR)
-        conds["PIRELLI_VOL_MA5_LE_70"] = vol_ma_le_factor("PIRELLI", 5, VOL_MA5_FACTOR)
-    if "STELLANTIS" in used:
-        conds["STELLANTIS_VOL_MA10_LE_70"] = vol_ma_le_factor("STELLANTIS", 10, VOL_MA10_FACTOR)
-    if "ITALGAS" in used:
-        conds["ITALGAS_VOL_MA10_LE_70"] = vol_ma_le_factor("ITALGAS", 10, VOL_MA10_FACTOR)
-    if "ENEL" in used:
-        conds["ENEL_VOL_MA10_LE_70"] = vol_ma_le_factor("ENEL", 10, VOL_MA10_FACTOR)
-    if "NEXI" in used:
-        conds["NEXI_VOL_MA10_LE_70"] = vol_ma_le_factor("NEXI", 10, VOL_MA10_FACTOR)
-
-    if "POSTE" in used and "UNIPOL" in used:
-        conds["POSTE_AND_UNIPOL_VOL_MA10_LE_70"] = (
-            conds["POSTE_VOL_MA10_LE_70"] & conds["UNIPOL_VOL_MA10_LE_70"]
-        )
-
-    # FTSE volume pattern
-    ftse_vol = data["FTSE_Volume"]
-    ma10_ftse = ftse_vol.rolling(10).mean()
-    conds["FTSE_VOL_MA10_LE_70"] = bool_series(ftse_vol <= VOL_MA10_FACTOR * ma10_ftse, idx)
-
-    # OR dei pattern
-    sig_or = pd.concat(conds.values(), axis=1).any(axis=1)
+def model_results(data: pd.DataFrame, used: list) -> dict:
+    """Pattern, segnale e metriche di run_model su `data` (solo righe con FTSE valido)."""
+    idx = data.index
 
-    # ================= FILTRO SPX =================
-    data["SPX_Ret_1d_%"] = data["SPX_Close"].pct_change(fill_method=None) * 100.0
-    filtro_spx = bool_series(data["SPX_Ret_1d_%"] >= 0.0, idx)
+    # ================= PATTERN VOLUMI =================
+    with span("indicators", rows=len(idx)):
+        conds = volume_conditions(data, used)
 
     # ================= SEGNALE FINALE =================
-    sig_final = sig_or & filtro_spx
+    with span("signal", rows=len(idx)):
+        sig_final = build_signal(data, conds)
 
     # ================= FTSE RET NEXT OPEN =================
-    data["FTSE_Ret_NextOpen"] = data["FTSE_Open"].shift(-1) / data["FTSE_Close"] - 1.0
-    ret_next = data["FTSE_Ret_NextOpen"]
+    with span("evaluation", rows=len(idx)):
+        data["FTSE_Ret_NextOpen"] = (
+            data["FTSE_Open"].astype(float).shift(-1) / data["FTSE_Close"].astype(float) - 1.0
+        )
+        ret_next = data["FTSE_Ret_NextOpen"]
 
-    metrics = eval_next_open(ret_next, sig_final, idx)
-    equity = metrics["equity"]
+        metrics = eval_next_open(ret_next, sig_final, idx)
+        equity = metrics["equity"]
 
     return {
         "data": data,
+        "used": used,
         "idx": idx,
         "sig_final": sig_final,
         "metrics": metrics,
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+ANALYTICS — serie mobili e tabelle dei rendimenti per le dashboard
+Sulle stesse grandezze di eval_next_open (ritorno next-open nei giorni con
+segnale) calcola su tutta la storia:
+  - per finestra (1y = 252 sedute, 3y = 756): Sharpe, Sortino, win rate,
+    numero di trade, ritorno e drawdown dal massimo della finestra
+  - drawdown dal massimo storico
+  - rendimenti composti per anno e per mese
+
+Tutto in O(n) per finestra: le metriche sui trade sono differenze di
+somme cumulate (stesse formule di batch_eval.eval_rows sulla finestra),
+il massimo della finestra viene da indicators.rolling_max. Le serie
+valgono None finché la finestra non è piena.
+
+Su disco (`write_report`) le serie sono divise in blocchi annuali come la
+curva equity (equity_export): analytics.json è l'indice con le tabelle per
+anno e mese, analytics/<anno>.json ogni blocco, con date come giorni tra
+una data e la precedente e valori quantizzati (scala 10^-DECIMALS, trade
+interi) codificati a delta. I blocchi degli anni passati non cambiano e
+OutputWriter non li riscrive: ogni giorno cambiano indice e anno corrente.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from indicators import rolling_max
+from output_writer import OutputWriter
+
+WINDOWS = {"1y": 252, "3y": 756}
+DECIMALS = 4
+FORMAT = "analytics-chunks-v1"
+
+
+def _window_sum(c: np.ndarray, w: int) -> np.ndarray:
+    """Somme su finestre di `w` da somme cumulate con zero iniziale; NaN prima di w-1."""
+    out = np.full(len(c) - 1, np.nan)
+    if len(out) >= w:
+        out[w - 1:] = c[w:] - c[:-w]
+    return out
+
+
+def rolling_metrics(r: np.ndarray, mask: np.ndarray, equity: np.ndarray, w: int) -> dict:
+    """Metriche di eval_rows sulle ultime `w` sedute, per ogni data."""
+    neg = mask & (r < 0)
+    sums = {
+        "n": mask, "s1": np.where(mask, r, 0.0), "s2": np.where(mask, r * r, 0.0),
+        "wins": mask & (r > 0), "nneg": neg,
+        "neg1": np.where(neg, r, 0.0), "neg2": np.where(neg, r * r, 0.0),
+    }
+    s = {k: _window_sum(np.concatenate([[0.0], np.cumsum(v, dtype=float)]), w)
+         for k, v in sums.items()}
+    n, nneg = s["n"], s["nneg"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = s["s1"] / n
+        std = np.sqrt(np.maximum(s["s2"] / n - mean ** 2, 0.0))
+        mean_neg = s["neg1"] / nneg
+        std_neg = np.sqrt(np.maximum(s["neg2"] / nneg - mean_neg ** 2, 0.0))
+        sharpe = np.where(std > 0, mean / std * np.sqrt(252), 0.0)
+        sortino = np.where(nneg > 0, mean / (std_neg + 1e-9) * np.sqrt(252), 0.0)
+        ret = np.full(len(r), np.nan)
+        ret[w:] = equity[w:] / equity[:-w] - 1.0
+        dd = equity / rolling_max(equity, w) - 1.0
+    has = n > 0
+    out = {
+        "n_trades": n,
+        "winrate_%": np.where(has, s["wins"] / n * 100.0, 0.0),
+        "sharpe": np.where(has, sharpe, 0.0),
+        "sortino": np.where(has, sortino, 0.0),
+        "ret_%": ret * 100.0,
+        "dd_%": dd * 100.0,
+    }
+    for k in ("winrate_%", "sharpe", "sortino"):
+        out[k][np.isnan(n)] = np.nan  # finestra non ancora piena
+    return out
+
+
+def period_returns(equity: np.ndarray, idx: pd.DatetimeIndex) -> dict:
+    """Rendimenti composti % per anno e per mese (12 valori, None senza dati)."""
+    if not len(idx):
+        return {"years": {}, "months": {}}
+    def by(code):
+        ends = np.append(np.flatnonzero(np.diff(code)), len(code) - 1)
+        prev = np.append(1.0, equity[ends[:-1]])
+        return code[ends], (equity[ends] / prev - 1.0) * 100.0
+
+    years, yret = by(idx.year.to_numpy())
+    months, mret = by(idx.year.to_numpy() * 12 + idx.month.to_numpy() - 1)
+    table = {str(y): [None] * 12 for y in years}
+    for m, v in zip(months, mret):
+        table[str(m // 12)][m % 12] = round(float(v), DECIMALS)
+    return {"years": {str(y): round(float(v), DECIMALS) for y, v in zip(years, yret)},
+            "months": table}
+
+
+def _json(x: np.ndarray, decimals: int | None = DECIMALS) -> list:
+    """Lista per JSON: NaN -> None, arrotondata (interi se decimals è None)."""
+    x = np.asarray(x, dtype=float)
+    if decimals is None:
+        return [None if np.isnan(v) else int(v) for v in x.tolist()]
+    return [None if np.isnan(v) else v for v in np.round(x, decimals).tolist()]
+
+
+def report(ret_next, signal, idx: pd.DatetimeIndex, windows: dict = WINDOWS) -> dict:
+    """
+    Serie e tabelle per la dashboard (JSON) con gli input di eval_next_open:
+    ret_next[t] = Open[t+1] / Close[t] - 1, signal[t] booleano.
+    """
+    r = np.asarray(ret_next, dtype=float)
+    valid = ~np.isnan(r)
+    r = np.where(valid, r, 0.0)
+    mask = np.asarray(pd.Series(signal).fillna(False), dtype=bool) & valid
+    equity = np.cumprod(1.0 + np.where(mask, r, 0.0))
+    drawdown = equity / np.maximum.accumulate(equity) - 1.0 if len(equity) else equity
+
+    out = {
+        "dates": [str(d.date()) for d in idx],
+        "drawdown_%": _json(drawdown * 100.0),
+        "rolling": {},
+        **period_returns(equity, idx),
+    }
+    for name, w in windows.items():
+        series = rolling_metrics(r, mask, equity, w)
+        out["rolling"][name] = {"window": w, **{k: _json(v, None if k == "n_trades" else DECIMALS)
+                                                for k, v in series.items()}}
+    return out
+
+
+# ================= BLOCCHI ANNUALI =================
+def encode_series(x, scale: float) -> dict:
+    """
+    Serie quantizzata round(x / scale) a delta; i None iniziali (finestra
+    non ancora piena) diventano "skip", gli unici ammessi.
+    """
+    x = np.asarray([np.nan if v is None else v for v in x], dtype=float)
+    valid = ~np.isnan(x)
+    skip = int(np.argmax(valid)) if valid.any() else len(x)
+    if not valid[skip:].all():
+        raise ValueError("Valori mancanti dopo l'inizio della serie")
+    q = np.rint(x[skip:] / scale).astype(np.int64)
+    return {"skip": skip, "q": np.diff(q, prepend=0).tolist()}
+
+
+def decode_series(enc: dict, scale: float) -> list:
+    q = np.cumsum(np.asarray(enc["q"], dtype=np.int64))
+    values = (q if scale == 1.0 else q * scale).tolist()
+    return [None] * enc["skip"] + values
+
+
+def _scale(key: str) -> float:
+    return 1.0 if key == "n_trades" else 10.0 ** -DECIMALS
+
+
+def write_report(rep: dict, path: str, writer: OutputWriter | None = None) -> None:
+    """
+    Scrive il report di `report` come indice `path` + blocchi annuali nella
+    cartella omonima (analytics.json -> analytics/<anno>.json).
+    """
+    writer = writer or OutputWriter(manifest_path=None)
+    root, name = os.path.split(path)
+    folder = os.path.splitext(name)[0]
+    dates = pd.DatetimeIndex(rep["dates"])
+    chunks = []
+    if len(dates):
+        ends = np.append(np.flatnonzero(np.diff(dates.year)) + 1, len(dates))
+        for a, b in zip(np.append(0, ends[:-1]), ends):
+            year = int(dates[a].year)
+            days = np.diff(dates[a:b].values.astype("datetime64[D]").astype(np.int64))
+            chunk = {
+                "start": str(dates[a].date()),
+                "days": days.tolist(),
+                "drawdown_%": encode_series(rep["drawdown_%"][a:b], _scale("drawdown_%")),
+                "rolling": {w: {k: encode_series(v[a:b], _scale(k))
+                                for k, v in series.items() if k != "window"}
+                            for w, series in rep["rolling"].items()},
+            }
+            file = f"{folder}/{year}.json"
+            writer.write_json(os.path.join(root, file), chunk, separators=(",", ":"))
+            chunks.append({"year": year, "file": file, "n": int(b - a),
+                           "first": str(dates[a].date()), "last": str(dates[b - 1].date())})
+    writer.write_json(path, {
+        "format": FORMAT,
+        "scale": 10.0 ** -DECIMALS,
+        "start": rep["dates"][0] if len(dates) else None,
+        "end": rep["dates"][-1] if len(dates) else None,
+        "windows": {w: series["window"] for w, series in rep["rolling"].items()},
+        "years": rep["years"],
+        "months": rep["months"],
+        "chunks": chunks,
+    }, separators=(",", ":"))
+
+
+def read_report(path: str) -> dict | None:
+    """Report ricostruito da indice e blocchi (valori alla scala di quantizzazione)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            idx = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(idx, dict) or idx.get("format") != FORMAT:
+        return None
+    root = os.path.dirname(path)
+    out = {"dates": [], "drawdown_%": [], "years": idx["years"], "months": idx["months"],
+           "rolling": {w: {"window": n} for w, n in idx["windows"].items()}}
+    for c in idx["chunks"]:
+        with open(os.path.join(root, c["file"]), encoding="utf-8") as f:
+            chunk = json.load(f)
+        offsets = np.concatenate([[0], np.cumsum(chunk["days"], dtype=np.int64)])
+        out["dates"] += [str(d) for d in np.datetime64(chunk["start"], "D") + offsets]
+        out["drawdown_%"] += decode_series(chunk["drawdown_%"], _scale("drawdown_%"))
+        for w, series in chunk["rolling"].items():
+            for k, enc in series.items():
+                out["rolling"][w].setdefault(k, []).extend(decode_series(enc, _scale(k)))
+    return out
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+BATCH EVAL — metriche di eval_next_open su molte strategie in un colpo
+Input: matrice booleana dei segnali (date × strategie) e un unico vettore
+ret_next (Open[t+1] / Close[t] - 1). Output: un array per metrica.
+
+Le somme per strategia (trade, media, varianza, downside, pendenza del
+log-equity) sono prodotti matrice-vettore; solo equity e drawdown
+richiedono un passaggio completo sulla matrice. Le colonne sono elaborate
+a blocchi di CHUNK per limitare la memoria.
+"""
+
+import numpy as np
+import pandas as pd
+
+CHUNK = 4096         # strategie per blocco
+POINTS_SIZE = 40000.0  # size future indicativo per avg_trade_pts
+MIN_SLOPE_POINTS = 10
+
+METRICS = [
+    "n_trades", "winrate_%", "avg_trade_%", "avg_trade_pts", "total_ret_%",
+    "sharpe", "sortino", "max_dd_%", "slope", "cagr_%",
+]
+
+
+def span_years(idx: pd.DatetimeIndex) -> float:
+    """Anni solari coperti da idx (base per il CAGR)."""
+    if len(idx) == 0:
+        return 0.0
+    n_days = (idx[-1] - idx[0]).days
+    return n_days / 365.25 if n_days > 0 else 0.0
+
+
+def drawdown_rows(equity: np.ndarray) -> np.ndarray:
+    """Max drawdown % (valore <= 0) per riga di una matrice equity (righe × date)."""
+    if equity.shape[1] == 0:
+        return np.zeros(len(equity))
+    return (equity / np.maximum.accumulate(equity, axis=1) - 1.0).min(axis=1) * 100.0
+
+
+def cagr_rows(final: np.ndarray, years: float) -> np.ndarray:
+    """CAGR % dall'equity finale (base 1); 0 se years <= 0 o equity finale <= 0."""
+    final = np.asarray(final, dtype=float)
+    if years <= 0:
+        return np.zeros_like(final)
+    with np.errstate(invalid="ignore"):
+        return np.where(final > 0, (final ** (1.0 / years) - 1.0) * 100.0, 0.0)
+
+
+def _slope_rows(equity: np.ndarray) -> np.ndarray:
+    """
+    Pendenza OLS di log(equity) sull'indice, in forma chiusa per riga.
+    Come slope_log_equity: i punti con equity <= 0 sono scartati e
+    l'asse x è rinumerato sui punti rimasti.
+    """
+    n_rows, t = equity.shape
+    out = np.zeros(n_rows)
+    if t < MIN_SLOPE_POINTS:
+        return out
+    pos = equity > 0
+    clean = pos.all(axis=1)
+    if clean.any():
+        x = np.arange(t, dtype=float)
+        xc = x - x.mean()
+        out[clean] = np.log(equity[clean]) @ xc / (xc @ xc)
+    for i in np.flatnonzero(~clean):
+        y = np.log(equity[i, pos[i]])
+        if len(y) >= MIN_SLOPE_POINTS:
+            xc = np.arange(len(y), dtype=float)
+            xc -= xc.mean()
+            out[i] = y @ xc / (xc @ xc)
+    return out
+
+
+def eval_rows(ret_next: np.ndarray, sig: np.ndarray, years: float,
+              with_slope: bool = True, with_equity: bool = False) -> dict:
+    """
+    Metriche per ogni riga di `sig` (strategie × date, layout contiguo
+    lungo il tempo). Se `with_equity` aggiunge "equity" e "daily_returns".
+    """
+    valid = ~np.isnan(ret_next)
+    r = np.where(valid, ret_next, 0.0)
+    maskf = (sig & valid).astype(float)
+    n = maskf.sum(axis=1)
+    nz = np.maximum(n, 1.0)
+
+    mean = maskf @ r / nz
+    std = np.sqrt(np.maximum(maskf @ (r * r) / nz - mean ** 2, 0.0))
+    neg = r < 0
+    n_neg = maskf @ neg
+    nnz = np.maximum(n_neg, 1.0)
+    mean_neg = maskf @ np.where(neg, r, 0.0) / nnz
+    std_neg = np.sqrt(np.maximum(maskf @ np.where(neg, r * r, 0.0) / nnz - mean_neg ** 2, 0.0))
+    wins = maskf @ (r > 0)
+
+    daily = maskf * r
+    equity = np.cumprod(1.0 + daily, axis=1)
+    final = equity[:, -1] if equity.shape[1] else np.ones(len(n))
+    dd = drawdown_rows(equity)
+
+    sharpe = np.where(std > 0, mean / np.where(std > 0, std, 1.0) * np.sqrt(252), 0.0)
+    sortino = np.where(n_neg > 0, mean / (std_neg + 1e-9) * np.sqrt(252), 0.0)
+    cagr = cagr_rows(final, years)
+    slope = _slope_rows(equity) if with_slope else np.zeros(len(n))
+
+    has = n > 0
+    out = {
+        "n_trades": n.astype(int),
+        "winrate_%": np.where(has, wins / nz * 100.0, 0.0),
+        "avg_trade_%": np.where(has, mean * 100.0, 0.0),
+        "avg_trade_pts": np.where(has, mean * POINTS_SIZE, 0.0),
+        "total_ret_%": np.where(has, (final - 1.0) * 100.0, 0.0),
+        "sharpe": np.where(has, sharpe, 0.0),
+        "sortino": np.where(has, sortino, 0.0),
+        "max_dd_%": np.where(has, dd, 0.0),
+        "slope": np.where(has, slope, 0.0),
+        "cagr_%": np.where(has, cagr, 0.0),
+    }
+    if with_equity:
+        out["equity"] = equity
+        out["daily_returns"] = daily
+    return out
+
+
+def eval_next_open_batch(ret_next,
+                         signals,
+                         idx: pd.DatetimeIndex,
+                         chunk: int = CHUNK,
+                         with_equity: bool = False) -> dict:
+    """
+    Valuta tutte le colonne di `signals` (date × strategie, bool; NaN = False)
+    contro `ret_next`. Restituisce {metrica: array (n_strategie,)}; con
+    `with_equity` anche "equity" e "daily_returns" come matrici date × strategie.
+    """
+    r = np.asarray(ret_next, dtype=float)
+    sig = np.asarray(signals)
+    if sig.ndim == 1:
+        sig = sig[:, None]
+    if sig.dtype != bool:
+        sig = np.nan_to_num(sig.astype(float), nan=0.0) != 0
+    years = span_years(idx)
+
+    parts = []
+    for a in range(0, sig.shape[1], chunk):
+        rows = np.ascontiguousarray(sig[:, a:a + chunk].T)
+        parts.append(eval_rows(r, rows, years, with_equity=with_equity))
+    if not parts:
+        parts.append(eval_rows(r, np.zeros((0, len(r)), bool), years, with_equity=with_equity))
+
+    out = {k: np.concatenate([p[k] for p in parts]) for k in METRICS}
+    if with_equity:
+        out["equity"] = np.concatenate([p["equity"] for p in parts]).T
+        out["daily_returns"] = np.concatenate([p["daily_returns"] for p in parts]).T
+    return out
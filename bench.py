@@ -0,0 +1,603 @@
+# -*- coding: utf-8 -*-
+"""
+BENCH — benchmark offline delle pipeline su mercato sintetico
+Sostituisce lo store prezzi con synthetic_market (nessuna rete) e misura
+ogni stadio dei due modelli:
+  volumi: store_cold, load_join, indicators, signal, evaluation, analytics, state_replay,
+          export, screen (tutti i titoli .MI del mercato, anche --extra-tickers)
+  quant : load, signal, evaluation, export
+  pipeline: load (download unico + matrice allineata per entrambe le strategie)
+Feature store in una cartella temporanea, già popolato: indicators e dataset lo rileggono.
+Per ogni stadio: tempo minimo su --repeat ripetizioni e picco di memoria
+(tracemalloc, in un passaggio separato per non falsare i tempi).
+
+  python bench.py                  # confronta con bench_baseline.json se presente
+  python bench.py --save-baseline  # registra la baseline
+  python bench.py --check          # verifica anche le equivalenze tra implementazioni
+  python bench.py --startup        # solo tempi di import (python -X importtime)
+
+Exit code 1 se uno stadio supera la baseline oltre le tolleranze.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import feature_store
+import intraday
+import markets
+import price_store
+import synthetic_market
+from indicators import rolling_max
+from Nearer_My_God_to_Thee_2 import (METRICS, build_signal, eval_next_open, fetch_data,
+                                     model_results, volume_conditions)
+from equity_calculator import compute_equity_from_daily_returns, compute_metrics_from_equity
+from equity_export import SCALE, read_equity, write_equity
+from model_state import STATE_RTOL, ModelState, check_replay, split_confirmed
+from output_writer import OutputWriter
+import pipeline
+import quant_superior_live as quant
+import replay
+import screen
+import update_site
+
+BASELINE_FILE = "bench_baseline.json"
+TIME_TOLERANCE = 1.5   # regressione se tempo > baseline * 1.5
+MEM_TOLERANCE = 1.2    # regressione se picco memoria > baseline * 1.2
+MIN_TIME_S = 0.005     # sotto questa soglia il rumore domina: tempo non confrontato
+COMPACT_RTOL = 1e-3    # scarto relativo ammesso sulle metriche in modalità compatta
+
+# Moduli importati all'avvio dal job giornaliero e da chi usa il modello come libreria
+STARTUP_MODULES = ["pipeline", "update_site", "Nearer_My_God_to_Thee_2", "quant_superior_live", "batch_eval"]
+# Dipendenze che devono caricarsi solo quando servono davvero (download, grafici)
+LAZY_MODULES = ["yfinance", "requests", "matplotlib", "plotly"]
+
+
+# ================= STADI =================
+def _store_cold(ctx):
+    # Store nuovo e vuoto: misura anche la scrittura della cache mmap
+    price_store.set_default_store(price_store.PriceStore(tempfile.mkdtemp(dir=ctx["tmp"]), ctx["market"]))
+    fetch_data()
+    price_store.set_default_store(ctx["store"])
+
+
+def _load_join(ctx):
+    data, used = fetch_data()
+    ctx["data"] = data.dropna(subset=["FTSE_Close"]).copy()
+    ctx["used"] = used
+
+
+def _load_join_compact(ctx):
+    data, _ = fetch_data(compact=True)
+    ctx["data_compact"] = data
+
+
+def _indicators(ctx):
+    ctx["conds"] = volume_conditions(ctx["data"], ctx["used"])
+
+
+def _signal(ctx):
+    ctx["sig"] = build_signal(ctx["data"], ctx["conds"])
+
+
+def _evaluation(ctx):
+    data = ctx["data"]
+    ret_next = data["FTSE_Open"].shift(-1) / data["FTSE_Close"] - 1.0
+    m = eval_next_open(ret_next, ctx["sig"], data.index)
+    eq = compute_equity_from_daily_returns(m["daily_returns"])
+    eq.index = data.index
+    ctx["metrics"] = m
+    ctx["equity"] = eq
+    ctx["eq_metrics"] = compute_metrics_from_equity(eq)
+
+
+def _analytics(ctx):
+    data = ctx["data"]
+    ret_next = data["FTSE_Open"].shift(-1) / data["FTSE_Close"] - 1.0
+    json.dumps(analytics.report(ret_next, ctx["sig"], data.index), separators=(",", ":"))
+
+
+def _state_replay(ctx):
+    ctx["state"] = ModelState.replay(ctx["data"], ctx["used"])
+
+
+def _export(ctx):
+    root = tempfile.mkdtemp(dir=ctx["tmp"])
+    writer = OutputWriter(manifest_path=None)
+    write_equity(ctx["equity"], root=root, writer=writer)
+    ctx["state"].save(os.path.join(root, "model_state.json"), writer=writer)
+
+
+def _screen(ctx):
+    screen.screen(ctx["udata"], ctx["unames"])
+
+
+def _q_load(ctx):
+    ctx["qmarket"] = pipeline.load_market([ctx["top3"]])
+
+
+def _q_signal(ctx):
+    ctx["qsig"] = ctx["top3"].signal(ctx["qmarket"])
+
+
+def _q_evaluation(ctx):
+    ctx["qres"] = pipeline.evaluate(ctx["qmarket"], ctx["qsig"], ctx["top3"].start)
+
+
+def _q_export(ctx):
+    metrics = ctx["top3"].metrics(ctx["qmarket"], ctx["qsig"], ctx["qres"])
+    json.dumps(metrics, ensure_ascii=False, indent=2)
+
+
+def _p_load(ctx):
+    ctx["pmarket"] = pipeline.load_market(pipeline.get_strategies())
+
+
+STAGES = [
+    ("volumi.store_cold", _store_cold),
+    ("volumi.load_join", _load_join),
+    ("volumi.load_join_compact", _load_join_compact),
+    ("volumi.indicators", _indicators),
+    ("volumi.signal", _signal),
+    ("volumi.evaluation", _evaluation),
+    ("volumi.analytics", _analytics),
+    ("volumi.state_replay", _state_replay),
+    ("volumi.export", _export),
+    ("volumi.screen", _screen),
+    ("quant.load", _q_load),
+    ("quant.signal", _q_signal),
+    ("quant.evaluation", _q_evaluation),
+    ("quant.export", _q_export),
+    ("pipeline.load", _p_load),
+]
+
+
+# ================= MISURA =================
+def _context(market, tmp):
+    store = price_store.PriceStore(os.path.join(tmp, "prices"), market)
+    price_store.set_default_store(store)
+    feature_store.set_default_features(feature_store.FeatureStore(os.path.join(tmp, "features")))
+    # Warm-up delle cache: load_join e indicators misurano la lettura dagli store già popolati
+    fetch_data()
+    pipeline.load_market(pipeline.get_strategies())
+    universe = {t.split(".")[0]: t for t in market.frames
+                if t.endswith(".MI") and t != "FTSEMIB.MI"}
+    um = pipeline.load_market([screen.UniverseStrategy(universe, {})])
+    return {"market": market, "store": store, "tmp": tmp, "top3": quant.Top3Strategy(),
+            "udata": um.data, "unames": [n for n in universe if n in um.available]}
+
+
+def measure(market, repeat: int = 3) -> dict:
+    """Tempo minimo e picco di memoria per stadio."""
+    tmp = tempfile.mkdtemp(prefix="ftsemib_bench_")
+    try:
+        ctx = _context(market, tmp)
+        results = {}
+        for name, fn in STAGES:
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                fn(ctx)
+                best = min(best, time.perf_counter() - t0)
+            results[name] = {"time_s": best}
+
+        # Passaggio separato per la memoria (tracemalloc rallenta l'esecuzione)
+        ctx = _context(market, tmp)
+        for name, fn in STAGES:
+            tracemalloc.start()
+            fn(ctx)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name]["peak_mb"] = peak / 2**20
+        return results
+    finally:
+        price_store.set_default_store(None)
+        feature_store.set_default_features(None)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """Elenco delle regressioni rispetto alla baseline."""
+    out = []
+    for name, r in results.items():
+        b = baseline.get(name)
+        if b is None:
+            continue
+        if r["time_s"] >= MIN_TIME_S and r["time_s"] > b["time_s"] * TIME_TOLERANCE:
+            out.append(f"{name}: tempo {r['time_s']:.4f}s vs {b['time_s']:.4f}s")
+        if r["peak_mb"] > b["peak_mb"] * MEM_TOLERANCE and r["peak_mb"] - b["peak_mb"] > 1.0:
+            out.append(f"{name}: memoria {r['peak_mb']:.1f}MB vs {b['peak_mb']:.1f}MB")
+    return out
+
+
+# ================= AVVIO =================
+def import_time(module: str, repeat: int = 3) -> dict:
+    """
+    Tempo di import di `module` in un interprete nuovo (-X importtime,
+    minimo su `repeat`), i 5 moduli più pesanti e le dipendenze lazy caricate.
+    """
+    best, rows = float("inf"), []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                              capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+        # "import time: self [us] | cumulative | nome" (+2 spazi di rientro per livello);
+        # i sotto-moduli precedono il modulo che li importa
+        lines = [l.split("|") for l in proc.stderr.splitlines() if l.startswith("import time:")]
+        cur = [(int(c), n.rstrip()) for _, c, n in lines[1:]]
+        i = next(i for i, (_, n) in enumerate(cur) if n.strip() == module)
+        if cur[i][0] / 1e6 < best:
+            best, rows = cur[i][0] / 1e6, cur[:i + 1]
+    children = []
+    for c, n in reversed(rows[:-1]):
+        depth = (len(n) - len(n.lstrip()) - 1) // 2
+        if depth == 0:
+            break
+        if depth == 1:
+            children.append((c, n.strip()))
+    return {
+        "time_s": best,
+        "heaviest": [n for _, n in sorted(children, reverse=True)[:5]],
+        "lazy_loaded": [m for m in LAZY_MODULES if any(n.strip() == m for _, n in rows)],
+    }
+
+
+def startup(repeat: int, baseline: dict) -> tuple[dict, list]:
+    """Tempi di import dei moduli del job; restituisce i problemi trovati."""
+    problems, results = [], {}
+    print(f"\n{'modulo':<26}{'import s':>10}{'base s':>10}  più pesanti")
+    for m in STARTUP_MODULES:
+        r = results[m] = import_time(m, repeat)
+        b = baseline.get(m)
+        bt = f"{b['time_s']:.3f}" if b else "-"
+        print(f"{m:<26}{r['time_s']:>10.3f}{bt:>10}  {', '.join(r['heaviest'])}")
+        if r["lazy_loaded"]:
+            problems.append(f"{m}: importa all'avvio {', '.join(r['lazy_loaded'])}")
+        if b and r["time_s"] > b["time_s"] * TIME_TOLERANCE:
+            problems.append(f"{m}: import {r['time_s']:.3f}s vs {b['time_s']:.3f}s")
+    return results, problems
+
+
+# ================= EQUIVALENZE =================
+def top3_rowwise(df: pd.DataFrame) -> np.ndarray:
+    """Segnale Top3 con le regole riga per riga (match_top3 and filter_s)."""
+    return df.apply(lambda r: quant.match_top3(r) and quant.filter_s(r), axis=1).to_numpy(bool)
+
+
+def check_top3_rules(df: pd.DataFrame) -> bool:
+    """
+    signal_mask (regole vettoriali) == versione riga per riga sul dataset Top3
+    e sulle sue varianti: SPY e/o VIX assenti, colonne tutte NaN, NaN sparsi.
+    """
+    rng = np.random.default_rng(0)
+    partial = df.copy()
+    for c in ("gap_open", "spy_ret", "vix_ret", "vol_z"):
+        partial.loc[rng.random(len(df)) < 0.3, c] = np.nan
+    spy, vix = ["SPY_Close", "spy_ret"], ["VIX_Close", "vix_ret"]
+    cases = {
+        "completo": df,
+        "senza SPY": df.drop(columns=spy),
+        "senza VIX": df.drop(columns=vix),
+        "senza SPY e VIX": df.drop(columns=spy + vix),
+        "SPY tutto NaN": df.assign(spy_ret=np.nan),
+        "VIX tutto NaN": df.assign(vix_ret=np.nan),
+        "SPY e VIX tutti NaN": df.assign(spy_ret=np.nan, vix_ret=np.nan),
+        "NaN sparsi": partial,
+    }
+    ok = True
+    for name, d in cases.items():
+        same = np.array_equal(quant.signal_mask(d), top3_rowwise(d))
+        if not same:
+            print(f"[WARN] Top3 vettoriale != riga per riga: {name}")
+        ok = ok and same
+    return ok
+
+
+def check_daily_job(tmp: str, days: int = 6) -> bool:
+    """
+    Job giornaliero del modello volumi su un mercato sintetico con la
+    chiusura ^GSPC provvisoria all'ora del job (rivista il giorno dopo):
+    dopo la prima ricostruzione ogni esecuzione deve restare incrementale,
+    signals.json deve essere quello del percorso batch completo
+    (pipeline.evaluate = eval_next_open), lo stato coincidere col batch
+    entro STATE_RTOL (e fallire se se ne discosta), equity.json entro SCALE.
+    """
+    market = synthetic_market.SyntheticMarket(years=6, provisional=("^GSPC",))
+    price_store.set_default_store(price_store.PriceStore(os.path.join(tmp, "prices_job"), market))
+    out = os.path.join(tmp, "job")
+    os.makedirs(out)
+    cwd = os.getcwd()
+    os.chdir(out)  # i file del sito si scrivono nella cartella corrente
+    try:
+        vol = pipeline.get_strategies(["volumi"])[0]
+        incremental = []
+        for i, day in enumerate(market.milan[-days:]):
+            market.truncate(day)
+            pm = pipeline.load_market([vol])
+            sig, used = vol.signal(pm), vol.used(pm)
+            metrics = pipeline.evaluate(pm, sig, vol.start)
+            writer = OutputWriter(manifest_path=None)
+            if i == 0:
+                update_site.full_update(writer, {"data": pm.data, "used": used, "idx": pm.idx,
+                                                 "sig_final": sig, "metrics": metrics})
+            else:
+                incremental.append(update_site.incremental_update(writer, pm.data, used,
+                                                                  bool(sig.iloc[-1]), metrics))
+        with open(update_site.SIGNALS_FILE, encoding="utf-8") as f:
+            published = json.load(f)
+        batch = update_site.batch_metrics(metrics, pm.idx)
+        tail = split_confirmed(pm.data)[1]
+        live, _ = ModelState.load().live(tail)
+        live.verify(bool(sig.iloc[-1]), batch)
+        # Uno stato che si discosta oltre STATE_RTOL deve far fallire il job
+        drifted = ModelState.load()
+        drifted.equity *= 1.0 + 1e-9
+        try:
+            drifted.live(tail)[0].verify(bool(sig.iloc[-1]), batch)
+            caught = False
+        except RuntimeError:
+            caught = True
+        equity = read_equity(".")
+        ref = compute_equity_from_daily_returns(metrics["daily_returns"])
+    finally:
+        os.chdir(cwd)
+    return (all(incremental) and caught
+            and published == update_site.signal_payload(pm.idx[-1], sig.iloc[-1], batch, batch)
+            and equity.index.equals(pm.idx)
+            and np.abs(equity.to_numpy() - ref.to_numpy()).max() <= SCALE)
+
+
+def check(market) -> bool:
+    """Confronta implementazioni alternative sugli stessi dati sintetici."""
+    tmp = tempfile.mkdtemp(prefix="ftsemib_check_")
+    ok = True
+    try:
+        ctx = _context(market, tmp)
+        data, used = fetch_data()
+        data = data.dropna(subset=["FTSE_Close"]).copy()
+        sig = build_signal(data, volume_conditions(data, used))
+
+        state = ModelState.replay(data, used)
+        res = {
+            "segnale streaming == batch": state.signal == bool(sig.iloc[-1]),
+            "replay incrementale == completo": check_replay(data, used, len(data) * 2 // 3),
+            f"job giornaliero incrementale == batch entro {STATE_RTOL:g}": check_daily_job(tmp),
+        }
+        price_store.set_default_store(ctx["store"])
+
+        # Modalità compatta: stesso segnale, metriche entro COMPACT_RTOL
+        cdata, _ = fetch_data(compact=True)
+        cdata = cdata.dropna(subset=["FTSE_Close"]).copy()
+        csig = build_signal(cdata, volume_conditions(cdata, used))
+        ret = data["FTSE_Open"].shift(-1) / data["FTSE_Close"] - 1.0
+        cret = cdata["FTSE_Open"].astype(float).shift(-1) / cdata["FTSE_Close"].astype(float) - 1.0
+        m, cm = eval_next_open(ret, sig, data.index), eval_next_open(cret, csig, cdata.index)
+        err = max(abs(cm[k] - m[k]) / max(abs(m[k]), 1e-12) for k in METRICS)
+        mb = data.memory_usage(index=False).sum() / 2**20
+        cmb = cdata.memory_usage(index=False).sum() / 2**20
+        print(f"[INFO] Compatta: {cmb:.2f}MB vs {mb:.2f}MB, scarto relativo max metriche {err:.1e}")
+        res["compatta: stesso segnale"] = bool(csig.equals(sig))
+        res[f"compatta: metriche entro {COMPACT_RTOL:g}"] = err <= COMPACT_RTOL
+
+        # Pipeline unica: stessi segnali e metriche dei due script separati
+        vol, top3 = pipeline.get_strategies()
+        pm = pipeline.load_market([vol, top3])
+        psig = vol.signal(pm)
+        pmet = pipeline.evaluate(pm, psig, vol.start)
+        res["pipeline volumi == run_model"] = bool(psig.equals(sig)) and all(
+            pmet[k] == m[k] for k in METRICS)
+        # Top3: segnale ed export della pipeline == regole riga per riga
+        qdf = top3.dataset(pm)
+        qsig = top3.signal(pm)
+        rowwise = top3_rowwise(qdf)
+        res["quant signal_mask == riga per riga (SPY/VIX assenti, NaN)"] = check_top3_rules(qdf)
+        res["pipeline quant == riga per riga"] = bool(
+            np.array_equal(qsig.loc[qdf.index].to_numpy(), rowwise)
+            and not qsig.drop(qdf.index).any())
+        perf = top3.metrics(pm, qsig, pipeline.evaluate(pm, qsig, top3.start))["performance"]
+        r = pm.ret_next.loc[qdf.index].to_numpy()[rowwise]
+        r = r[~np.isnan(r)]
+        res["quant export == trade riga per riga"] = bool(
+            len(r) and perf["total_trades"] == len(r) and perf["winning_trades"] == (r > 0).sum()
+            and np.isclose(perf["win_rate"], (r > 0).mean() * 100)
+            and np.isclose(perf["total_return"], r.sum() * 100))
+
+        # fetch_many: risposta vuota -> fallback subito, eccezione -> retry
+        calls = []
+
+        def loader(t):
+            calls.append(t)
+            if t == "ERR" and calls.count(t) == 1:
+                raise OSError("rete")
+            return None if t == "VUOTO" else data.iloc[:1]
+        got = price_store.fetch_many({"a": ["VUOTO", "OK"], "b": ["ERR"]}, loader,
+                                     backoff=0.0, with_ticker=True)
+        res["fetch_many: retry solo sugli errori"] = (
+            calls.count("VUOTO") == 1 and calls.count("ERR") == 2
+            and got["a"][0] == "OK" and got["b"][0] == "ERR")
+
+        # Download multi-mercato: IG.MI primario nel FTSEMIB e fallback in un altro mercato
+        shared = {"FTSEMIB": markets.MARKETS["FTSEMIB"],
+                  "ALTRO": {"index": "FTSEMIB.MI", "filter": "^GSPC",
+                            "universe": {"GAS": ["SRG.MI", "IG.MI"], "AUTO": ["STLAM.MI", "STLA.MI"]}}}
+        got = markets.download(shared)
+        res["markets: ticker condivisi risolti per catena"] = (
+            got["FTSEMIB"]["ITALGAS"] == got["ALTRO"]["GAS"] == "IG.MI"
+            and got["FTSEMIB"]["STELLANTIS"] == got["ALTRO"]["AUTO"] == "STLA.MI")
+
+        # Replay barra per barra (niente look-ahead): ultimo anno
+        events = list(replay.replay(pm.data, [vol, top3], last=250))
+        rep = replay.verify(pm.data, [vol, top3], events)
+        res["replay == segnale batch"] = all(r["mismatches"] == 0 for r in rep.values())
+
+        # Feature store: barre accodate (solo la coda ricalcolata) == ricalcolo completo
+        fstore = feature_store.FeatureStore(os.path.join(tmp, "features_check"))
+        feature_store.set_default_features(fstore)
+        volume_conditions(data.iloc[:-20], used)
+        cached = volume_conditions(data, used)
+        feature_store.set_default_features(feature_store.FeatureStore(enabled=False))
+        fresh = volume_conditions(data, used)
+        res["feature store (coda) == ricalcolo"] = fstore.stats["tail"] > 0 and all(
+            np.array_equal(cached[k].to_numpy(), fresh[k].to_numpy()) for k in fresh)
+
+        # Fill intraday (barre al minuto sintetiche): VWAP delle finestre = Close / Open daily
+        last = data.iloc[-500:]
+        ts, values = synthetic_market.synthetic_intraday(
+            last[["FTSE_Open", "FTSE_Close"]].rename(columns=lambda c: c[5:]).astype(float))
+        istore = intraday.IntradayStore(os.path.join(tmp, "intraday"))
+        istore.append("FTSEMIB.MI", ts, values)
+        fills = [intraday.session_vwap(istore, "FTSEMIB.MI", w, chunk_rows=100_000)
+                 for w in (intraday.ENTRY_WINDOW, intraday.EXIT_WINDOW)]
+        # Ingest CSV a blocchi: orari duplicati una volta sola (l'ultima riga),
+        # righe fuori ordine tra blocchi scartate, archivio strettamente crescente
+        rows = pd.DataFrame(values[:1000], columns=price_store.COLUMNS,
+                            index=pd.DatetimeIndex(ts[:1000]).rename("Datetime"))
+        csv = pd.concat([rows.iloc[:15], rows.iloc[[10]] * 2, rows.iloc[15:500], rows.iloc[510:],
+                         rows.iloc[500:510]])
+        csv.to_csv(os.path.join(tmp, "intraday.csv"))
+        cstore = intraday.IntradayStore(os.path.join(tmp, "intraday_csv"))
+        n = cstore.ingest_csv("X", os.path.join(tmp, "intraday.csv"), chunk_rows=200)
+        cts, cvals = cstore.open("X")
+        res["intraday CSV: duplicati e righe fuori ordine"] = (
+            n == len(cts) == 990 and bool((np.diff(cts) > 0).all())
+            and np.array_equal(cvals[10], rows.iloc[10].to_numpy() * 2))
+        mres = model_results(data.copy(), used)
+        cmp = intraday.compare_fills(mres, intraday.overnight_returns(*fills, mres["idx"]))
+        res["fill intraday == daily (VWAP = Close/Open)"] = cmp["days"] == len(last) - 1 and all(
+            np.isclose(cmp["intraday"][k], cmp["daily"][k], rtol=1e-9) for k in METRICS)
+
+        # Analytics mobili (somme cumulate) == eval_next_open sulle ultime w sedute
+        rep = analytics.report(ret, sig, data.index)
+        same = []
+        for name, w in analytics.WINDOWS.items():
+            roll = rep["rolling"][name]
+            for t in (w - 1, len(data) // 2, len(data) - 1):
+                wm = eval_next_open(ret.iloc[t - w + 1:t + 1], sig.iloc[t - w + 1:t + 1],
+                                    data.index[t - w + 1:t + 1])
+                same.append(roll["n_trades"][t] == wm["n_trades"] and all(
+                    abs(roll[k][t] - wm[k]) <= 10 ** -analytics.DECIMALS
+                    for k in ("winrate_%", "sharpe", "sortino")))
+        # Blocchi annuali: rilettura entro mezza unità di quantizzazione; con
+        # una seduta in più cambiano solo l'indice e il blocco dell'ultimo anno
+        path = os.path.join(tmp, "analytics_check", "analytics.json")
+        prev = analytics.report(ret.iloc[:-1], sig.iloc[:-1], data.index[:-1])
+        analytics.write_report(prev, path)
+        writer = OutputWriter(manifest_path=None)
+        analytics.write_report(rep, path, writer)
+        back = analytics.read_report(path)
+        half = 10 ** -analytics.DECIMALS / 2 + 1e-12
+        flat = [(rep["drawdown_%"], back["drawdown_%"])] + [
+            (rep["rolling"][w][k], back["rolling"][w][k])
+            for w in rep["rolling"] for k in rep["rolling"][w] if k != "window"]
+        res["analytics a blocchi annuali == report"] = (
+            back["dates"] == rep["dates"] and back["months"] == rep["months"]
+            and all(len(a) == len(b) and all((u is None) == (v is None) and (u is None or abs(u - v) <= half)
+                                              for u, v in zip(a, b)) for a, b in flat)
+            and sorted(os.path.relpath(f, os.path.dirname(path)) for f in writer.changed)
+            == sorted(["analytics.json", f"analytics/{data.index[-1].year}.json"]))
+        x = np.random.default_rng(0).normal(size=(2000, 3))
+        x[100, 1] = np.nan
+        res["analytics mobili == eval_next_open su finestra"] = all(same) and all(
+            np.array_equal(rolling_max(x, w), pd.DataFrame(x).rolling(w).max().to_numpy(), equal_nan=True)
+            for w in (1, 7, 252))
+
+        for k, v in res.items():
+            print(f"[{'OK' if v else 'FAIL'}] {k}")
+            ok = ok and v
+    finally:
+        price_store.set_default_store(None)
+        feature_store.set_default_features(None)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark offline su mercato sintetico")
+    ap.add_argument("--years", type=int, default=26)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--missing-rate", type=float, default=0.02)
+    ap.add_argument("--extra-tickers", type=int, default=0,
+                    help="titoli sintetici aggiuntivi nel mercato (non usati dai modelli)")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--baseline", default=BASELINE_FILE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--check", action="store_true")
+    ap.add_argument("--startup", action="store_true", help="misura solo i tempi di import")
+    args = ap.parse_args()
+
+    try:
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+
+    if args.startup:
+        results, problems = startup(args.repeat, saved.get("startup", {}))
+        if args.save_baseline:
+            saved["startup"] = results
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(saved, f, indent=2)
+            print(f"\n[OK] Baseline avvio salvata in {args.baseline}")
+            return
+        for p in problems:
+            print(f"[WARN] {p}")
+        sys.exit(1 if problems else 0)
+
+    # Il ticker non disponibile non deve pesare con le attese tra i tentativi
+    price_store.FETCH_BACKOFF = 0.0
+    market = synthetic_market.SyntheticMarket(
+        years=args.years, seed=args.seed, missing_rate=args.missing_rate,
+        extra_tickers=[f"SYN{i:03d}.MI" for i in range(args.extra_tickers)],
+    )
+    print(f"[INFO] Mercato sintetico: {args.years} anni, {len(market.frames)} ticker, "
+          f"{len(market.milan)} sedute Milano / {len(market.nyse)} NYSE")
+
+    if args.check and not check(market):
+        print("[FAIL] Equivalenze non rispettate")
+        sys.exit(1)
+
+    results = measure(market, args.repeat)
+    baseline = saved.get("stages", {})
+
+    print(f"\n{'stadio':<26}{'tempo s':>10}{'base s':>10}{'picco MB':>10}{'base MB':>10}")
+    for name, r in results.items():
+        b = baseline.get(name, {})
+        bt = f"{b['time_s']:.4f}" if b else "-"
+        bm = f"{b['peak_mb']:.1f}" if b else "-"
+        print(f"{name:<26}{r['time_s']:>10.4f}{bt:>10}{r['peak_mb']:>10.1f}{bm:>10}")
+
+    if args.save_baseline:
+        payload = {
+            **saved,
+            "config": {k: getattr(args, k) for k in ("years", "seed", "missing_rate", "extra_tickers")},
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "stages": results,
+        }
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+        print(f"\n[OK] Baseline salvata in {args.baseline}")
+        return
+
+    regressions = compare(results, baseline)
+    for r in regressions:
+        print(f"[WARN] Regressione {r}")
+    if regressions:
+        sys.exit(1)
+    if baseline:
+        print("\n[OK] Nessuna regressione rispetto alla baseline")
+
+
+if __name__ == "__main__":
+    main()
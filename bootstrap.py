@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+BOOTSTRAP — intervalli di confidenza di CAGR, max drawdown e Sharpe
+Ricampiona i ritorni giornalieri della strategia (ritorno next-open nei
+giorni con segnale, 0 negli altri) e ricalcola le metriche su ogni
+percorso simulato. Due metodi:
+  - block:   block bootstrap circolare dei giorni (blocchi di `block`
+             giorni, preserva l'autocorrelazione); tutte le metriche variano
+  - shuffle: rimescola l'ordine dei trade lasciandoli negli stessi giorni;
+             CAGR e Sharpe restano uguali, varia il percorso (max drawdown)
+
+I percorsi sono matrici campioni × date generate a blocchi di `chunk`
+righe (memoria limitata). Ogni blocco ha il proprio seed derivato da
+`seed` (SeedSequence.spawn): il risultato è riproducibile e non dipende
+dal numero di processi con cui si distribuiscono i blocchi.
+"""
+
+import argparse
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch_eval import cagr_rows, drawdown_rows, span_years
+
+N_SAMPLES = 10_000
+BLOCK = 20       # giorni per blocco (block bootstrap)
+CHUNK = 512      # campioni per blocco di calcolo
+CI = 0.90
+METHODS = ("block", "shuffle")
+
+
+def path_metrics(r: np.ndarray, trade: np.ndarray, years: float) -> dict:
+    """
+    Metriche per riga di `r` (campioni × date) come eval_next_open:
+    Sharpe sui soli giorni di trade (`trade`), drawdown e CAGR sull'equity.
+    """
+    n = trade.sum(axis=1)
+    nz = np.maximum(n, 1)
+    x = np.where(trade, r, 0.0)
+    mean = x.sum(axis=1) / nz
+    std = np.sqrt(np.maximum((x * x).sum(axis=1) / nz - mean ** 2, 0.0))
+    sharpe = np.where((n > 0) & (std > 0), mean / np.where(std > 0, std, 1.0) * np.sqrt(252), 0.0)
+
+    equity = np.cumprod(1.0 + r, axis=1)
+    cagr = cagr_rows(equity[:, -1], years)
+    return {"cagr_%": cagr, "max_dd_%": drawdown_rows(equity), "sharpe": sharpe}
+
+
+def _chunk(method: str, daily: np.ndarray, trade: np.ndarray, years: float,
+           size: int, block: int, seed) -> dict:
+    """Un blocco di `size` percorsi simulati (eseguibile in un worker)."""
+    rng = np.random.default_rng(seed)
+    t = len(daily)
+    if method == "block":
+        nb = -(-t // block)
+        starts = rng.integers(0, t, size=(size, nb))
+        idx = ((starts[:, :, None] + np.arange(block)) % t).reshape(size, nb * block)[:, :t]
+        r, tr = daily[idx], trade[idx]
+    else:
+        pos = np.flatnonzero(trade)
+        perm = rng.random((size, len(pos))).argsort(axis=1)
+        r = np.zeros((size, t))
+        r[:, pos] = daily[pos][perm]
+        tr = np.broadcast_to(trade, (size, t))
+    return path_metrics(r, tr, years)
+
+
+def bootstrap(daily_returns, in_trade, years: float, n: int = N_SAMPLES,
+              method: str = "block", block: int = BLOCK, seed: int = 0,
+              chunk: int = CHUNK, workers: int = 0, ci: float = CI) -> dict:
+    """
+    Intervalli di confidenza (quantili `(1-ci)/2` e `(1+ci)/2`) e mediana di
+    CAGR %, max drawdown % e Sharpe su `n` percorsi, più la stima puntuale
+    sulla serie osservata e la probabilità di CAGR negativo.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Metodo sconosciuto: {method}")
+    daily = np.nan_to_num(np.asarray(daily_returns, float), nan=0.0)
+    trade = np.asarray(in_trade, bool)
+    sizes = [min(chunk, n - a) for a in range(0, n, chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(method, daily, trade, years, s, block, sd) for s, sd in zip(sizes, seeds)]
+
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_chunk, *zip(*args)))
+    else:
+        parts = [_chunk(*a) for a in args]
+
+    point = path_metrics(daily[None, :], trade[None, :], years)
+    lo, hi = (1.0 - ci) / 2.0, (1.0 + ci) / 2.0
+    out = {"method": method, "n": n, "block": block if method == "block" else None,
+           "seed": seed, "ci": ci, "metrics": {}}
+    for k in point:
+        v = np.concatenate([p[k] for p in parts])
+        out["metrics"][k] = {
+            "point": float(point[k][0]),
+            "low": float(np.quantile(v, lo)),
+            "median": float(np.median(v)),
+            "high": float(np.quantile(v, hi)),
+            "mean": float(v.mean()),
+        }
+    cagr = np.concatenate([p["cagr_%"] for p in parts])
+    out["prob_cagr_neg"] = float((cagr < 0).mean())
+    return out
+
+
+if __name__ == "__main__":
+    from Nearer_My_God_to_Thee_2 import run_model
+
+    ap = argparse.ArgumentParser(description="Bootstrap delle metriche del modello volumi")
+    ap.add_argument("--n", type=int, default=N_SAMPLES)
+    ap.add_argument("--method", choices=METHODS, default="block")
+    ap.add_argument("--block", type=int, default=BLOCK)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--ci", type=float, default=CI)
+    ap.add_argument("--workers", type=int, default=0)
+    ap.add_argument("--out", default=None, help="file JSON dei risultati")
+    args = ap.parse_args()
+
+    res = run_model()
+    ret = res["data"]["FTSE_Ret_NextOpen"].to_numpy()
+    in_trade = res["sig_final"].to_numpy(bool) & ~np.isnan(ret)
+    out = bootstrap(res["metrics"]["daily_returns"], in_trade, span_years(res["idx"]),
+                    args.n, args.method, args.block, args.seed, workers=args.workers, ci=args.ci)
+
+    print(f"\n=== BOOTSTRAP {args.method.upper()}: {args.n} campioni, CI {args.ci:.0%} ===")
+    for k, m in out["metrics"].items():
+        print(f"{k:<10} stima {m['point']:9.4f}   [{m['low']:9.4f}, {m['high']:9.4f}]   "
+              f"mediana {m['median']:9.4f}")
+    print(f"P(CAGR < 0): {out['prob_cagr_neg']:.1%}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=2)
+        print(f"[OK] Risultati salvati in {args.out}")
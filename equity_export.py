@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+EQUITY EXPORT — formato compatto a blocchi annuali per la curva equity
+ - equity.json: indice con scala di quantizzazione e l'elenco dei blocchi
+ - equity/<anno>.json: un blocco per anno, colonnare:
+     {"start": "2024-01-02", "days": [1, 1, 3, ...], "q": [1753012, 0, -41, ...]}
+   "days" = giorni di calendario tra una data e la precedente,
+   "q"    = equity quantizzata (round(equity / scale)), codificata a delta
+            (primo valore assoluto, poi differenze).
+
+Ogni giorno cambia solo il blocco dell'anno corrente (i file sono scritti
+tramite OutputWriter, quindi solo se il contenuto cambia); la pagina
+carica prima l'ultimo anno e poi il resto. Opzionalmente si scrivono file
+precompressi .gz (e .br se il modulo brotli è installato).
+"""
+
+import gzip
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from output_writer import OutputWriter, atomic_write
+
+INDEX_FILE = "equity.json"
+CHUNK_DIR = "equity"
+FORMAT = "equity-chunks-v1"
+SCALE = 1e-6
+
+
+def _write(writer: OutputWriter, path: str, payload: dict, precompress: bool) -> None:
+    data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    changed = writer.write_bytes(path, data)
+    if precompress:
+        if changed or not os.path.exists(path + ".gz"):
+            atomic_write(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+        try:
+            import brotli
+        except ImportError:
+            return
+        if changed or not os.path.exists(path + ".br"):
+            atomic_write(path + ".br", brotli.compress(data))
+
+
+def encode_chunk(dates: pd.DatetimeIndex, values: np.ndarray, scale: float = SCALE) -> dict:
+    q = np.rint(np.asarray(values, float) / scale).astype(np.int64)
+    days = np.diff(dates.values.astype("datetime64[D]").astype(np.int64))
+    return {
+        "start": str(dates[0].date()),
+        "days": days.tolist(),
+        "q": np.diff(q, prepend=0).tolist(),
+    }
+
+
+def decode_chunk(chunk: dict, scale: float = SCALE) -> pd.Series:
+    start = np.datetime64(chunk["start"], "D")
+    offsets = np.concatenate([[0], np.cumsum(chunk["days"], dtype=np.int64)])
+    dates = pd.DatetimeIndex((start + offsets).astype("datetime64[ns]"))
+    values = np.cumsum(np.asarray(chunk["q"], dtype=np.int64)) * scale
+    return pd.Series(values, index=dates)
+
+
+def _chunk_path(root: str, year: int) -> str:
+    return os.path.join(root, CHUNK_DIR, f"{year}.json")
+
+
+def read_index(root: str = ".") -> dict | None:
+    try:
+        with open(os.path.join(root, INDEX_FILE), encoding="utf-8") as f:
+            idx = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return idx if isinstance(idx, dict) and idx.get("format") == FORMAT else None
+
+
+def read_equity(root: str = ".", years: list | None = None) -> pd.Series:
+    """Curva equity decodificata (tutti gli anni o solo `years`)."""
+    idx = read_index(root)
+    if idx is None:
+        return pd.Series(dtype=float)
+    parts = []
+    for c in idx["chunks"]:
+        if years is not None and c["year"] not in years:
+            continue
+        with open(os.path.join(root, c["file"]), encoding="utf-8") as f:
+            parts.append(decode_chunk(json.load(f), idx["scale"]))
+    return pd.concat(parts) if parts else pd.Series(dtype=float)
+
+
+def _write_chunks(writer, root: str, equity: pd.Series, scale: float, precompress: bool) -> list:
+    chunks = []
+    for year, s in equity.groupby(equity.index.year):
+        _write(writer, _chunk_path(root, year), encode_chunk(s.index, s.values, scale), precompress)
+        chunks.append({
+            "year": int(year),
+            "file": f"{CHUNK_DIR}/{year}.json",
+            "n": int(len(s)),
+            "first": str(s.index[0].date()),
+            "last": str(s.index[-1].date()),
+        })
+    return chunks
+
+
+def _write_index(writer, root: str, chunks: list, scale: float, precompress: bool) -> None:
+    chunks = sorted(chunks, key=lambda c: c["year"])
+    _write(writer, os.path.join(root, INDEX_FILE), {
+        "format": FORMAT,
+        "scale": scale,
+        "start": chunks[0]["first"] if chunks else None,
+        "end": chunks[-1]["last"] if chunks else None,
+        "chunks": chunks,
+    }, precompress)
+
+
+def write_equity(equity: pd.Series, root: str = ".", precompress: bool = False,
+                 writer: OutputWriter | None = None) -> None:
+    """Scrive indice e tutti i blocchi annuali della curva `equity`."""
+    writer = writer or OutputWriter(manifest_path=None)
+    chunks = _write_chunks(writer, root, equity, SCALE, precompress)
+    _write_index(writer, root, chunks, SCALE, precompress)
+
+
+def last_date(root: str = ".") -> str | None:
+    idx = read_index(root)
+    return idx["end"] if idx else None
+
+
+def append_equity(points: list, root: str = ".", precompress: bool = False,
+                  writer: OutputWriter | None = None) -> None:
+    """
+    Accoda punti (data, equity) in coda alla serie; i punti con data già
+    presente (es. l'ultimo punto provvisorio) vengono sovrascritti.
+    Legge e riscrive solo i blocchi degli anni toccati.
+    """
+    if not points:
+        return
+    writer = writer or OutputWriter(manifest_path=None)
+    new = pd.Series([float(e) for _, e in points], index=pd.DatetimeIndex([d for d, _ in points]))
+    years = set(new.index.year)
+    idx = read_index(root) or {"scale": SCALE, "chunks": []}
+    old = read_equity(root, years=sorted(years))
+    tail = pd.concat([old[old.index < new.index[0]], new]) if len(old) else new
+    others = [c for c in idx["chunks"] if c["year"] not in years]
+    chunks = others + _write_chunks(writer, root, tail, idx["scale"], precompress)
+    _write_index(writer, root, chunks, idx["scale"], precompress)
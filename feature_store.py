@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+FEATURE STORE — cache delle serie derivate (medie mobili, deviazioni, z-score)
+Ogni serie è memorizzata in RAM (LRU limitato in byte) e su disco
+(values.npy + meta.json per voce, LRU limitato in byte), con chiave:
+  - slot: nome della feature, parametri (finestra, fattore, ...), forma
+    degli input e le prime ANCHOR_BARS barre (date e valori), che
+    identificano la serie e non cambiano quando si accodano barre
+  - hash: contenuto completo di date e input
+
+Se l'hash coincide la serie si restituisce senza ricalcolo. Se invece le
+prime n - TAIL_BARS barre della versione in cache sono invariate (barre
+nuove accodate, ultime barre riviste da Yahoo) si ricalcola solo la coda,
+partendo `lookback` barre prima: il resto si riusa. Senza `lookback`
+(feature non causale su finestra) si ricalcola tutto.
+
+Le serie più corte di MIN_ROWS non passano dalla cache (finestre del
+replay, test): costerebbero più in hash e scritture che in calcolo.
+
+Variabili d'ambiente:
+  FTSEMIB_FEATURE_DIR=<dir>    cartella della cache (default .cache/features)
+  FTSEMIB_FEATURE_CACHE=0      disattiva la cache
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+FEATURE_DIR = os.environ.get("FTSEMIB_FEATURE_DIR", os.path.join(".cache", "features"))
+ENABLED = os.environ.get("FTSEMIB_FEATURE_CACHE", "1") != "0"
+VERSION = 1
+
+MAX_MEMORY_BYTES = 256 * 2**20
+MAX_DISK_BYTES = 1024 * 2**20
+ANCHOR_BARS = 16   # barre iniziali nella chiave dello slot
+TAIL_BARS = 5      # barre finali che possono essere state riviste
+MIN_ROWS = 500
+
+
+def _digest(*parts) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        if isinstance(p, np.ndarray):
+            h.update(str((p.dtype.str, p.shape)).encode())
+            h.update(np.ascontiguousarray(p).data)
+        else:
+            h.update(repr(p).encode())
+    return h.hexdigest()
+
+
+class FeatureStore:
+    """Cache RAM + disco delle feature derivate, con aggiornamento della coda."""
+
+    def __init__(self, root: str = FEATURE_DIR, max_memory: int = MAX_MEMORY_BYTES,
+                 max_disk: int = MAX_DISK_BYTES, enabled: bool = ENABLED):
+        self.root = root
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.enabled = enabled
+        self.memory = OrderedDict()  # slot -> (values, meta)
+        self.memory_bytes = 0
+        self.stats = {"hits": 0, "tail": 0, "misses": 0}
+
+    # ---------- RAM ----------
+    def _remember(self, slot: str, values: np.ndarray, meta: dict) -> None:
+        old = self.memory.pop(slot, None)
+        if old is not None:
+            self.memory_bytes -= old[0].nbytes
+        self.memory[slot] = (values, meta)
+        self.memory_bytes += values.nbytes
+        while self.memory_bytes > self.max_memory and len(self.memory) > 1:
+            _, (v, _) = self.memory.popitem(last=False)
+            self.memory_bytes -= v.nbytes
+
+    # ---------- disco ----------
+    def _read(self, slot: str) -> tuple[np.ndarray, dict] | None:
+        d = os.path.join(self.root, slot)
+        try:
+            with open(os.path.join(d, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            values = np.array(np.load(os.path.join(d, "values.npy"), mmap_mode="r"))
+        except (OSError, ValueError):
+            return None
+        os.utime(os.path.join(d, "meta.json"))  # usata di recente
+        return values, meta
+
+    def _write(self, slot: str, values: np.ndarray, meta: dict) -> None:
+        d = os.path.join(self.root, slot)
+        os.makedirs(d, exist_ok=True)
+        # File temporanei + rename, come price_store
+        tmp = os.path.join(d, "values.npy.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp, os.path.join(d, "values.npy"))
+        tmp = os.path.join(d, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(d, "meta.json"))
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        entries = []
+        for slot in os.listdir(self.root):
+            d = os.path.join(self.root, slot)
+            try:
+                size = sum(os.path.getsize(os.path.join(d, f)) for f in os.listdir(d))
+                entries.append((os.path.getmtime(os.path.join(d, "meta.json")), size, d))
+            except OSError:
+                continue
+        total = sum(e[1] for e in entries)
+        for _, size, d in sorted(entries):
+            if total <= self.max_disk:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+
+    def _lookup(self, slot: str) -> tuple[np.ndarray, dict] | None:
+        if slot in self.memory:
+            self.memory.move_to_end(slot)
+            return self.memory[slot]
+        found = self._read(slot)
+        if found is not None:
+            self._remember(slot, *found)
+        return found
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.memory_bytes = 0
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    # ---------- API ----------
+    def get(self, name: str, fn, index: pd.DatetimeIndex, inputs: list,
+            params: dict | None = None, lookback: int | None = None) -> np.ndarray:
+        """
+        `fn(*inputs, **params)` su array allineati a `index` (lungo l'asse 0),
+        letto dalla cache se possibile. `lookback` = barre di storia che
+        servono a ogni valore (es. la finestra): abilita il ricalcolo della
+        sola coda. Restituisce sempre una copia.
+        """
+        params = params or {}
+        xs = [np.ascontiguousarray(x, dtype=float) for x in inputs]
+        n = len(index)
+        if not self.enabled or n < MIN_ROWS:
+            return fn(*xs, **params)
+
+        idx = np.asarray(index.values.astype("datetime64[ns]").view("int64"))
+        a = min(ANCHOR_BARS, n)
+        slot = _digest(VERSION, name, sorted(params.items()), [x.shape[1:] for x in xs],
+                       idx[:a], *[x[:a] for x in xs])
+        full = _digest(idx, *xs)
+        cached = self._lookup(slot)
+
+        if cached is not None and cached[1]["hash"] == full:
+            self.stats["hits"] += 1
+            return cached[0].copy()
+
+        values = None
+        if cached is not None and lookback is not None:
+            old, meta = cached
+            m = meta["checkpoint_rows"]
+            if 0 < m <= n and _digest(idx[:m], *[x[:m] for x in xs]) == meta["checkpoint"]:
+                # Prefisso invariato: si ricalcola solo dalla barra m in poi
+                s = max(0, m - lookback + 1)
+                part = fn(*[x[s:] for x in xs], **params)
+                values = np.concatenate([old[:m], part[m - s:]])
+                self.stats["tail"] += 1
+        if values is None:
+            values = np.asarray(fn(*xs, **params))
+            self.stats["misses"] += 1
+
+        m = max(n - TAIL_BARS, 0)
+        meta = {"name": name, "params": params, "rows": n, "hash": full,
+                "checkpoint_rows": m, "checkpoint": _digest(idx[:m], *[x[:m] for x in xs])}
+        self._remember(slot, values, meta)
+        self._write(slot, values, meta)
+        return values.copy()
+
+
+_default_features: FeatureStore | None = None
+
+
+def default_features() -> FeatureStore:
+    """Store condiviso dai moduli del modello (creato alla prima richiesta)."""
+    global _default_features
+    if _default_features is None:
+        _default_features = FeatureStore()
+    return _default_features
+
+
+def set_default_features(store: FeatureStore | None) -> None:
+    """Sostituisce lo store condiviso (es. cartella temporanea nei test)."""
+    global _default_features
+    _default_features = store
+
+
+def feature(name: str, fn, index: pd.DatetimeIndex, inputs: list,
+            params: dict | None = None, lookback: int | None = None) -> np.ndarray:
+    """FeatureStore.get sullo store condiviso."""
+    return default_features().get(name, fn, index, inputs, params, lookback)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+INSTRUMENTATION — span per stadio e report JSON dell'esecuzione
+Ogni stadio (download, join, indicatori, segnale, valutazione, export) si
+avvolge in `span("nome")`, come context manager o decoratore. Per ogni span
+si registrano tempo reale, tempo CPU, righe elaborate, dimensione in
+memoria dei DataFrame prodotti (`frame_bytes`: non sono i byte ricevuti
+dalla rete) e, se il tracciamento memoria è attivo, il picco tracemalloc.
+
+Gli span si registrano nel report corrente (`RunReport` usato come context
+manager); senza report attivo non registrano nulla, così le funzioni del
+modello restano utilizzabili come libreria. Gli span vanno aperti dal
+thread principale (i worker di fetch_many sono contati dallo store).
+
+Variabili d'ambiente:
+  FTSEMIB_TRACE_MEMORY=1      picchi di memoria per span (tracemalloc, più lento)
+  FTSEMIB_PROFILE=<file>      dump cProfile dell'intera esecuzione (pstats)
+"""
+
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+from output_writer import atomic_write
+
+REPORT_FILE = "run_report.json"
+TRACE_MEMORY = os.environ.get("FTSEMIB_TRACE_MEMORY", "") == "1"
+PROFILE_FILE = os.environ.get("FTSEMIB_PROFILE") or None
+
+_current = None
+
+
+class Span:
+    """Misure di uno stadio; `rows` e `frame_bytes` si impostano dentro lo span."""
+
+    __slots__ = ("name", "wall_s", "cpu_s", "rows", "frame_bytes", "peak_mb", "_peak")
+
+    def __init__(self, name: str, rows: int | None = None):
+        self.name = name
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.rows = rows
+        self.frame_bytes = None
+        self.peak_mb = None
+        self._peak = 0
+
+    def to_dict(self) -> dict:
+        d = {"name": self.name, "wall_s": round(self.wall_s, 4), "cpu_s": round(self.cpu_s, 4)}
+        for k in ("rows", "frame_bytes"):
+            if getattr(self, k) is not None:
+                d[k] = int(getattr(self, k))
+        if self.peak_mb is not None:
+            d["peak_mb"] = round(self.peak_mb, 2)
+        return d
+
+
+class RunReport:
+    """Raccoglie gli span di un'esecuzione; da usare come context manager."""
+
+    def __init__(self, name: str, trace_memory: bool = TRACE_MEMORY,
+                 profile_file: str | None = PROFILE_FILE):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.profile_file = profile_file
+        self.spans = []
+        self.stack = []
+        self.started = None
+        self.total = Span("total")
+        self.status = "running"
+        self._profiler = None
+        self._t0 = self._c0 = 0.0
+
+    def __enter__(self):
+        global _current
+        self.started = datetime.now().isoformat(timespec="seconds")
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.profile_file:
+            import cProfile  # solo su richiesta
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._t0, self._c0 = time.perf_counter(), time.process_time()
+        self._prev, _current = _current, self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _current
+        _current = self._prev
+        self.total.wall_s = time.perf_counter() - self._t0
+        self.total.cpu_s = time.process_time() - self._c0
+        self.status = "ok" if exc_type is None else f"error: {exc_type.__name__}"
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_file)
+            print(f"[INFO] Profilo cProfile salvato in {self.profile_file}")
+        if self.trace_memory and tracemalloc.is_tracing():
+            peak = max(self.total._peak, tracemalloc.get_traced_memory()[1])
+            self.total.peak_mb = peak / 2**20
+            tracemalloc.stop()
+        return False
+
+    @contextmanager
+    def span(self, name: str, rows: int | None = None):
+        s = Span(f"{self.stack[-1].name}/{name}" if self.stack else name, rows)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            # Il picco è globale: prima di azzerarlo lo si riporta al genitore
+            parent = self.stack[-1] if self.stack else self.total
+            parent._peak = max(parent._peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.stack.append(s)
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield s
+        finally:
+            s.wall_s = time.perf_counter() - t0
+            s.cpu_s = time.process_time() - c0
+            self.stack.pop()
+            if tracing:
+                s._peak = max(s._peak, tracemalloc.get_traced_memory()[1])
+                s.peak_mb = s._peak / 2**20
+                parent = self.stack[-1] if self.stack else self.total
+                parent._peak = max(parent._peak, s._peak)
+            self.spans.append(s)
+
+    def merge(self, spans: list, prefix: str) -> None:
+        """Aggiunge gli span (to_dict) misurati in un altro processo, sotto `prefix`."""
+        for d in spans:
+            s = Span(f"{prefix}/{d['name']}", d.get("rows"))
+            s.wall_s, s.cpu_s = d["wall_s"], d["cpu_s"]
+            s.frame_bytes = d.get("frame_bytes")
+            self.spans.append(s)
+
+    def to_dict(self) -> dict:
+        return {
+            "run": self.name,
+            "started": self.started,
+            "status": self.status,
+            "python": sys.version.split()[0],
+            "total": self.total.to_dict(),
+            # In ordine di completamento (gli span interni prima dei genitori)
+            "spans": [s.to_dict() for s in self.spans],
+            "slowest": [s.name for s in sorted(self.spans, key=lambda s: -s.wall_s)[:3]],
+        }
+
+    def write(self, path: str = REPORT_FILE) -> None:
+        """Scrive il report (sempre: contiene tempi, cambia a ogni esecuzione)."""
+        atomic_write(path, json.dumps(self.to_dict(), indent=2).encode("utf-8"))
+
+    def summary(self) -> str:
+        parts = [f"{s.name} {s.wall_s:.2f}s" for s in self.spans if "/" not in s.name]
+        return f"{self.total.wall_s:.2f}s totali ({', '.join(parts)})"
+
+
+def current() -> RunReport | None:
+    return _current
+
+
+@contextmanager
+def span(name: str, rows: int | None = None):
+    """Span nel report corrente (senza report attivo non registra nulla)."""
+    if _current is None:
+        yield Span(name, rows)
+    else:
+        with _current.span(name, rows) as s:
+            yield s
+
+
+@contextmanager
+def download_span(name: str, store):
+    """Span con righe scaricate da `store` (PriceStore) e loro dimensione in memoria."""
+    before = dict(store.stats)
+    with span(name) as s:
+        yield s
+        s.rows = store.stats["rows"] - before["rows"]
+        s.frame_bytes = store.stats["frame_bytes"] - before["frame_bytes"]
+
+
+def timed(name: str):
+    """Decoratore: esegue la funzione dentro `span(name)`."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+INTRADAY — barre al minuto memory-mapped e fill realistici del trade overnight
+Il modello valuta il trade su Close[t] -> Open[t+1] delle barre daily. Qui
+lo stesso segnale (sig_final di run_model) si valuta con prezzi di
+ingresso e uscita presi dalle barre intraday in finestre orarie
+configurabili, es. VWAP degli ultimi 5 minuti prima della chiusura e dei
+primi 15 minuti della seduta successiva.
+
+Storage: per ticker due file binari grezzi in .cache/intraday/<ticker>/
+(ts.bin int64 = ora locale della borsa in ns, ohlcv.bin float64 righe × 5)
+più meta.json con il numero di righe valide. I CSV (minuto, 5 minuti, ...)
+si accodano a blocchi di CHUNK_ROWS righe, senza caricare tutto in
+pandas; le letture mappano i file (np.memmap) e i fill si calcolano
+scorrendo blocchi di righe, con somme per giorno (np.bincount): anni di
+barre al minuto di indice e titoli restano fuori dalla RAM.
+
+  python intraday.py --ingest FTSEMIB.MI ftsemib_1m.csv
+  python intraday.py --ticker FTSEMIB.MI --entry 17:25-17:30 --exit 09:00-09:15
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from Nearer_My_God_to_Thee_2 import MAIN_TICKER, eval_next_open, run_model
+from price_store import COLUMNS
+
+INTRADAY_DIR = os.environ.get("FTSEMIB_INTRADAY_DIR", os.path.join(".cache", "intraday"))
+TIMEZONE = "Europe/Rome"       # ora locale in cui si salvano le barre
+CHUNK_ROWS = 1_000_000         # righe per blocco (ingest e calcolo dei fill)
+ENTRY_WINDOW = "17:25-17:30"   # ultimi 5 minuti prima della chiusura
+EXIT_WINDOW = "09:00-09:15"    # primi 15 minuti della seduta successiva
+NS_DAY = 86_400 * 10**9
+
+
+# ================= STORAGE =================
+class IntradayStore:
+    """Barre intraday per ticker su file binari accodabili, lette con np.memmap."""
+
+    def __init__(self, root: str = INTRADAY_DIR):
+        self.root = root
+
+    def _dir(self, ticker: str) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in ticker)
+        return os.path.join(self.root, safe)
+
+    def meta(self, ticker: str) -> dict | None:
+        try:
+            with open(os.path.join(self._dir(ticker), "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def open(self, ticker: str) -> tuple[np.ndarray, np.ndarray] | None:
+        """(ts, valori) memory-mapped; None se il ticker non ha barre."""
+        meta = self.meta(ticker)
+        if not meta or not meta["rows"]:
+            return None
+        d, n = self._dir(ticker), meta["rows"]
+        ts = np.memmap(os.path.join(d, "ts.bin"), dtype=np.int64, mode="r", shape=(n,))
+        values = np.memmap(os.path.join(d, "ohlcv.bin"), dtype=np.float64, mode="r",
+                           shape=(n, len(COLUMNS)))
+        return ts, values
+
+    def append(self, ticker: str, ts: np.ndarray, values: np.ndarray) -> int:
+        """
+        Accoda le barre successive all'ultima salvata (le altre si scartano).
+        Prima i dati, poi meta.json con il nuovo numero di righe: una
+        lettura concorrente o un'interruzione vedono sempre righe complete.
+        """
+        d = self._dir(ticker)
+        os.makedirs(d, exist_ok=True)
+        meta = self.meta(ticker) or {"ticker": ticker, "rows": 0, "last": None, "tz": TIMEZONE}
+        ts = np.asarray(ts, dtype=np.int64)
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        if meta["last"] is not None:
+            keep = ts > meta["last"]
+            ts, values = ts[keep], values[keep]
+        if not len(ts):
+            return 0
+        n = meta["rows"]
+        for name, arr in (("ts.bin", ts), ("ohlcv.bin", values)):
+            path = os.path.join(d, name)
+            with open(path, "ab") as f:
+                # Byte oltre le righe valide (append interrotto): si sovrascrivono
+                f.truncate(n * arr.itemsize * (arr.shape[1] if arr.ndim > 1 else 1))
+                f.write(arr.tobytes())
+        meta.update(rows=n + len(ts), last=int(ts[-1]))
+        tmp = os.path.join(d, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(d, "meta.json"))
+        return len(ts)
+
+    def ingest_csv(self, ticker: str, path: str, tz: str = TIMEZONE,
+                   chunk_rows: int = CHUNK_ROWS) -> int:
+        """
+        Accoda un CSV (prima colonna data/ora, poi Open/High/Low/Close/Volume)
+        a blocchi. Orari con offset (es. export yfinance) convertiti nel
+        fuso `tz`; orari senza offset considerati già locali.
+        Orari ripetuti: resta l'ultima riga. Le righe non successive a quelle
+        già accodate si scartano (il CSV deve essere ordinato per orario
+        tra un blocco e l'altro): se ne riporta il numero.
+        """
+        meta = self.meta(ticker)
+        stored = meta["last"] if meta and meta["last"] is not None else None
+        added = dup = old = late = 0
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, float_precision="round_trip"):
+            cols = {c.lower(): c for c in chunk.columns}
+            raw = chunk.iloc[:, 0].astype(str)
+            if raw.str.contains(r"(?:[+-]\d\d:?\d\d|Z)$").any():
+                t = pd.to_datetime(raw, utc=True).dt.tz_convert(tz).dt.tz_localize(None)
+            else:
+                t = pd.to_datetime(raw)
+            ts = t.to_numpy(dtype="datetime64[ns]").view(np.int64)
+            values = np.column_stack([
+                chunk[cols[c.lower()]].to_numpy(dtype=float) if c.lower() in cols
+                else np.full(len(chunk), np.nan) for c in COLUMNS
+            ])
+            order = np.argsort(ts, kind="stable")
+            ts, values = ts[order], values[order]
+            keep = np.append(ts[1:] != ts[:-1], True)  # ultima riga per orario
+            dup += int((~keep).sum())
+            ts, values = ts[keep], values[keep]
+            n_old = int((ts <= stored).sum()) if stored is not None else 0
+            n = self.append(ticker, ts, values)
+            added += n
+            old += n_old
+            late += len(ts) - n - n_old
+        if dup:
+            print(f"[WARN] {path}: {dup} righe con orario duplicato, tenuta l'ultima")
+        if late:
+            print(f"[WARN] {path}: {late} righe fuori ordine scartate (CSV non ordinato per orario)")
+        if old:
+            print(f"[INFO] {path}: {old} righe già presenti in archivio")
+        return added
+
+    def chunks(self, ticker: str, chunk_rows: int = CHUNK_ROWS):
+        """Blocchi (ts, valori) consecutivi delle barre mappate."""
+        opened = self.open(ticker)
+        if opened is None:
+            return
+        ts, values = opened
+        for a in range(0, len(ts), chunk_rows):
+            yield np.asarray(ts[a:a + chunk_rows]), np.asarray(values[a:a + chunk_rows])
+
+
+# ================= FILL =================
+def parse_window(window: str) -> tuple[int, int]:
+    """"HH:MM-HH:MM" -> (inizio, fine) in ns dalla mezzanotte, fine esclusa."""
+    a, b = (pd.Timedelta(f"{p.strip()}:00") for p in window.split("-"))
+    if b <= a:
+        raise ValueError(f"Finestra non valida: {window}")
+    return a.value, b.value
+
+
+def session_vwap(store: IntradayStore, ticker: str, window: str,
+                 chunk_rows: int = CHUNK_ROWS) -> pd.Series:
+    """
+    Per giorno: VWAP del prezzo tipico (H+L+C)/3 delle barre che iniziano
+    nella finestra; media semplice se i volumi sono nulli (indici).
+    Giorni senza barre nella finestra assenti dalla serie.
+    """
+    meta = store.meta(ticker)
+    if not meta or not meta["rows"]:
+        return pd.Series(dtype=float)
+    lo, hi = parse_window(window)
+    opened = store.open(ticker)
+    d0 = int(opened[0][0]) // NS_DAY
+    nd = meta["last"] // NS_DAY - d0 + 1
+    pv, vol, px, cnt = (np.zeros(nd) for _ in range(4))
+    for ts, v in store.chunks(ticker, chunk_rows):
+        tod = ts % NS_DAY
+        typ = v[:, 1:4].mean(axis=1)
+        m = (tod >= lo) & (tod < hi) & np.isfinite(typ)
+        day = ts[m] // NS_DAY - d0
+        typ, vv = typ[m], np.nan_to_num(v[m, 4])
+        pv += np.bincount(day, typ * vv, nd)
+        vol += np.bincount(day, vv, nd)
+        px += np.bincount(day, typ, nd)
+        cnt += np.bincount(day, minlength=nd)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fill = np.where(vol > 0, pv / vol, px / cnt)
+    ok = cnt > 0
+    days = pd.DatetimeIndex(((d0 + np.flatnonzero(ok)) * NS_DAY).astype("datetime64[ns]"))
+    return pd.Series(fill[ok], index=days, name=window)
+
+
+def overnight_returns(entry: pd.Series, exit: pd.Series, idx: pd.DatetimeIndex) -> pd.Series:
+    """
+    Come FTSE_Ret_NextOpen con i fill intraday: ingresso il giorno t,
+    uscita nella seduta successiva di `idx`. NaN se manca uno dei due.
+    """
+    en = entry.reindex(idx).to_numpy()
+    ex = exit.reindex(idx).to_numpy()
+    ret = np.full(len(idx), np.nan)
+    ret[:-1] = ex[1:] / en[:-1] - 1.0
+    return pd.Series(ret, index=idx)
+
+
+def compare_fills(res: dict, ret_fill: pd.Series) -> dict:
+    """
+    Metriche di sig_final con ritorni daily (Close -> Open) e con i fill,
+    sugli stessi giorni: quelli coperti dalle barre intraday.
+    """
+    idx, sig = res["idx"], res["sig_final"]
+    ok = ret_fill.notna().to_numpy()
+    if not ok.any():
+        raise ValueError("Nessun giorno con fill intraday di ingresso e uscita")
+    a, b = np.flatnonzero(ok)[[0, -1]]
+    sl = slice(a, b + 2)  # fino alla seduta di uscita dell'ultimo trade coperto
+    daily = res["data"]["FTSE_Ret_NextOpen"].where(ok)
+    out = {"from": str(idx[a].date()), "to": str(idx[b].date()),
+           "days": int(ok.sum()), "signal_days": int((sig.to_numpy(bool) & ok).sum())}
+    for name, ret in (("daily", daily), ("intraday", ret_fill)):
+        m = eval_next_open(ret.iloc[sl], sig.iloc[sl], idx[sl])
+        out[name] = {k: v for k, v in m.items() if k not in ("equity", "daily_returns")}
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Barre intraday e fill del trade overnight")
+    ap.add_argument("--ingest", nargs=2, action="append", metavar=("TICKER", "CSV"),
+                    help="accoda un CSV di barre intraday (ripetibile)")
+    ap.add_argument("--tz", default=TIMEZONE, help="fuso della borsa per orari con offset")
+    ap.add_argument("--ticker", default=MAIN_TICKER)
+    ap.add_argument("--entry", default=ENTRY_WINDOW, help="finestra di ingresso HH:MM-HH:MM")
+    ap.add_argument("--exit", default=EXIT_WINDOW, help="finestra di uscita (seduta successiva)")
+    ap.add_argument("--out", default=None, help="file JSON del confronto")
+    args = ap.parse_args()
+
+    store = IntradayStore()
+    for ticker, path in args.ingest or []:
+        n = store.ingest_csv(ticker, path, args.tz)
+        print(f"[OK] {ticker}: {n} barre nuove da {path} ({store.meta(ticker)['rows']} totali)")
+    if store.meta(args.ticker) is None:
+        if args.ingest:
+            raise SystemExit(0)  # solo ingest di altri ticker
+        raise SystemExit(f"Nessuna barra intraday per {args.ticker} (usa --ingest)")
+
+    res = run_model()
+    entry = session_vwap(store, args.ticker, args.entry)
+    exit_ = session_vwap(store, args.ticker, args.exit)
+    out = compare_fills(res, overnight_returns(entry, exit_, res["idx"]))
+    print(f"\n=== FILL INTRADAY {args.ticker}: ingresso {args.entry}, uscita {args.exit} ===")
+    print(f"Periodo coperto: {out['from']} -> {out['to']} ({out['days']} giorni, "
+          f"{out['signal_days']} con segnale)")
+    print(f"{'metrica':<16}{'daily':>12}{'intraday':>12}")
+    for k, v in out["daily"].items():
+        print(f"{k:<16}{v:>12.4f}{out['intraday'][k]:>12.4f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=2)
+        print(f"[OK] Risultati salvati in {args.out}")
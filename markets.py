@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+MARKETS — modello volumi su più indici nello stesso job notturno
+Ogni mercato è descritto da: indice (timeline principale, prefisso FTSE
+della matrice come nel modello), ticker filtro (prefisso SPX), universo dei
+titoli di cui si guardano i volumi, fuso orario e ora di chiusura.
+Il FTSEMIB usa il modello congelato (TICKERS, PATTERNS, COMPOSITES); gli
+altri mercati un pattern Volume <= fattore * media per titolo, in OR con
+quello dell'indice.
+
+I ticker di tutti i mercati si scaricano una sola volta (^GSPC è comune a
+tutti) con un solo fetch_many nello store prezzi; i mercati girano poi in
+parallelo su un pool di processi, ognuno leggendo le serie dalla cache
+memory-mapped senza riscaricarle. Per ogni mercato:
+  markets/<nome>/signals.json, markets/<nome>/equity.json (+ equity/<anno>.json),
+  markets/<nome>/analytics.json (+ analytics/<anno>.json)
+più il riepilogo di tutti in markets/summary.json.
+
+Configurazione: MARKETS qui sotto oppure un JSON con la stessa forma
+(--config o FTSEMIB_MARKETS); "universe" può essere il nome di un CSV
+"nome,ticker[,fallback...]" come per FTSEMIB_UNIVERSE.
+
+  python markets.py
+  python markets.py --market DAX --market CAC --workers 2
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import analytics
+from Nearer_My_God_to_Thee_2 import (AUTO_ADJUST, FALLBACK_TICKERS, FTSE_COLUMNS, MAIN_TICKER,
+                                     METRICS, SPX_COLUMNS, SPX_TICKER, START_DATE, STOCK_COLUMNS,
+                                     TICKERS, VOL_MA10_FACTOR, align, build_signal, column,
+                                     download_ohlcv, eval_next_open, load_universe,
+                                     volume_conditions)
+from equity_calculator import compute_equity_from_daily_returns, compute_metrics_from_equity
+from equity_export import write_equity
+from instrumentation import RunReport, download_span, span
+from output_writer import OutputWriter
+from price_store import PriceStore, default_store, fetch_many
+from update_site import write_signals
+
+MARKETS_FILE = os.environ.get("FTSEMIB_MARKETS") or None
+OUTPUT_DIR = "markets"
+SUMMARY_FILE = "summary.json"
+REPORT_FILE = "markets_report.json"
+
+# universe None = paniere e pattern del modello congelato
+MARKETS = {
+    "FTSEMIB": {"index": MAIN_TICKER, "filter": SPX_TICKER, "universe": None,
+                "timezone": "Europe/Rome", "close": "17:30"},
+    "DAX": {"index": "^GDAXI", "filter": SPX_TICKER,
+            "universe": {"SAP": "SAP.DE", "SIEMENS": "SIE.DE", "ALLIANZ": "ALV.DE",
+                         "TELEKOM": "DTE.DE", "MERCEDES": "MBG.DE"},
+            "timezone": "Europe/Berlin", "close": "17:30"},
+    "CAC": {"index": "^FCHI", "filter": SPX_TICKER,
+            "universe": {"LVMH": "MC.PA", "TOTALENERGIES": "TTE.PA", "SANOFI": "SAN.PA",
+                         "AIRBUS": "AIR.PA", "BNP": "BNP.PA"},
+            "timezone": "Europe/Paris", "close": "17:30"},
+    "IBEX": {"index": "^IBEX", "filter": SPX_TICKER,
+             "universe": {"SANTANDER": "SAN.MC", "IBERDROLA": "IBE.MC", "INDITEX": "ITX.MC",
+                          "BBVA": "BBVA.MC", "TELEFONICA": "TEF.MC"},
+             "timezone": "Europe/Madrid", "close": "17:30"},
+}
+
+
+def load_markets(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def universe(cfg: dict) -> tuple[dict, dict]:
+    """(titoli, fallback) del mercato: dict nome -> ticker | [ticker, fallback...] o CSV."""
+    u = cfg.get("universe")
+    if u is None:
+        return TICKERS, FALLBACK_TICKERS
+    if isinstance(u, str):
+        return load_universe(u)
+    tickers, fallback = {}, {}
+    for name, t in u.items():
+        chain = [t] if isinstance(t, str) else list(t)
+        tickers[name] = chain[0]
+        if len(chain) > 1:
+            fallback[name] = chain[1:]
+    return tickers, fallback
+
+
+def symbols(cfg: dict) -> dict:
+    """{prefisso: [ticker, fallback...]} del mercato."""
+    tickers, fallback = universe(cfg)
+    out = {"FTSE": [cfg["index"]]}
+    for name, t in tickers.items():
+        out[name] = [t] + fallback.get(name, [])
+    out["SPX"] = [cfg.get("filter", SPX_TICKER)]
+    return out
+
+
+def patterns(cfg: dict, used: list) -> tuple[list | None, dict | None]:
+    """Pattern del mercato; (None, None) = quelli del modello congelato."""
+    if cfg.get("universe") is None:
+        return None, None
+    w, f = cfg.get("window", 10), cfg.get("factor", VOL_MA10_FACTOR)
+    return [(n, w, f) for n in used], {}
+
+
+def complete_bars(data: pd.DataFrame, timezone: str, close: str,
+                  now: pd.Timestamp | None = None) -> pd.DataFrame:
+    """Toglie la barra di oggi se nel fuso del mercato la chiusura non c'è ancora stata."""
+    now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now)
+    local = (now if now.tzinfo else now.tz_localize("UTC")).tz_convert(timezone)
+    if len(data) and data.index[-1].date() == local.date() and \
+            local.time() < pd.Timestamp(close).time():
+        return data.iloc[:-1]
+    return data
+
+
+# ================= SINGOLO MERCATO (worker) =================
+def run_market(name: str, cfg: dict, resolved: dict, store_root: str, out_dir: str = OUTPUT_DIR,
+               now: pd.Timestamp | None = None) -> dict:
+    """
+    Modello del mercato `name` con le serie già nello store (`resolved` =
+    {prefisso: ticker scaricato o None}). Scrive signals.json, equity.json e
+    analytics.json in out_dir/name; restituisce il riepilogo con gli span e i file scritti.
+    """
+    report = RunReport(name, trace_memory=False, profile_file=None)
+    with report:
+        with span("load") as s:
+            store = PriceStore(store_root, fetcher=None)  # sola lettura
+            start = pd.Timestamp(cfg.get("start", START_DATE))
+            frames = {}
+            for prefix, ticker in resolved.items():
+                cached = store.read(ticker, AUTO_ADJUST) if ticker else None
+                if cached is not None:
+                    frames[prefix] = cached[0][cached[0].index >= start].dropna()
+            if "FTSE" not in frames or "SPX" not in frames:
+                raise RuntimeError("indice o filtro non disponibili")
+            used = [p for p in frames if p not in ("FTSE", "SPX")]
+            sources = {p: (frames[p], STOCK_COLUMNS) for p in used}
+            sources["SPX"] = (frames["SPX"], SPX_COLUMNS)
+            data = align(frames["FTSE"], FTSE_COLUMNS, sources)
+            data = data.dropna(subset=["FTSE_Close"]).copy()
+            data = complete_bars(data, cfg.get("timezone", "UTC"), cfg.get("close", "23:59"), now)
+            s.rows = len(data)
+        if len(data) == 0:
+            raise RuntimeError("nessuna data valida")
+        if not np.nansum(column(data, "FTSE_Volume")):
+            # Indice senza volumi su Yahoo: il suo pattern resterebbe sempre vero
+            print(f"[WARN] {name}: volumi dell'indice assenti, pattern indice escluso")
+            data["FTSE_Volume"] = np.nan
+
+        with span("signal", rows=len(data)):
+            pats, comps = patterns(cfg, used)
+            sig = build_signal(data, volume_conditions(data, used, pats, comps))
+        with span("evaluation", rows=len(data)):
+            ret_next = data["FTSE_Open"].astype(float).shift(-1) / data["FTSE_Close"].astype(float) - 1.0
+            metrics = eval_next_open(ret_next, sig, data.index)
+            equity = compute_equity_from_daily_returns(metrics["daily_returns"])
+            equity.index = data.index
+            eq_metrics = compute_metrics_from_equity(equity)
+        with span("export"):
+            root = os.path.join(out_dir, name)
+            writer = OutputWriter()  # hash del manifest; lo salva il processo principale
+            write_signals(writer, data.index[-1], bool(sig.iloc[-1]), metrics, eq_metrics,
+                          path=os.path.join(root, "signals.json"))
+            write_equity(equity, root=root, writer=writer)
+            analytics.write_report(analytics.report(ret_next, sig, data.index),
+                                   os.path.join(root, "analytics.json"), writer)
+
+    return {
+        "summary": {
+            "index": cfg["index"],
+            "ultima_data": str(data.index[-1].date()),
+            "signal": "LONG" if sig.iloc[-1] else "NONE",
+            "titoli": used,
+            **{k: float(metrics[k]) for k in METRICS},
+            "n_trades": int(metrics["n_trades"]),
+            "max_dd_%": float(eq_metrics["max_dd_%"]),
+            "cagr_%": float(eq_metrics["cagr_%"]),
+        },
+        "spans": [s.to_dict() for s in report.spans],
+        "files": writer.files,
+        "changed": writer.changed,
+    }
+
+
+def _run_market(args: tuple) -> dict:
+    try:
+        return run_market(*args)
+    except Exception as e:  # un mercato fallito non ferma gli altri
+        return {"summary": {"error": f"{type(e).__name__}: {e}"}, "spans": [],
+                "files": {}, "changed": []}
+
+
+# ================= BATCH =================
+def download(markets: dict) -> dict:
+    """
+    Un solo fetch_many per le catene di ticker di tutti i mercati
+    (deduplicate); restituisce {mercato: {prefisso: ticker effettivamente
+    scaricato}}. Il ticker si risolve per catena: lo stesso ticker può
+    essere primario in un mercato e fallback in un altro.
+    """
+    chains = {}
+    for cfg in markets.values():
+        for chain in symbols(cfg).values():
+            chains.setdefault(",".join(chain), chain)
+
+    print(f"[INFO] Scarico {len(chains)} serie per {len(markets)} mercati in parallelo...")
+    with download_span("download", default_store()):
+        got = fetch_many(chains, download_ohlcv, with_ticker=True)
+    return {name: {p: got[",".join(chain)][0] for p, chain in symbols(cfg).items()}
+            for name, cfg in markets.items()}
+
+
+def run(markets: dict | None = None, workers: int | None = None, out_dir: str = OUTPUT_DIR,
+        report_file: str = REPORT_FILE, now: pd.Timestamp | None = None) -> dict:
+    """Tutti i mercati: download unico, modelli in parallelo, riepilogo in out_dir."""
+    markets = MARKETS if markets is None else markets
+    workers = min(len(markets), os.cpu_count() or 1) if workers is None else workers
+    report = RunReport("markets")
+    summary = {}
+    try:
+        with report:
+            writer = OutputWriter()
+            resolved = download(markets)
+            args = [(n, cfg, resolved[n], default_store().root, out_dir, now)
+                    for n, cfg in markets.items()]
+            with span("models", rows=len(markets)):
+                if workers > 1:
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        results = list(pool.map(_run_market, args))
+                else:
+                    results = [_run_market(a) for a in args]
+            for name, res in zip(markets, results):
+                summary[name] = res["summary"]
+                report.merge(res["spans"], f"models/{name}")
+                writer.files.update(res["files"])
+                writer.changed.extend(res["changed"])
+            writer.write_json(os.path.join(out_dir, SUMMARY_FILE), {"markets": summary}, indent=2)
+            writer.save()
+    finally:
+        report.write(report_file)
+
+    print(f"\n{'mercato':<10}{'ultima':>12}{'segnale':>9}{'trade':>7}{'cagr %':>9}{'sharpe':>8}")
+    for name, s in summary.items():
+        if "error" in s:
+            print(f"[WARN] {name}: {s['error']}")
+            continue
+        print(f"{name:<10}{s['ultima_data']:>12}{s['signal']:>9}{s['n_trades']:>7}"
+              f"{s['cagr_%']:>9.2f}{s['sharpe']:>8.2f}")
+    print(f"[INFO] Tempi: {report.summary()}")
+    if writer.changed:
+        print(f"[OK] File aggiornati: {len(writer.changed)}")
+    else:
+        print("[OK] Nessun cambiamento nei dati, file invariati.")
+    return summary
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Modello volumi su più mercati in parallelo")
+    ap.add_argument("--config", default=MARKETS_FILE, help="JSON dei mercati (default MARKETS)")
+    ap.add_argument("--market", action="append", help="mercato da eseguire (ripetibile, default tutti)")
+    ap.add_argument("--workers", type=int, default=None, help="processi (default uno per mercato, max CPU)")
+    ap.add_argument("--out", default=OUTPUT_DIR, help="cartella dei file per mercato")
+    args = ap.parse_args()
+
+    markets = load_markets(args.config) if args.config else MARKETS
+    if args.market:
+        unknown = set(args.market) - set(markets)
+        if unknown:
+            raise SystemExit(f"Mercati sconosciuti: {', '.join(sorted(unknown))}")
+        markets = {n: markets[n] for n in args.market}
+    summary = run(markets, args.workers, args.out)
+    # Errore solo se nessun mercato è andato a buon fine
+    sys.exit(0 if any("error" not in s for s in summary.values()) else 1)
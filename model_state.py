@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+MODEL STATE — stato persistente del modello per l'aggiornamento incrementale
+Contiene tutto ciò che serve per ingerire una nuova barra in O(1):
+  - medie mobili streaming (indicators.RollingMean) dei volumi di ogni titolo e del FTSE
+  - ultima chiusura SPX (per SPX_ret)
+  - segnale e chiusura dell'ultima barra, in attesa dell'Open successivo
+  - equity, picco e max drawdown correnti
+  - somme dei trade (winrate, medie, Sharpe/Sortino) e del log-equity (slope)
+
+La ricostruzione completa (`ModelState.replay`) usa lo stesso `step` barra
+per barra, quindi stato incrementale e ricostruzione coincidono bit a bit.
+Rispetto al percorso batch (eval_next_open, prodotti matrice-vettore) le
+somme hanno un ordine diverso: sharpe, sortino e slope possono differire
+nelle ultime cifre. `verify` confronta lo stato col batch a ogni
+pubblicazione (segnale e trade identici, metriche entro STATE_RTOL) e
+solleva RuntimeError se divergono.
+
+Lo stato salvato è un checkpoint all'ultima barra confermata: le ultime
+REFRESH_BARS barre (che lo store prezzi riscarica a ogni esecuzione, es.
+la chiusura SPX ancora provvisoria alle 17:30) si rielaborano ogni volta
+su una copia dello stato (`split_confirmed`), senza mai entrare nel
+checkpoint. `published` è l'ultima data scritta in equity.json/signals.json.
+"""
+
+import copy
+import json
+import math
+
+import pandas as pd
+
+from Nearer_My_God_to_Thee_2 import active_patterns, column
+from batch_eval import METRICS, MIN_SLOPE_POINTS, POINTS_SIZE
+from indicators import RollingMean
+from output_writer import OutputWriter
+from price_store import REFRESH_BARS
+
+STATE_FILE = "model_state.json"
+VERSION = 4
+
+SPX_THRESHOLD = 0.0  # %
+STATE_RTOL = 1e-12   # scarto relativo ammesso tra metriche dello stato e batch
+
+
+def _nan(x) -> float:
+    return float("nan") if x is None else float(x)
+
+
+class ModelState:
+    """Stato del modello volumi + filtro SPX alimentato barra per barra."""
+
+    def __init__(self, used: list):
+        single, comp = active_patterns(used)
+        self.params = {
+            "version": VERSION,
+            "used": list(used),
+            "patterns": [list(p) for p in single],
+            "composites": {k: [list(p) for p in v] for k, v in comp.items()},
+            "spx_threshold": SPX_THRESHOLD,
+        }
+        # (colonna volume, finestra, fattore): singole in OR, composte in AND
+        self.conds = [(f"{n}_Volume", w, f) for n, w, f in single]
+        self.composites = [[(f"{n}_Volume", w, f) for n, w, f in v] for v in comp.values()]
+        allc = self.conds + [c for v in self.composites for c in v]
+        self.columns = ["FTSE_Open", "FTSE_Close", "SPX_Close"] + sorted({c for c, _, _ in allc})
+
+        self.first_date = None
+        self.last_date = None
+        self.last_row = None
+        self.published = None        # ultima data pubblicata (stato "live")
+        self.ma = {f"{c}:{w}": RollingMean(w) for c, w, _ in allc}
+        self.spx_prev = float("nan")
+        self.pending = None          # [segnale, chiusura FTSE] dell'ultima barra
+        self.equity = 1.0
+        self.peak = 0.0              # il primo punto equity fa da picco iniziale
+        self.max_dd = 0.0
+        self.trades = dict(n=0, wins=0, s=0.0, s2=0.0, n_neg=0, s_neg=0.0, s2_neg=0.0)
+        self.log_eq = dict(n=0, sx=0.0, sxx=0.0, sy=0.0, sxy=0.0)
+
+    # ---------- aggiornamento ----------
+    @staticmethod
+    def _add_point(eq: float, sums: dict) -> None:
+        if eq > 0:
+            x = float(sums["n"])
+            y = math.log(eq)
+            sums["n"] += 1
+            sums["sx"] += x
+            sums["sxx"] += x * x
+            sums["sy"] += y
+            sums["sxy"] += x * y
+
+    def step(self, date: pd.Timestamp, row: dict):
+        """
+        Ingerisce la barra `date`. Restituisce il punto equity definitivo
+        (data, equity) della barra precedente, o None alla prima barra.
+        """
+        finalized = None
+        if self.pending is not None:
+            sig, close_prev = self.pending
+            ret = row["FTSE_Open"] / close_prev - 1.0
+            if sig and not math.isnan(ret):
+                t = self.trades
+                t["n"] += 1
+                t["wins"] += ret > 0
+                t["s"] += ret
+                t["s2"] += ret * ret
+                if ret < 0:
+                    t["n_neg"] += 1
+                    t["s_neg"] += ret
+                    t["s2_neg"] += ret * ret
+                self.equity *= 1.0 + ret
+            self.peak = max(self.peak, self.equity)
+            self.max_dd = min(self.max_dd, self.equity / self.peak - 1.0)
+            self._add_point(self.equity, self.log_eq)
+            finalized = (self.last_date, self.equity)
+
+        ma = {k: m.update(row.get(k.rsplit(":", 1)[0], float("nan"))) for k, m in self.ma.items()}
+
+        def hit(col, w, f):
+            return row.get(col, float("nan")) <= f * ma[f"{col}:{w}"]  # NaN => False
+
+        sig_or = any(hit(*c) for c in self.conds) or any(
+            all(hit(*c) for c in v) for v in self.composites)
+
+        spx_ret = (row["SPX_Close"] / self.spx_prev - 1.0) * 100.0
+        self.spx_prev = row["SPX_Close"]
+        signal = sig_or and spx_ret >= self.params["spx_threshold"]
+
+        self.pending = [bool(signal), row["FTSE_Close"]]
+        if self.first_date is None:
+            self.first_date = date
+        self.last_date = date
+        self.last_row = {c: row.get(c, float("nan")) for c in self.columns}
+        return finalized
+
+    def ingest(self, data: pd.DataFrame) -> list:
+        """Ingerisce tutte le righe di `data`; restituisce i punti equity definitivi."""
+        cols = {c: column(data, c) for c in self.columns}
+        out = []
+        for i, date in enumerate(data.index):
+            p = self.step(date, {c: float(v[i]) for c, v in cols.items()})
+            if p is not None:
+                out.append(p)
+        return out
+
+    @classmethod
+    def replay(cls, data: pd.DataFrame, used: list) -> "ModelState":
+        """Ricostruzione completa dello stato da tutta la storia."""
+        st = cls(used)
+        st.ingest(data)
+        return st
+
+    def live(self, tail: pd.DataFrame) -> tuple["ModelState", list]:
+        """Copia dello stato alimentata con le barre non confermate `tail`."""
+        st = copy.deepcopy(self)
+        return st, st.ingest(tail)
+
+    # ---------- lettura ----------
+    @property
+    def signal(self) -> bool:
+        return bool(self.pending and self.pending[0])
+
+    def matches(self, data: pd.DataFrame, used: list) -> bool:
+        """
+        True se lo stato è compatibile con `data`: stessi parametri e stessa
+        ultima barra del checkpoint (altrimenti Yahoo ha rivisto lo storico
+        oltre le barre riscaricate e serve una ricostruzione).
+        """
+        if self.params != ModelState(used).params or self.last_date is None:
+            return False
+        if self.last_date not in data.index:
+            return False
+        i = data.index.get_loc(self.last_date)
+        for c in self.columns:
+            a = self.last_row.get(c, float("nan"))
+            b = float(column(data, c)[i])
+            if not (a == b or (math.isnan(a) and math.isnan(b))):
+                return False
+        return True
+
+    def metrics(self) -> dict:
+        """Metriche come eval_next_open (equity e daily_returns escluse)."""
+        t = self.trades
+        n = t["n"]
+        zero = {
+            "n_trades": 0, "winrate_%": 0.0, "avg_trade_%": 0.0, "avg_trade_pts": 0.0,
+            "total_ret_%": 0.0, "sharpe": 0.0, "sortino": 0.0, "max_dd_%": 0.0,
+            "slope": 0.0, "cagr_%": 0.0,
+        }
+        if n == 0:
+            return zero
+
+        mean = t["s"] / n
+        std = math.sqrt(max(t["s2"] / n - mean ** 2, 0.0))
+        sharpe = mean / std * math.sqrt(252) if std > 0 else 0.0
+        if t["n_neg"]:
+            mn = t["s_neg"] / t["n_neg"]
+            std_neg = math.sqrt(max(t["s2_neg"] / t["n_neg"] - mn ** 2, 0.0))
+            sortino = mean / (std_neg + 1e-9) * math.sqrt(252)
+        else:
+            sortino = 0.0
+
+        # Punto provvisorio dell'ultima barra (ritorno non ancora noto)
+        sums = dict(self.log_eq)
+        self._add_point(self.equity, sums)
+        k = sums["n"]
+        den = k * sums["sxx"] - sums["sx"] ** 2
+        slope = (k * sums["sxy"] - sums["sx"] * sums["sy"]) / den \
+            if k >= MIN_SLOPE_POINTS and den > 0 else 0.0
+
+        n_days = (self.last_date - self.first_date).days
+        if n_days <= 0 or self.equity <= 0:
+            cagr = 0.0
+        else:
+            cagr = (self.equity ** (1.0 / (n_days / 365.25)) - 1.0) * 100.0
+
+        return {
+            "n_trades": n,
+            "winrate_%": t["wins"] / n * 100.0,
+            "avg_trade_%": mean * 100.0,
+            "avg_trade_pts": mean * POINTS_SIZE,
+            "total_ret_%": (self.equity - 1.0) * 100.0,
+            "sharpe": sharpe,
+            "sortino": sortino,
+            "max_dd_%": self.max_dd * 100.0,
+            "slope": slope,
+            "cagr_%": cagr,
+        }
+
+    def verify(self, signal: bool, metrics: dict | None = None) -> None:
+        """
+        Confronto col modello batch (`metrics` come pubblicate in signals.json):
+        segnale e numero di trade identici, le altre metriche entro STATE_RTOL.
+        """
+        bad = [] if self.signal == bool(signal) else ["signal"]
+        mine = self.metrics()
+        bad += [k for k in METRICS if metrics is not None and not (
+            mine[k] == metrics[k] if k == "n_trades" else
+            math.isclose(mine[k], metrics[k], rel_tol=STATE_RTOL, abs_tol=STATE_RTOL))]
+        if bad:
+            raise RuntimeError(f"Stato del modello diverso dal batch ({', '.join(bad)}): "
+                               f"ricostruisci con --full")
+
+    # ---------- persistenza ----------
+    def to_dict(self) -> dict:
+        return {
+            "params": self.params,
+            "first_date": str(self.first_date.date()) if self.first_date is not None else None,
+            "last_date": str(self.last_date.date()) if self.last_date is not None else None,
+            "last_row": self.last_row,
+            "published": self.published,
+            "ma": {k: m.to_dict() for k, m in self.ma.items()},
+            "spx_prev": self.spx_prev,
+            "pending": self.pending,
+            "equity": self.equity,
+            "peak": self.peak,
+            "max_dd": self.max_dd,
+            "trades": self.trades,
+            "log_eq": self.log_eq,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "ModelState":
+        st = cls(d["params"]["used"])
+        st.params = d["params"]
+        st.first_date = pd.Timestamp(d["first_date"]) if d["first_date"] else None
+        st.last_date = pd.Timestamp(d["last_date"]) if d["last_date"] else None
+        st.last_row = {k: _nan(v) for k, v in (d["last_row"] or {}).items()}
+        st.published = d["published"]
+        st.ma = {k: RollingMean.from_dict(v) for k, v in d["ma"].items()}
+        st.spx_prev = _nan(d["spx_prev"])
+        st.pending = d["pending"]
+        st.equity = d["equity"]
+        st.peak = d["peak"]
+        st.max_dd = d["max_dd"]
+        st.trades = d["trades"]
+        st.log_eq = d["log_eq"]
+        return st
+
+    def save(self, path: str = STATE_FILE, writer: OutputWriter | None = None) -> None:
+        (writer or OutputWriter(manifest_path=None)).write_json(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path: str = STATE_FILE) -> "ModelState | None":
+        try:
+            with open(path, encoding="utf-8") as f:
+                d = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if d.get("params", {}).get("version") != VERSION:
+            return None
+        return cls.from_dict(d)
+
+
+def split_confirmed(data: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    (barre confermate, ultime REFRESH_BARS barre): queste ultime lo store
+    le riscarica alla prossima esecuzione e possono ancora cambiare.
+    """
+    cut = max(len(data) - REFRESH_BARS, 0)
+    return data.iloc[:cut], data.iloc[cut:]
+
+
+def check_replay(data: pd.DataFrame, used: list, split: int) -> bool:
+    """
+    Verifica che ricostruzione completa e aggiornamento incrementale
+    (stato salvato dopo `split` barre, ricaricato e alimentato col resto)
+    producano lo stesso stato e le stesse metriche, bit a bit.
+    """
+    full = ModelState.replay(data, used)
+    part = ModelState.replay(data.iloc[:split], used)
+    part = ModelState.from_dict(json.loads(json.dumps(part.to_dict())))
+    part.ingest(data.iloc[split:])
+    a = json.dumps(full.to_dict())
+    b = json.dumps(part.to_dict())
+    return a == b and json.dumps(full.metrics()) == json.dumps(part.metrics())
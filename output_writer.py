@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+OUTPUT WRITER — scrittura dei file pubblicati solo se il contenuto cambia
+Ogni file viene serializzato in memoria, confrontato per hash SHA-256 con
+il manifest dell'esecuzione precedente (o, in sua assenza, con il file su
+disco) e scritto solo se diverso: file temporaneo nella stessa cartella,
+fsync, poi os.replace atomico. Così niente commit/redeploy quando i dati
+non cambiano e nessun JSON scritto a metà servito durante l'esecuzione.
+
+Per i JSON si possono indicare chiavi "volatili" (es. last_update) escluse
+dall'hash: un nuovo timestamp da solo non provoca una riscrittura.
+
+Il manifest (hash per file dell'ultima esecuzione) sta in .cache/, fuori
+dal repository, per non generare a sua volta commit.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+MANIFEST_FILE = os.environ.get(
+    "FTSEMIB_OUTPUT_MANIFEST", os.path.join(".cache", "outputs_manifest.json")
+)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _canonical(payload, volatile) -> bytes:
+    if isinstance(payload, dict) and volatile:
+        payload = {k: v for k, v in payload.items() if k not in volatile}
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """Scrive `data` su `path` tramite file temporaneo + rename atomico."""
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    tmp = os.path.join(d, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class OutputWriter:
+    """Writer con manifest di hash; `manifest_path=None` = nessun manifest."""
+
+    def __init__(self, manifest_path: str | None = MANIFEST_FILE):
+        self.manifest_path = manifest_path
+        self.previous = {}
+        if manifest_path:
+            try:
+                with open(manifest_path, encoding="utf-8") as f:
+                    self.previous = json.load(f).get("files", {})
+            except (OSError, ValueError):
+                self.previous = {}
+        self.files = {}
+        self.changed = []
+
+    def _disk_hash(self, path: str, volatile) -> str | None:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if volatile is None:
+            return _sha256(data)
+        try:
+            return _sha256(_canonical(json.loads(data), volatile))
+        except ValueError:
+            return None
+
+    def _write(self, path: str, data: bytes, digest: str, volatile) -> bool:
+        key = os.path.normpath(path)
+        prev = self.previous.get(key)
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        # Il manifest vale solo se il file su disco è quello che ha registrato
+        # (stessa dimensione e mtime); altrimenti si ricalcola l'hash dal disco.
+        if prev is not None and st is not None and \
+                (st.st_size, st.st_mtime_ns) == (prev.get("bytes"), prev.get("mtime_ns")):
+            same = prev.get("sha256") == digest
+        else:
+            same = st is not None and self._disk_hash(path, volatile) == digest
+        if same:
+            entry = dict(prev) if prev else {"sha256": digest}
+            entry.update(bytes=st.st_size, mtime_ns=st.st_mtime_ns, changed=False)
+            self.files[key] = entry
+            return False
+        atomic_write(path, data)
+        st = os.stat(path)
+        self.files[key] = {
+            "sha256": digest,
+            "bytes": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "changed": True,
+        }
+        self.changed.append(key)
+        return True
+
+    def write_bytes(self, path: str, data: bytes) -> bool:
+        """Scrive se il contenuto è cambiato. Restituisce True se ha scritto."""
+        return self._write(path, data, _sha256(data), None)
+
+    def write_json(self, path: str, payload, volatile=(), **dump_kwargs) -> bool:
+        """Come write_bytes per un JSON; le chiavi `volatile` non entrano nell'hash."""
+        data = json.dumps(payload, **dump_kwargs).encode("utf-8")
+        return self._write(path, data, _sha256(_canonical(payload, volatile)), volatile)
+
+    def save(self) -> None:
+        if not self.manifest_path:
+            return
+        files = dict(self.previous)
+        files.update(self.files)
+        manifest = {
+            "generated": datetime.now().isoformat(timespec="seconds"),
+            "changed": self.changed,
+            "files": files,
+        }
+        atomic_write(self.manifest_path,
+                     json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+PIPELINE — unico job per tutte le strategie del sito
+Le strategie (modello volumi di update_site.py, Top3 di quant_superior_live.py)
+dichiarano le serie che usano; la pipeline le scarica una sola volta
+(unione delle sorgenti, un solo fetch_many), costruisce un'unica matrice
+allineata sulla timeline FTSE e valuta ogni segnale con lo stesso motore
+di metriche (batch_eval). Ogni strategia scrive poi i propri file:
+  - volumi: signals.json, equity.json (+ equity/<anno>.json), model_state.json
+  - quant:  docs/data/metrics.json
+e, se la strategia dichiara `analytics_file`, le serie mobili e le tabelle
+dei rendimenti di analytics.py (analytics.json, docs/data/analytics.json,
+più i blocchi annuali in analytics/ e docs/data/analytics/).
+
+  python pipeline.py                    # tutte le strategie
+  python pipeline.py --strategy quant   # solo alcune
+  python pipeline.py --full             # ricostruzione completa del modello volumi
+"""
+
+import argparse
+import importlib
+
+import pandas as pd
+
+import analytics
+from Nearer_My_God_to_Thee_2 import (AUTO_ADJUST, COMPACT, MAIN_TICKER, START_DATE, align,
+                                     download_ohlcv, eval_next_open)
+from instrumentation import REPORT_FILE, RunReport, download_span, span
+from output_writer import OutputWriter
+from price_store import default_store, fetch_many
+
+# Strategie registrate: nome -> (modulo, classe), importate solo se richieste
+STRATEGIES = {
+    "volumi": ("update_site", "VolumeStrategy"),
+    "quant": ("quant_superior_live", "Top3Strategy"),
+}
+
+
+# ================= STRATEGIA =================
+class Strategy:
+    """
+    Base delle strategie. `sources()` restituisce
+    {prefisso: (ticker con fallback, colonne, auto_adjust, opzionale)};
+    il prefisso "FTSE" è la timeline principale ed è sempre obbligatorio.
+    """
+
+    name = ""
+    start = START_DATE
+    analytics_file = None  # JSON di analytics.report, None = non esportato
+
+    def sources(self) -> dict:
+        raise NotImplementedError
+
+    def signal(self, market: "Market") -> pd.Series:
+        """Segnale booleano sulle date di market.idx."""
+        raise NotImplementedError
+
+    def export(self, market: "Market", sig: pd.Series, metrics: dict,
+               writer: OutputWriter, full: bool) -> None:
+        raise NotImplementedError
+
+    def stream(self, market: "Market"):
+        """
+        Versione streaming opzionale per replay.py: oggetto con
+        `step(data, riga)` e attributo `signal`. None = solo batch.
+        """
+        return None
+
+
+class Market:
+    """Matrice allineata sulla timeline FTSE condivisa dalle strategie."""
+
+    def __init__(self, data: pd.DataFrame, available: list):
+        # Solo righe con FTSE valido
+        self.data = data.dropna(subset=["FTSE_Close"])
+        self.idx = self.data.index
+        self.available = available
+        self.ret_next = (
+            self.data["FTSE_Open"].astype(float).shift(-1) / self.data["FTSE_Close"].astype(float) - 1.0
+        )
+
+    def since(self, start: str) -> int:
+        """Posizione della prima data >= start."""
+        return int(self.idx.searchsorted(pd.Timestamp(start)))
+
+
+def merge_sources(strategies: list) -> dict:
+    """Unione delle sorgenti: stesso prefisso = stessi ticker e stesso adjust."""
+    out = {}
+    for st in strategies:
+        for name, (tickers, columns, adjust, optional) in st.sources().items():
+            if name not in out:
+                out[name] = (list(tickers), list(columns), adjust, optional)
+                continue
+            t0, c0, a0, o0 = out[name]
+            if t0 != list(tickers) or a0 != adjust:
+                raise ValueError(f"Sorgente {name} dichiarata in modi diversi da {st.name}")
+            out[name] = (t0, c0 + [c for c in columns if c not in c0], a0, o0 and optional)
+    if "FTSE" not in out:
+        out["FTSE"] = ([MAIN_TICKER], ["Close"], AUTO_ADJUST, False)
+    return out
+
+
+def load_market(strategies: list, compact: bool = COMPACT) -> Market:
+    """Un solo download per ticker e un solo allineamento per tutte le strategie."""
+    sources = merge_sources(strategies)
+    start = min(st.start for st in strategies)
+    adjust = {}
+    for name, (tickers, _, a, _) in sources.items():
+        for t in tickers:
+            if adjust.setdefault(t, a) != a:
+                raise ValueError(f"{t} richiesto sia con sia senza auto_adjust")
+
+    print(f"[INFO] Scarico in parallelo: {', '.join(sources)}")
+    with download_span("download", default_store()):
+        frames = fetch_many({n: s[0] for n, s in sources.items()},
+                            lambda t: download_ohlcv(t, adjust[t], start))
+
+    with span("join") as s:
+        aligned, available = {}, []
+        for name, (tickers, columns, _, optional) in sources.items():
+            d = frames[name]
+            if d is None or d.empty:
+                if not optional:
+                    raise SystemExit(f"Impossibile scaricare {tickers[0]}")
+                print(f"[WARN] Escludo {name}")
+                continue
+            available.append(name)
+            if name != "FTSE":
+                aligned[name] = (d, columns)
+        data = align(frames["FTSE"], sources["FTSE"][1], aligned, compact)
+        s.rows = len(data)
+        s.frame_bytes = int(data.memory_usage(index=False).sum())
+
+    market = Market(data, available)
+    if len(market.idx) == 0:
+        raise SystemExit("Nessuna data valida dopo merge.")
+    print(f"[INFO] Range dati FTSE: {market.idx[0].date()} -> {market.idx[-1].date()}")
+    return market
+
+
+def evaluate(market: Market, sig: pd.Series, start: str = START_DATE) -> dict:
+    """Metriche di eval_next_open sulle date da `start` in poi."""
+    a = market.since(start)
+    return eval_next_open(market.ret_next.iloc[a:], sig.iloc[a:], market.idx[a:])
+
+
+def analyze(market: Market, sig: pd.Series, start: str = START_DATE) -> dict:
+    """Serie mobili e tabelle dei rendimenti (analytics.report) da `start` in poi."""
+    a = market.since(start)
+    return analytics.report(market.ret_next.iloc[a:], sig.iloc[a:], market.idx[a:])
+
+
+def get_strategies(names: list | None = None) -> list:
+    out = []
+    for name in names or list(STRATEGIES):
+        if name not in STRATEGIES:
+            raise ValueError(f"Strategia sconosciuta: {name}")
+        module, cls = STRATEGIES[name]
+        out.append(getattr(importlib.import_module(module), cls)())
+    return out
+
+
+# ================= ESECUZIONE =================
+def run(names: list | None = None, full: bool = False, report_file: str = REPORT_FILE) -> dict:
+    """Esegue le strategie richieste; restituisce {nome: metriche}."""
+    strategies = get_strategies(names)
+    report = RunReport("pipeline")
+    results = {}
+    try:
+        with report:
+            writer = OutputWriter()
+            market = load_market(strategies)
+            for st in strategies:
+                with span(st.name):
+                    with span("signal", rows=len(market.idx)):
+                        sig = st.signal(market)
+                    with span("evaluation", rows=len(market.idx)):
+                        results[st.name] = evaluate(market, sig, st.start)
+                    with span("export"):
+                        st.export(market, sig, results[st.name], writer, full)
+                    if st.analytics_file:
+                        with span("analytics", rows=len(market.idx)):
+                            analytics.write_report(analyze(market, sig, st.start),
+                                                   st.analytics_file, writer)
+            writer.save()
+    finally:
+        # Tempi per stadio, anche se l'esecuzione fallisce
+        report.write(report_file)
+    print(f"[INFO] Tempi: {report.summary()}")
+    if writer.changed:
+        print(f"[OK] File aggiornati: {', '.join(writer.changed)}")
+    else:
+        print("[OK] Nessun cambiamento nei dati, file invariati.")
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Aggiorna i dati del sito per tutte le strategie")
+    ap.add_argument("--strategy", action="append", choices=list(STRATEGIES),
+                    help="strategia da eseguire (ripetibile, default tutte)")
+    ap.add_argument("--full", action="store_true",
+                    help="ricostruisce tutto lo storico invece di accodare le barre nuove")
+    args = ap.parse_args()
+    run(args.strategy, args.full)
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+PRICE STORE — cache locale OHLCV per ticker
+Ogni ticker è salvato su disco come array NumPy memory-mapped
+(index.npy = date in ns, values.npy = matrice Open/High/Low/Close/Volume)
+più un piccolo meta.json. Ad ogni richiesta si scaricano solo le barre
+successive all'ultima data in cache e si accodano.
+
+Il fetcher è pluggabile: qualsiasi callable (ticker, start, auto_adjust)
+che restituisca un DataFrame OHLCV, così lo store è testabile offline.
+
+`fetch_many` esegue le richieste di più simboli in parallelo su un pool
+di thread limitato, con retry/backoff e ticker di fallback.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.environ.get("FTSEMIB_CACHE_DIR", os.path.join(".cache", "prices"))
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+# Barre finali riscaricate ad ogni aggiornamento: l'ultima può essere
+# parziale (job lanciato a mercato aperto), la penultima serve da controllo.
+REFRESH_BARS = 2
+# Tolleranza sul confronto della barra di controllo: se Yahoo ha
+# ri-aggiustato la serie (dividendi, split) si riscarica tutto.
+OVERLAP_RTOL = 1e-6
+
+# Fetch concorrente
+MAX_WORKERS   = int(os.environ.get("FTSEMIB_FETCH_WORKERS", "8"))
+FETCH_TIMEOUT = 60.0   # secondi per simbolo (tutti i tentativi)
+FETCH_RETRIES = 2
+FETCH_BACKOFF = 1.0    # secondi, raddoppia ad ogni tentativo
+
+
+def yahoo_fetcher(ticker: str, start: str, auto_adjust: bool) -> pd.DataFrame | None:
+    """Fetcher di default: yf.download daily, colonne appiattite."""
+    # Import locale: yfinance (requests, lxml, ...) costa ~0.25s all'avvio e
+    # serve solo quando si scarica davvero, non leggendo dalla cache.
+    import yfinance as yf
+    df = yf.download(
+        ticker,
+        start=start,
+        interval="1d",
+        auto_adjust=auto_adjust,
+        progress=False,
+        threads=False,
+        timeout=FETCH_TIMEOUT / (FETCH_RETRIES + 1),
+    )
+    if df is None or df.empty:
+        return None
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    return df
+
+
+def _normalize(df: pd.DataFrame | None, ticker: str) -> pd.DataFrame | None:
+    if df is None or df.empty:
+        return None
+    if not all(c in df.columns for c in COLUMNS):
+        print(f"[WARN] Colonne mancanti per {ticker}: {df.columns}")
+        return None
+    out = df[COLUMNS].astype(float)
+    out.index = pd.DatetimeIndex(out.index).tz_localize(None).normalize()
+    out = out[~out.index.duplicated(keep="last")].sort_index()
+    return out.dropna(how="all")
+
+
+class PriceStore:
+    """Store OHLCV su disco con aggiornamento incrementale."""
+
+    def __init__(self, root: str = CACHE_DIR, fetcher=yahoo_fetcher):
+        self.root = root
+        self.fetcher = fetcher
+        # Contatori dei dati scaricati (letti dagli span di instrumentation);
+        # frame_bytes = memoria dei DataFrame ricevuti, non byte di rete
+        self.stats = {"requests": 0, "rows": 0, "frame_bytes": 0}
+        self._lock = threading.Lock()
+        self._ticker_locks = {}  # (ticker, auto_adjust) -> Lock
+
+    # ---------- layout su disco ----------
+    def _dir(self, ticker: str, auto_adjust: bool) -> str:
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in ticker)
+        return os.path.join(self.root, f"{safe}.{'adj' if auto_adjust else 'raw'}")
+
+    def read(self, ticker: str, auto_adjust: bool = True) -> tuple[pd.DataFrame, dict] | None:
+        d = self._dir(ticker, auto_adjust)
+        try:
+            with open(os.path.join(d, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            index = np.load(os.path.join(d, "index.npy"), mmap_mode="r")
+            values = np.load(os.path.join(d, "values.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        df = pd.DataFrame(
+            np.asarray(values),
+            index=pd.DatetimeIndex(np.asarray(index).view("datetime64[ns]")),
+            columns=COLUMNS,
+        )
+        return df, meta
+
+    def write(self, ticker: str, auto_adjust: bool, df: pd.DataFrame, meta: dict) -> None:
+        d = self._dir(ticker, auto_adjust)
+        os.makedirs(d, exist_ok=True)
+        index = df.index.values.astype("datetime64[ns]").view("int64")
+        values = np.ascontiguousarray(df[COLUMNS].to_numpy(dtype=float))
+        # Scrittura su file temporanei + rename: una lettura concorrente
+        # vede sempre una versione completa.
+        for name, arr in (("index.npy", index), ("values.npy", values)):
+            tmp = os.path.join(d, name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp, os.path.join(d, name))
+        tmp = os.path.join(d, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(d, "meta.json"))
+
+    # ---------- fetch ----------
+    def _fetch(self, ticker: str, start: str, auto_adjust: bool) -> pd.DataFrame | None:
+        raw = self.fetcher(ticker, start, auto_adjust)
+        with self._lock:
+            self.stats["requests"] += 1
+            if raw is not None:
+                self.stats["rows"] += len(raw)
+                self.stats["frame_bytes"] += int(raw.memory_usage(deep=True).sum())
+        return _normalize(raw, ticker)
+
+    def _full(self, ticker: str, start: str, auto_adjust: bool) -> pd.DataFrame | None:
+        df = self._fetch(ticker, start, auto_adjust)
+        if df is not None:
+            self.write(ticker, auto_adjust, df, {"ticker": ticker, "start": start})
+        return df
+
+    def get(self, ticker: str, start: str, auto_adjust: bool = True) -> pd.DataFrame | None:
+        """
+        OHLCV di `ticker` da `start` in poi.
+        Scarica tutto solo se la cache manca o copre un periodo più corto;
+        altrimenti riscarica le ultime REFRESH_BARS barre e accoda le nuove.
+        Le richieste concorrenti dello stesso ticker (es. primario di un
+        mercato e fallback di un altro) si serializzano: la seconda trova
+        la cache già aggiornata.
+        """
+        with self._lock:
+            lock = self._ticker_locks.setdefault((ticker, auto_adjust), threading.Lock())
+        with lock:
+            return self._get(ticker, start, auto_adjust)
+
+    def _get(self, ticker: str, start: str, auto_adjust: bool) -> pd.DataFrame | None:
+        cached = self.read(ticker, auto_adjust)
+        if cached is None or pd.Timestamp(start) < pd.Timestamp(cached[1]["start"]):
+            return self._full(ticker, start, auto_adjust)
+
+        old, meta = cached
+        if len(old) < REFRESH_BARS:
+            return self._full(ticker, start, auto_adjust)
+
+        check_date = old.index[-REFRESH_BARS]
+        try:
+            new = self._fetch(ticker, str(check_date.date()), auto_adjust)
+        except Exception as e:
+            print(f"[WARN] Aggiornamento {ticker} fallito ({e}), uso la cache")
+            new = None
+
+        if new is not None and not new.empty:
+            if check_date not in new.index or not np.isclose(
+                new.loc[check_date, "Close"], old.loc[check_date, "Close"],
+                rtol=OVERLAP_RTOL, equal_nan=True,
+            ):
+                print(f"[INFO] Serie {ticker} ri-aggiustata, riscarico tutto...")
+                return self._full(ticker, meta["start"], auto_adjust)
+            old = pd.concat([old[old.index < check_date], new[new.index >= check_date]])
+            self.write(ticker, auto_adjust, old, meta)
+
+        return old[old.index >= pd.Timestamp(start)]
+
+
+_default_store: PriceStore | None = None
+
+
+def default_store() -> PriceStore:
+    """Store condiviso dai moduli del modello (creato alla prima richiesta)."""
+    global _default_store
+    if _default_store is None:
+        _default_store = PriceStore()
+    return _default_store
+
+
+def set_default_store(store: PriceStore | None) -> None:
+    """Sostituisce lo store condiviso (es. fetcher finto nei test offline)."""
+    global _default_store
+    _default_store = store
+
+
+def _fetch_with_retry(name: str, tickers: list[str], loader, retries: int,
+                      backoff: float) -> tuple[str | None, pd.DataFrame | None]:
+    """
+    (ticker scaricato, dati) del primo ticker non vuoto, (None, None) se nessuno.
+    Retry con backoff solo sugli errori (rete, timeout): una risposta vuota
+    (ticker delistato, es. STLAM.MI) passa subito al fallback successivo.
+    """
+    for ticker in tickers:
+        for attempt in range(retries + 1):
+            try:
+                df = loader(ticker)
+            except Exception as e:
+                print(f"[WARN] {name} ({ticker}) tentativo {attempt + 1}: {e}")
+                if attempt < retries:
+                    time.sleep(backoff * 2 ** attempt)
+                continue
+            if df is not None and not df.empty:
+                return ticker, df
+            break
+        if ticker != tickers[-1]:
+            print(f"[INFO] Retry {name} con {tickers[tickers.index(ticker) + 1]}...")
+    return None, None
+
+
+def fetch_many(symbols: dict[str, list[str]],
+               loader,
+               max_workers: int | None = None,
+               timeout: float | None = None,
+               retries: int | None = None,
+               backoff: float | None = None,
+               with_ticker: bool = False) -> dict:
+    """
+    Scarica in parallelo {nome: [ticker, fallback...]} con `loader(ticker)`.
+    Per ogni nome restituisce il primo DataFrame non vuoto, None se tutti
+    i ticker falliscono o il simbolo supera `timeout`; con `with_ticker`
+    la coppia (ticker scaricato, DataFrame), (None, None) se fallisce.
+    I parametri non indicati valgono MAX_WORKERS, FETCH_TIMEOUT, ecc.
+    L'ordine del dict in uscita è quello di `symbols`.
+    """
+    if not symbols:
+        return {}
+    # Default letti a ogni chiamata: modificabili a runtime (es. benchmark)
+    max_workers = MAX_WORKERS if max_workers is None else max_workers
+    timeout = FETCH_TIMEOUT if timeout is None else timeout
+    retries = FETCH_RETRIES if retries is None else retries
+    backoff = FETCH_BACKOFF if backoff is None else backoff
+    workers = max(1, min(max_workers, len(symbols)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {
+            name: pool.submit(_fetch_with_retry, name, list(tickers), loader, retries, backoff)
+            for name, tickers in symbols.items()
+        }
+        # Il timeout decorre dall'avvio effettivo: i simboli in coda
+        # aspettano al più un "turno" del pool per ogni worker occupato.
+        waves = -(-len(symbols) // workers)
+        deadline = time.monotonic() + timeout * waves
+        out = {}
+        for name, fut in futures.items():
+            try:
+                got = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                print(f"[WARN] Timeout download {name}")
+                got = (None, None)
+            out[name] = got if with_ticker else got[1]
+        return out
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -7,117 +7,48 @@ Esporta dati in JSON per web app
 
 import numpy as np
 import pandas as pd
-import yfinance as yf
-import json
 from datetime import datetime
 import os
-import warnings
-warnings.filterwarnings('ignore')
+
+from Nearer_My_God_to_Thee_2 import AUTO_ADJUST, MAIN_TICKER, column
+from feature_store import feature
+from indicators import rolling_mean, rolling_std
+from pipeline import Strategy, run
 
 START_DATE = '2010-01-01'
 ALLOWED_DAYS = [0, 1, 2, 3]  # Lun-Gio
 OUTPUT_FILE = 'docs/data/metrics.json'
+ANALYTICS_FILE = 'docs/data/analytics.json'
+VOL_WINDOW = 20
+# Colonne che guardano alla barra successiva: assenti (NaN) sull'ultima data
+FORWARD_COLUMNS = ['Open_next', 'overnight_ret']
 
 def ensure_output_dir():
     os.makedirs('docs/data', exist_ok=True)
 
-def fix_yahoo_df(df):
-    if isinstance(df.columns, pd.MultiIndex):
-        df.columns = '.'.join(str(x) for x in col for col in df.columns)
-    else:
-        df.columns = str(c) for c in df.columns
-    return df
-
-def extract_single_close(df):
-    cols_low = [c.lower() for c in df.columns]
-    for t in ['close', 'adj close']:
-        if t in cols_low:
-            return df[df.columns[cols_low.index(t)]]
-    for i, c in enumerate(cols_low):
-        if 'close' in c:
-            return df[df.columns[i]]
-    for c in df.columns:
-        if np.issubdtype(df[c].dtype, np.number):
-            return df[c]
-    raise RuntimeError('Nessuna colonna Close trovata')
-
-def load_ftsemib():
-    print('[DOWNLOAD] FTSEMIB.MI...')
-    df = yf.download('FTSEMIB.MI', start=START_DATE, interval='1d',
-                     auto_adjust=False, progress=False)
-    if df is None or df.empty:
-        raise RuntimeError('Errore nessun dato FTSEMIB da Yahoo')
-    df = fix_yahoo_df(df)
-    df = df.sort_index()
-    close = extract_single_close(df)
-    
-    def find_word(words):
-        for w in words:
-            for col in df.columns:
-                if w in col.lower():
-                    return col
-        return None
-    
-    o = find_word(['open'])
-    h = find_word(['high'])
-    l = find_word(['low'])
-    v = find_word(['volume'])
-    
-    if o and h and l:
-        out = pd.DataFrame(index=df.index)
-        out['Open'] = df[o]
-        out['High'] = df[h]
-        out['Low'] = df[l]
-        out['Close'] = close
-        out['Volume'] = df[v] if v else 0
-        return out.dropna()
-    else:
-        print('WARN: OHLC non trovati, uso sintetici')
-        out = pd.DataFrame(index=df.index)
-        out['Close'] = close
-        out['Open'] = close.shift(1)
-        out['High'] = pd.concat([out['Open'], close], axis=1).max(axis=1)
-        out['Low'] = pd.concat([out['Open'], close], axis=1).min(axis=1)
-        out['Volume'] = 0
-        return out.dropna()
-
-def load_aux_symbol(symbol):
-    df = yf.download(symbol, start=START_DATE, interval='1d',
-                     auto_adjust=False, progress=False)
-    if df is None or df.empty:
-        return None
-    df = fix_yahoo_df(df)
-    df = df.sort_index()
-    c = extract_single_close(df)
-    return pd.DataFrame({'Close': c})
-
-def build_dataset():
-    ftse = load_ftsemib()
-    df = ftse.copy()
-    
-    spy = load_aux_symbol('SPY')
-    vix = load_aux_symbol('^VIX')
-    
-    if spy is not None:
-        df = df.join(spy.rename(columns={'Close': 'SPY_Close'}))
+def features(df):
+    """Indicatori del pattern su OHLCV FTSE (+ SPY_Close / VIX_Close se presenti)."""
+    if 'SPY_Close' in df.columns:
         df['spy_ret'] = df['SPY_Close'].pct_change()
-    
-    if vix is not None:
-        df = df.join(vix.rename(columns={'Close': 'VIX_Close'}))
+    if 'VIX_Close' in df.columns:
         df['vix_ret'] = df['VIX_Close'].pct_change()
-    
     df['Close_prev'] = df['Close'].shift(1)
     df['gap_open'] = df['Open'] / df['Close_prev'] - 1
-    df['vol_ma'] = df['Volume'].rolling(20).mean()
-    df['vol_std'] = df['Volume'].rolling(20).std()
-    df['vol_z'] = (df['Volume'] - df['vol_ma']) / df['vol_std']
+    # Finestre mobili dal feature store; vol_z = rolling_zscore senza ricalcolarle
+    vol = df['Volume'].to_numpy(dtype=float)
+    ma = feature("rolling_mean", rolling_mean, df.index, [vol], {"window": VOL_WINDOW}, lookback=VOL_WINDOW)
+    sd = feature("rolling_std", rolling_std, df.index, [vol], {"window": VOL_WINDOW}, lookback=VOL_WINDOW)
+    df['vol_ma'] = ma
+    df['vol_std'] = sd
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df['vol_z'] = (vol - ma) / sd
     df['Open_next'] = df['Open'].shift(-1)
     df['overnight_ret'] = df['Open_next'] / df['Close'] - 1
     df['dow'] = df.index.dayofweek
-    
-    return df.dropna()
+    return df
 
 def match_top3(r):
+    """Versione riga per riga (riferimento per signal_mask)."""
     cond = False
     if not pd.isna(r.get('spy_ret')):
         cond = 0 < r['gap_open'] < 0.01 and 0 < r['spy_ret'] < 0.01
@@ -126,6 +57,7 @@ def match_top3(r):
     return cond
 
 def filter_s(r):
+    """Versione riga per riga (riferimento per signal_mask)."""
     if not pd.isna(r.get('spy_ret')):
         if r['spy_ret'] < -0.005:
             return False
@@ -133,44 +65,96 @@ def filter_s(r):
         return False
     return True
 
-def run_backtest(df):
-    df['signal'] = df.apply(lambda r: match_top3(r) and filter_s(r), axis=1)
-    trades = df[df['signal']].copy()
+# ================= MOTORE REGOLE VETTORIALE =================
+# Regole (colonna, min, max) con estremi esclusi, valutate su tutta la storia.
+# Stessa semantica NaN delle versioni riga per riga: se spy_ret / vix_ret
+# mancano (colonna assente o NaN) il relativo blocco viene saltato.
+TOP3_SPY_RULES = [('gap_open', 0, 0.01), ('spy_ret', 0, 0.01)]
+TOP3_VIX_RULES = [('vix_ret', -0.10, -0.05), ('vol_z', -1.5, -0.5)]
+SPY_MIN_RET = -0.005
+
+def _col(df, name):
+    if name in df.columns:
+        return df[name].to_numpy(dtype=float)
+    return np.full(len(df), np.nan)
+
+def rules_mask(df, rules):
+    mask = np.ones(len(df), dtype=bool)
+    with np.errstate(invalid='ignore'):
+        for col, lo, hi in rules:
+            x = _col(df, col)
+            mask &= (lo < x) & (x < hi)
+    return mask
+
+def match_top3_mask(df):
+    spy_ok = ~np.isnan(_col(df, 'spy_ret'))
+    cond = spy_ok & rules_mask(df, TOP3_SPY_RULES)
+    vix_ok = ~np.isnan(_col(df, 'vix_ret'))
+    return np.where(vix_ok, cond & rules_mask(df, TOP3_VIX_RULES), cond)
+
+def filter_s_mask(df):
+    with np.errstate(invalid='ignore'):
+        spy_ok = ~(_col(df, 'spy_ret') < SPY_MIN_RET)  # NaN non filtra
+    return spy_ok & np.isin(_col(df, 'dow'), ALLOWED_DAYS)
+
+def signal_mask(df):
+    """Segnale per tutte le righe di df (array bool)."""
+    return match_top3_mask(df) & filter_s_mask(df)
+
+# ================= REGISTRO TRADE =================
+# Un record per trade in colonne contigue; result: RESULT_WIN / RESULT_LOSS
+LEDGER_DTYPE = np.dtype([('date', 'datetime64[D]'), ('entry', 'f8'), ('exit', 'f8'),
+                         ('pnl', 'f8'), ('result', 'i1')])
+RESULT_LOSS, RESULT_WIN = 0, 1
+RESULT_LABELS = np.array(['LOSS', 'WIN'])
+INITIAL_CAPITAL = 100000
+
+class TradeLedger:
+    """
+    Registro dei trade su array strutturato NumPy. Equity a capitale fisso
+    (pnl non reinvestito) e drawdown % calcolati in blocco; le code
+    (`tail`) sono viste, senza copie.
+    """
     
-    if trades.empty:
-        return trades, pd.Series(dtype=float), 0, 0, 0, 0, 0
+    __slots__ = ('records', 'initial_capital', 'equity_curve', 'drawdown')
     
-    trades['pnl'] = trades['overnight_ret']
-    trades['pnl_points'] = trades['overnight_ret'] * trades['Close']
-    trades['raw_points'] = trades['Open_next'] - trades['Close']
+    def __init__(self, records, initial_capital=INITIAL_CAPITAL):
+        self.records = records
+        self.initial_capital = initial_capital
+        self.equity_curve = np.empty(len(records) + 1)
+        self.equity_curve[0] = initial_capital
+        np.cumsum(records['pnl'] * initial_capital, out=self.equity_curve[1:])
+        self.equity_curve[1:] += initial_capital
+        peaks = np.maximum.accumulate(self.equity_curve)
+        self.drawdown = (peaks - self.equity_curve) / peaks * 100
     
-    equity = 1 + trades['pnl'].cumprod()
-    years = (equity.index[-1] - equity.index[0]).days / 365.25
-    cagr = equity.iloc[-1] ** (1 / years) - 1 if years > 0 else 0
-    avg = trades['pnl'].mean()
-    avg_points = trades['pnl_points'].mean()
-    win = (trades['pnl'] > 0).mean()
+    @classmethod
+    def from_arrays(cls, dates, entry, exit, pnl, initial_capital=INITIAL_CAPITAL):
+        rec = np.empty(len(pnl), dtype=LEDGER_DTYPE)
+        rec['date'] = np.asarray(dates, dtype='datetime64[D]')
+        rec['entry'] = entry
+        rec['exit'] = exit
+        rec['pnl'] = pnl
+        rec['result'] = np.where(rec['pnl'] > 0, RESULT_WIN, RESULT_LOSS)
+        return cls(rec, initial_capital)
     
-    return trades, equity, cagr, avg, win, avg_points, trades['raw_points'].mean()
-
-class System:
-    def __init__(self, trades):
-        self.initial_capital = 100000
-        self.trades = trades.copy()
-        self.trades_pnl = self.trades['pnl'] * self.initial_capital
-        self.trades_cumpnl = self.trades_pnl.cumsum()
-        self.equity_curve = [self.initial_capital] + list(self.initial_capital + self.trades_cumpnl)
-        
-        peaks = np.maximum.accumulate(self.equity_curve)
-        self.drawdown = (peaks - np.array(self.equity_curve)) / peaks * 100
-        
-        self.trades['result'] = ['WIN' if x > 0 else 'LOSS' for x in self.trades_pnl]
-        self.trades['trade'] = list(range(len(self.trades)))
-        self.trades['position_pct'] = 100
+    def __len__(self):
+        return len(self.records)
+    
+    def tail(self, n):
+        return self.records[max(len(self.records) - n, 0):]
+    
+    def history(self, n=10):
+        """Ultimi n trade come righe JSON (conversione per colonna)."""
+        t = self.tail(n)
+        cols = zip(np.datetime_as_string(t['date']).tolist(), t['entry'].tolist(), t['exit'].tolist(),
+                   (t['pnl'] * 100).tolist(), RESULT_LABELS[t['result']].tolist())
+        return [dict(zip(('date', 'entry', 'exit', 'pnl_pct', 'result'), c)) for c in cols]
 
-def export_metrics(df, system, trades, equity, cagr, avg, winrate, avg_points):
+def export_metrics(ledger, cagr, avg, winrate, avg_points, last_signal):
     """Esporta metriche in JSON per web dashboard"""
     
+    pnl = ledger.records['pnl']
     metrics = {
         'last_update': datetime.now().isoformat(),
         'system_info': {
@@ -179,68 +163,94 @@ def export_metrics(df, system, trades, equity, cagr, avg, winrate, avg_points):
             'status': 'LIVE'
         },
         'performance': {
-            'total_trades': len(trades),
-            'winning_trades': (trades['pnl'] > 0).sum() if not trades.empty else 0,
-            'losing_trades': (trades['pnl'] < 0).sum() if not trades.empty else 0,
+            'total_trades': len(ledger),
+            'winning_trades': int((pnl > 0).sum()),
+            'losing_trades': int((pnl < 0).sum()),
             'win_rate': float(winrate * 100) if not pd.isna(winrate) else 0,
             'avg_trade': float(avg * 100) if not pd.isna(avg) else 0,
             'avg_points': float(avg_points) if not pd.isna(avg_points) else 0,
             'cagr': float(cagr * 100) if not pd.isna(cagr) else 0,
-            'total_return': float((system.equity_curve[-1] / system.initial_capital - 1) * 100) if system.equity_curve else 0,
-            'max_drawdown': float(np.max(system.drawdown)) if len(system.drawdown) > 0 else 0
+            'total_return': float((ledger.equity_curve[-1] / ledger.initial_capital - 1) * 100),
+            'max_drawdown': float(ledger.drawdown.max())
         },
-        'equity_curve': [float(x) for x in system.equity_curve[-252:]],  # Ultimi 252 giorni
-        'drawdown_curve': [float(x) for x in system.drawdown[-252:]],
-        'last_signal': 'FLAT',
-        'trades_history': []
+        # Ultimi 252 punti; tolist() converte l'intera vista in un passaggio
+        'equity_curve': ledger.equity_curve[-252:].tolist(),
+        'drawdown_curve': ledger.drawdown[-252:].tolist(),
+        'last_signal': 'LONG' if last_signal else 'FLAT',
+        # Ultime 10 trades
+        'trades_history': ledger.history(10),
     }
     
-    # Ultime 10 trades
-    if not trades.empty:
-        last_trades = trades.tail(10)
-        for idx, (_, trade) in enumerate(last_trades.iterrows()):
-            metrics['trades_history'].append({
-                'date': str(idx.date()),
-                'entry': float(trade['Close']),
-                'exit': float(trade['Open_next']),
-                'pnl_pct': float(trade['pnl'] * 100),
-                'result': trade['result']
-            })
-    
-    # Segnale per oggi
-    if len(df) > 0:
-        last = df.iloc[-1]
-        sig = match_top3(last) and filter_s(last)
-        metrics['last_signal'] = 'LONG' if sig else 'FLAT'
-    
     return metrics
 
-def main():
-    ensure_output_dir()
-    print('[INIT] Caricamento dati...')
-    df = build_dataset()
+# ================= STRATEGIA PER LA PIPELINE =================
+class Top3Strategy(Strategy):
+    """Pattern Top3 overnight con filtro SPY / giorno della settimana."""
+    
+    name = 'quant'
+    start = START_DATE
+    analytics_file = ANALYTICS_FILE
     
-    print('[BACKTEST] Esecuzione backtest...')
-    trades, equity, cagr, avg, winrate, avg_points, avg_raw = run_backtest(df)
+    def sources(self):
+        # Per un indice i prezzi rettificati coincidono con quelli grezzi:
+        # FTSE condiviso con il modello volumi
+        return {
+            'FTSE': ([MAIN_TICKER], ['Open', 'High', 'Low', 'Close', 'Volume'], AUTO_ADJUST, False),
+            'SPY': (['SPY'], ['Close'], False, True),
+            'VIX': (['^VIX'], ['Close'], False, True),
+        }
     
-    print('[SYSTEM] Inizializzazione sistema...')
-    system = System(trades)
+    def dataset(self, market):
+        """OHLCV FTSE (+ SPY/VIX disponibili) con gli indicatori di features()."""
+        d = market.data.iloc[market.since(self.start):]
+        df = pd.DataFrame({c: column(d, f'FTSE_{c}') for c in ['Open', 'High', 'Low', 'Close', 'Volume']},
+                          index=d.index)
+        for name in ('SPY', 'VIX'):
+            if name in market.available:
+                df[f'{name}_Close'] = column(d, f'{name}_Close')
+        df = features(df)
+        # Anche l'ultima barra (Open successivo ignoto) riceve il segnale
+        return df.dropna(subset=[c for c in df.columns if c not in FORWARD_COLUMNS])
     
-    print('[EXPORT] Creazione metriche...')
-    metrics = export_metrics(df, system, trades, equity, cagr, avg, winrate, avg_points)
+    def signal(self, market):
+        df = self.dataset(market)
+        return pd.Series(signal_mask(df), index=df.index).reindex(market.idx, fill_value=False)
     
-    print('[SAVE] Salvataggio JSON...')
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(metrics, f, ensure_ascii=False, indent=2)
+    def metrics(self, market, sig, result):
+        """Contenuto di metrics.json per la dashboard."""
+        a = market.since(self.start)
+        d = market.data.iloc[a:]
+        ret = market.ret_next.iloc[a:].to_numpy()
+        mask = sig.iloc[a:].to_numpy() & ~np.isnan(ret)
+        entry = column(d, 'FTSE_Close')
+        exit_ = np.append(column(d, 'FTSE_Open')[1:], np.nan)
+        ledger = TradeLedger.from_arrays(d.index.values[mask], entry[mask], exit_[mask], ret[mask])
+        avg_points = float((ret[mask] * entry[mask]).mean()) if mask.any() else 0
+        
+        # Rendimenti e winrate dal motore comune (batch_eval)
+        return export_metrics(ledger, result['cagr_%'] / 100, result['avg_trade_%'] / 100,
+                              result['winrate_%'] / 100, avg_points, bool(sig.iloc[-1]))
     
-    print(f'\n=== METRICHE SISTEMA ===')
-    print(f'Trades: {metrics["performance"]["total_trades"]}')
-    print(f'Win rate: {metrics["performance"]["win_rate"]:.2f}%')
-    print(f'CAGR: {metrics["performance"]["cagr"]:.2f}%')
-    print(f'Max DD: {metrics["performance"]["max_drawdown"]:.2f}%')
-    print(f'Ultimo segnale: {metrics["last_signal"]}')
-    print(f'Export: {OUTPUT_FILE}')
-    print(f'Aggiornamento: {metrics["last_update"]}')
+    def export(self, market, sig, result, writer, full):
+        metrics = self.metrics(market, sig, result)
+        ensure_output_dir()
+        # Riscritto solo se i dati cambiano: last_update da solo non conta
+        if not writer.write_json(OUTPUT_FILE, metrics, volatile=('last_update',),
+                                 ensure_ascii=False, indent=2):
+            print('[SAVE] Dati invariati, file non riscritto')
+        
+        print(f'\n=== METRICHE SISTEMA ===')
+        print(f'Trades: {metrics["performance"]["total_trades"]}')
+        print(f'Win rate: {metrics["performance"]["win_rate"]:.2f}%')
+        print(f'CAGR: {metrics["performance"]["cagr"]:.2f}%')
+        print(f'Max DD: {metrics["performance"]["max_drawdown"]:.2f}%')
+        print(f'Ultimo segnale: {metrics["last_signal"]}')
+        print(f'Export: {OUTPUT_FILE}')
+        print(f'Aggiornamento: {metrics["last_update"]}')
+
+def main():
+    """Solo questa strategia; `python pipeline.py` aggiorna tutte le strategie."""
+    run(['quant'])
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+REPLAY — simulazione event-driven delle strategie su barre storiche
+Le barre della matrice allineata (file CSV locale, o lo storico della
+pipeline) arrivano una data alla volta, come da un feed live dopo la
+chiusura. Per ogni barra ogni strategia prende la sua decisione e si emette
+un evento (data, strategia, segnale, latenza della decisione).
+
+Ogni strategia decide in uno di due modi:
+  - streaming: l'oggetto di Strategy.stream() (ModelState per il modello
+    volumi) ingerisce la barra in O(1)
+  - finestra: Strategy.signal() sulle ultime `lookback` barre ricevute;
+    la barra appena arrivata è l'ultima riga, quindi colonne che guardano
+    al futuro (Open successivo, shift(-1)) valgono NaN come dal vivo
+
+Alla fine i segnali emessi si confrontano con il segnale batch calcolato
+su tutta la storia: una differenza indica un look-ahead (la decisione
+batch usa dati che dal vivo non ci sono ancora) o una divergenza tra
+implementazione streaming e batch.
+
+  python replay.py --save-bars bars.csv   # salva lo storico corrente
+  python replay.py --bars bars.csv        # replay da file
+  python replay.py --last 500 --out ev.json
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from pipeline import STRATEGIES, Market, get_strategies, load_market
+
+LOOKBACK = 64            # barre visibili alle decisioni a finestra
+LATENCY_BUDGET_S = 5.0   # tempo massimo per decisione dopo la chiusura
+
+
+class WindowDecider:
+    """Decisione batch sulle sole ultime `lookback` barre ricevute."""
+
+    def __init__(self, strategy, available: list, lookback: int = LOOKBACK):
+        self.strategy = strategy
+        self.start = pd.Timestamp(strategy.start)
+        self.available = available
+        self.columns = None
+        self.dates = deque(maxlen=lookback)
+        self.rows = deque(maxlen=lookback)
+
+    def step(self, date: pd.Timestamp, row: dict) -> None:
+        if self.columns is None:
+            self.columns = list(row)
+        self.dates.append(date)
+        self.rows.append(list(row.values()))
+
+    def decide(self) -> bool:
+        if self.dates[-1] < self.start:
+            return False  # prima dell'inizio della strategia
+        frame = pd.DataFrame(np.array(self.rows), columns=self.columns,
+                             index=pd.DatetimeIndex(self.dates))
+        market = Market(frame, self.available)
+        if not len(market.idx) or market.idx[-1] != self.dates[-1]:
+            return False  # barra senza FTSE valido: nessun segnale
+        return bool(self.strategy.signal(market).iloc[-1])
+
+
+class StreamDecider:
+    """Decisione dall'oggetto streaming della strategia (stato in O(1))."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def step(self, date: pd.Timestamp, row: dict) -> None:
+        if not np.isnan(row.get("FTSE_Close", np.nan)):
+            self.state.step(date, row)
+
+    def decide(self) -> bool:
+        return bool(self.state.signal)
+
+
+def available_sources(data: pd.DataFrame) -> list:
+    """Sorgenti presenti nella matrice (prefissi delle colonne)."""
+    return list(dict.fromkeys(c.rsplit("_", 1)[0] for c in data.columns))
+
+
+def feed(data: pd.DataFrame):
+    """Barre una alla volta: (data, {colonna: valore}) senza le righe successive."""
+    cols = {c: data[c].to_numpy(dtype=float, na_value=np.nan) for c in data.columns}
+    for i, date in enumerate(data.index):
+        yield date, {c: float(v[i]) for c, v in cols.items()}
+
+
+def replay(data: pd.DataFrame, strategies: list, lookback: int = LOOKBACK,
+           last: int | None = None, window: bool = False):
+    """
+    Genera un evento per barra e strategia: {"date", "strategy", "signal",
+    "latency_s"}. Le barre prima delle ultime `last` servono solo a
+    scaldare gli stati (nessun evento). `window` forza la decisione a
+    finestra anche per le strategie con versione streaming.
+    """
+    available = available_sources(data)
+    market = Market(data, available)
+    deciders = {}
+    for st in strategies:
+        state = None if window else st.stream(market)
+        deciders[st.name] = (StreamDecider(state) if state is not None
+                             else WindowDecider(st, available, lookback))
+    first = 0 if last is None else max(0, len(data) - last)
+    for i, (date, row) in enumerate(feed(data)):
+        for name, d in deciders.items():
+            t0 = time.perf_counter()
+            d.step(date, row)
+            if i < first:
+                continue
+            sig = d.decide()
+            yield {"date": date, "strategy": name, "signal": sig,
+                   "latency_s": time.perf_counter() - t0}
+
+
+def verify(data: pd.DataFrame, strategies: list, events: list,
+           budget: float = LATENCY_BUDGET_S) -> dict:
+    """Per strategia: segnali emessi vs batch su tutta la storia e latenze."""
+    market = Market(data, available_sources(data))
+    out = {}
+    for st in strategies:
+        ev = [e for e in events if e["strategy"] == st.name]
+        batch = st.signal(market).reindex(data.index, fill_value=False)
+        lat = np.array([e["latency_s"] for e in ev])
+        diff = [str(e["date"].date()) for e in ev if e["signal"] != bool(batch.loc[e["date"]])]
+        out[st.name] = {
+            "bars": len(ev),
+            "long": sum(e["signal"] for e in ev),
+            "mismatches": len(diff),
+            "first_mismatches": diff[:10],
+            "latency_ms_p50": float(np.median(lat) * 1e3) if len(lat) else 0.0,
+            "latency_ms_p99": float(np.quantile(lat, 0.99) * 1e3) if len(lat) else 0.0,
+            "latency_ms_max": float(lat.max() * 1e3) if len(lat) else 0.0,
+            "within_budget": bool(len(lat) == 0 or lat.max() <= budget),
+        }
+    return out
+
+
+def load_bars(path: str) -> pd.DataFrame:
+    return pd.read_csv(path, index_col=0, parse_dates=True)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Replay event-driven delle strategie")
+    ap.add_argument("--bars", default=None, help="CSV della matrice allineata (default: storico della pipeline)")
+    ap.add_argument("--save-bars", default=None, help="salva lo storico corrente in CSV ed esce")
+    ap.add_argument("--strategy", action="append", choices=list(STRATEGIES))
+    ap.add_argument("--last", type=int, default=None, help="eventi solo per le ultime N barre")
+    ap.add_argument("--lookback", type=int, default=LOOKBACK)
+    ap.add_argument("--window", action="store_true", help="decisioni a finestra anche per le strategie streaming")
+    ap.add_argument("--budget", type=float, default=LATENCY_BUDGET_S, help="latenza massima per decisione (s)")
+    ap.add_argument("--out", default=None, help="file JSON degli eventi")
+    args = ap.parse_args()
+
+    strategies = get_strategies(args.strategy)
+    if args.bars:
+        data = load_bars(args.bars)
+    else:
+        data = load_market(strategies).data
+    if args.save_bars:
+        data.to_csv(args.save_bars)
+        print(f"[OK] {len(data)} barre salvate in {args.save_bars}")
+        sys.exit(0)
+
+    print(f"[INFO] Replay di {len(data)} barre: {data.index[0].date()} -> {data.index[-1].date()}")
+    events = list(replay(data, strategies, args.lookback, args.last, args.window))
+    report = verify(data, strategies, events, args.budget)
+    ok = True
+    for name, r in report.items():
+        good = r["mismatches"] == 0 and r["within_budget"]
+        ok = ok and good
+        print(f"[{'OK' if good else 'FAIL'}] {name}: {r['bars']} barre, {r['long']} LONG, "
+              f"{r['mismatches']} differenze dal batch, latenza p50 {r['latency_ms_p50']:.2f}ms "
+              f"p99 {r['latency_ms_p99']:.2f}ms max {r['latency_ms_max']:.2f}ms")
+        if r["first_mismatches"]:
+            print(f"       prime differenze: {', '.join(r['first_mismatches'])}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"summary": report,
+                       "events": [dict(e, date=str(e["date"].date())) for e in events]}, f, indent=2)
+        print(f"[OK] Eventi salvati in {args.out}")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+SCREEN — pattern volumi su un universo ampio di titoli
+Per ogni titolo dell'universo (TICKERS, o un CSV "nome,ticker[,fallback...]"
+con --universe, es. tutti i titoli del FTSE MIB) valuta come strategia a sé
+il segnale Volume <= fattore * media AND filtro SPX, più l'OR di tutto
+l'universo con il pattern FTSE (la forma del modello congelato).
+
+I volumi sono una matrice date × titoli: le condizioni di tutti i titoli
+sono una sola operazione 2-D (pattern_masks) e le metriche di tutte le
+colonne un solo passaggio di batch_eval, quindi centinaia di titoli
+costano poco più di uno.
+
+  python screen.py --universe ftsemib.csv --sort sharpe --top 20 --out screen.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from Nearer_My_God_to_Thee_2 import (AUTO_ADJUST, FALLBACK_TICKERS, MAIN_TICKER, SPX_COLUMNS,
+                                     SPX_TICKER, STOCK_COLUMNS, TICKERS, VOL_MA10_FACTOR,
+                                     column, load_universe, pattern_masks)
+from batch_eval import METRICS, eval_next_open_batch
+from pipeline import Strategy, load_market
+
+ALL = "UNIVERSO (OR + FTSE)"
+
+
+class UniverseStrategy(Strategy):
+    """Sorgenti dello screen: volumi dell'universo, FTSE e SPX."""
+
+    name = "screen"
+
+    def __init__(self, tickers: dict | None = None, fallback: dict | None = None):
+        self.tickers = TICKERS if tickers is None else tickers
+        self.fallback = FALLBACK_TICKERS if fallback is None else fallback
+
+    def sources(self) -> dict:
+        out = {"FTSE": ([MAIN_TICKER], ["Open", "Close", "Volume"], AUTO_ADJUST, False)}
+        for name, ticker in self.tickers.items():
+            out[name] = ([ticker] + self.fallback.get(name, []), STOCK_COLUMNS, AUTO_ADJUST, True)
+        out["SPX"] = ([SPX_TICKER], SPX_COLUMNS, AUTO_ADJUST, False)
+        return out
+
+
+def screen(data: pd.DataFrame, names: list, window: int = 10, factor: float = VOL_MA10_FACTOR,
+           spx_threshold: float = 0.0) -> pd.DataFrame:
+    """
+    Metriche (eval_next_open) per titolo e per l'OR dell'universo con il
+    pattern FTSE, tutte filtrate con SPX_ret >= spx_threshold (%).
+    """
+    masks = pattern_masks(data, [(n, window, factor) for n in names + ["FTSE"]])
+    spx_ret = pd.Series(column(data, "SPX_Close")).pct_change(fill_method=None).to_numpy() * 100.0
+    with np.errstate(invalid="ignore"):
+        spx_ok = spx_ret >= spx_threshold
+    sig = np.column_stack([masks[:, :-1], masks.any(axis=1)]) & spx_ok[:, None]
+
+    close = column(data, "FTSE_Close")
+    ret_next = np.append(column(data, "FTSE_Open")[1:] / close[:-1], np.nan) - 1.0
+    res = eval_next_open_batch(ret_next, sig, data.index)
+    out = pd.DataFrame({k: res[k] for k in METRICS}, index=pd.Index(names + [ALL], name="titolo"))
+    out["days_%"] = sig.mean(axis=0) * 100.0
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Screen del pattern volumi su un universo di titoli")
+    ap.add_argument("--universe", default=None, help='CSV "nome,ticker[,fallback...]" (default TICKERS)')
+    ap.add_argument("--window", type=int, default=10)
+    ap.add_argument("--factor", type=float, default=VOL_MA10_FACTOR)
+    ap.add_argument("--spx-threshold", type=float, default=0.0)
+    ap.add_argument("--sort", default="sharpe", choices=METRICS)
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--out", default=None, help="CSV dei risultati")
+    args = ap.parse_args()
+
+    tickers, fallback = load_universe(args.universe) if args.universe else (None, None)
+    strategy = UniverseStrategy(tickers, fallback)
+    market = load_market([strategy])
+    names = [n for n in strategy.tickers if n in market.available]
+    print(f"[INFO] Universo: {len(names)} titoli con dati su {len(strategy.tickers)}")
+
+    res = screen(market.data, names, args.window, args.factor, args.spx_threshold)
+    res = res.sort_values(args.sort, ascending=False)
+    pd.set_option("display.width", 200)
+    print(f"\n=== SCREEN VOLUMI MA{args.window} <= {args.factor:g} (top {args.top} per {args.sort}) ===")
+    print(res.head(args.top).to_string(float_format=lambda x: f"{x:.3f}"))
+    print(f"\n{ALL}:\n{res.loc[ALL].to_string()}")
+    if args.out:
+        res.to_csv(args.out)
+        print(f"[OK] Risultati salvati in {args.out}")
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+SIGNAL SERVICE — servizio HTTP locale con segnale, equity e metriche in memoria
+Alternativa opzionale ai JSON statici per gli strumenti che interrogano
+spesso il modello: dataset e risultati di run_model restano in memoria e
+le risposte sono già serializzate (corpo + ETag) per ogni versione dei
+dati, quindi una richiesta non ricalcola il modello e non legge file.
+
+Un thread in background rilegge i prezzi ogni `--refresh` secondi (store
+locale: da Yahoo arrivano solo le barre nuove) e ricalcola solo se la
+matrice allineata è cambiata (barre nuove o riviste); le medie mobili
+vengono dal feature store, quindi anche allora si ricalcola solo la coda.
+
+Endpoint (GET, JSON, ETag + If-None-Match => 304, Cache-Control: no-cache):
+  /signal                               come signals.json
+  /metrics                              metriche di eval_next_open + max_dd/cagr
+  /equity?from=YYYY-MM-DD&to=YYYY-MM-DD equity base 1 (estremi inclusi, opzionali)
+  /health                               versione dei dati e ora dell'ultimo controllo
+
+  python signal_service.py --port 8765 --refresh 300
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from Nearer_My_God_to_Thee_2 import METRICS, fetch_data, model_results
+from equity_calculator import compute_equity_from_daily_returns, compute_metrics_from_equity
+from update_site import signal_payload
+
+HOST = "127.0.0.1"
+PORT = 8765
+REFRESH_S = 300.0
+RANGE_CACHE = 256   # risposte /equity per intervallo tenute in memoria
+
+
+def _response(payload) -> tuple[bytes, str]:
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return body, f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def fingerprint(data: pd.DataFrame) -> str:
+    """Hash di date e valori della matrice: cambia solo con barre nuove o riviste."""
+    h = hashlib.blake2b(digest_size=12)
+    h.update(data.index.values.astype("datetime64[ns]").view("int64").tobytes())
+    h.update(np.ascontiguousarray(data.to_numpy(dtype=float, na_value=np.nan)).tobytes())
+    h.update(",".join(data.columns).encode())
+    return h.hexdigest()
+
+
+class Snapshot:
+    """Risultati di una versione dei dati, con le risposte già serializzate."""
+
+    def __init__(self, version: str, data: pd.DataFrame, used: list):
+        res = model_results(data, used)
+        m = res["metrics"]
+        equity = compute_equity_from_daily_returns(m["daily_returns"])
+        equity.index = res["idx"]
+        eq_metrics = compute_metrics_from_equity(equity)
+        last = res["idx"][-1]
+
+        self.version = version
+        self.last_date = str(last.date())
+        self.dates = equity.index
+        self.date_strings = [str(d.date()) for d in equity.index]
+        self.values = equity.to_numpy()
+        metrics = {k: float(m[k]) for k in METRICS}
+        metrics.update(n_trades=int(m["n_trades"]), **{k: float(v) for k, v in eq_metrics.items()})
+        self.responses = {
+            "/signal": _response(signal_payload(last, bool(res["sig_final"].iloc[-1]), m, eq_metrics)),
+            "/metrics": _response({"ultima_data": self.last_date, "titoli": used, **metrics}),
+        }
+        self.ranges = OrderedDict()
+        self._lock = threading.Lock()
+
+    def equity(self, start: str | None, end: str | None) -> tuple[bytes, str]:
+        """Equity tra `start` e `end` (inclusi); risposte in un piccolo LRU."""
+        key = (start, end)
+        with self._lock:
+            if key in self.ranges:
+                self.ranges.move_to_end(key)
+                return self.ranges[key]
+        a = 0 if start is None else int(self.dates.searchsorted(pd.Timestamp(start)))
+        b = len(self.dates) if end is None else int(self.dates.searchsorted(pd.Timestamp(end), "right"))
+        out = _response({"from": start, "to": end, "dates": self.date_strings[a:b],
+                         "equity": self.values[a:b].tolist()})
+        with self._lock:
+            self.ranges[key] = out
+            if len(self.ranges) > RANGE_CACHE:
+                self.ranges.popitem(last=False)
+        return out
+
+
+class SignalModel:
+    """Modello in memoria; `refresh()` ricalcola solo se i dati sono cambiati."""
+
+    def __init__(self, fetch=fetch_data):
+        self.fetch = fetch
+        self.snapshot = None
+        self.checked = None
+        self.computed = 0
+        self._lock = threading.Lock()
+
+    def refresh(self) -> bool:
+        """True se è stata calcolata una nuova versione."""
+        with self._lock:
+            data, used = self.fetch()
+            data = data.dropna(subset=["FTSE_Close"]).copy()
+            if len(data) == 0:
+                raise SystemExit("Nessuna data valida dopo merge.")
+            version = fingerprint(data)
+            self.checked = datetime.now().isoformat(timespec="seconds")
+            if self.snapshot is not None and self.snapshot.version == version:
+                return False
+            # Il nuovo snapshot sostituisce il vecchio in un'unica assegnazione
+            self.snapshot = Snapshot(version, data, used)
+            self.computed += 1
+            return True
+
+    def loop(self, every: float, stop: threading.Event) -> None:
+        while not stop.wait(every):
+            try:
+                if self.refresh():
+                    print(f"[INFO] Nuova versione dei dati: ultima data {self.snapshot.last_date}")
+            except (Exception, SystemExit) as e:
+                print(f"[WARN] Aggiornamento fallito ({e}), continuo con i dati in memoria")
+
+
+class Handler(BaseHTTPRequestHandler):
+    server_version = "FTSEMIBSignal/1.0"
+    protocol_version = "HTTP/1.1"  # keep-alive: niente nuova connessione per richiesta
+    disable_nagle_algorithm = True  # intestazioni e corpo senza attese di Nagle
+    model: SignalModel = None
+    verbose = False
+
+    def _send(self, status: int, body: bytes = b"", etag: str | None = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Cache-Control", "no-cache")
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _error(self, status: int, message: str) -> None:
+        self._send(status, json.dumps({"error": message}).encode("utf-8"))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        snap = self.model.snapshot
+        if url.path == "/health":
+            body, _ = _response({"version": snap.version if snap else None,
+                                 "ultima_data": snap.last_date if snap else None,
+                                 "checked": self.model.checked, "computed": self.model.computed})
+            return self._send(200, body)
+        if snap is None:
+            return self._error(503, "dati non ancora disponibili")
+        if url.path == "/equity":
+            q = parse_qs(url.query)
+            start, end = q.get("from", [None])[0], q.get("to", [None])[0]
+            try:
+                body, etag = snap.equity(start, end)
+            except ValueError:
+                return self._error(400, "date non valide (YYYY-MM-DD)")
+        elif url.path in snap.responses:
+            body, etag = snap.responses[url.path]
+        else:
+            return self._error(404, f"endpoint sconosciuto: {url.path}")
+        if etag in (t.strip() for t in self.headers.get("If-None-Match", "").split(",")):
+            return self._send(304, etag=etag)
+        self._send(200, body, etag)
+
+    def log_message(self, fmt, *args):
+        if self.verbose:
+            super().log_message(fmt, *args)
+
+
+def serve(host: str = HOST, port: int = PORT, refresh: float = REFRESH_S,
+          model: SignalModel | None = None, verbose: bool = False) -> ThreadingHTTPServer:
+    """Carica il modello, avvia l'aggiornamento periodico e restituisce il server (da avviare)."""
+    model = model or SignalModel()
+    t0 = time.perf_counter()
+    model.refresh()
+    print(f"[INFO] Modello caricato in {time.perf_counter() - t0:.2f}s, "
+          f"ultima data {model.snapshot.last_date}")
+    handler = type("BoundHandler", (Handler,), {"model": model, "verbose": verbose})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.stop_refresh = threading.Event()
+    threading.Thread(target=model.loop, args=(refresh, server.stop_refresh), daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Servizio HTTP locale di segnale, equity e metriche")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--refresh", type=float, default=REFRESH_S, help="secondi tra i controlli dei dati")
+    ap.add_argument("--verbose", action="store_true", help="log di ogni richiesta")
+    args = ap.parse_args()
+
+    server = serve(args.host, args.port, args.refresh, verbose=args.verbose)
+    print(f"[OK] In ascolto su http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop_refresh.set()
+        server.server_close()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+SWEEP — grid search sul modello volumi di "Nearer My God to Thee 2"
+Parametri esplorati:
+  - fattore e finestra MA "lunga" (VOL_MA10_FACTOR, 10) per tutti i titoli e FTSE
+  - fattore e finestra MA "corta" (VOL_MA5_FACTOR, 5) del pattern PIRELLI
+  - soglia SPX_ret (%)
+  - sottoinsiemi di TICKERS nell'OR (FTSE è sempre incluso)
+
+Le medie mobili dei volumi si calcolano una sola volta per finestra come
+matrice date × titoli; per ogni (finestra, fattore) le condizioni dei
+titoli vengono impacchettate in un intero per riga, così l'OR su qualsiasi
+sottoinsieme è un AND bit a bit. Le metriche sono calcolate a blocchi da
+batch_eval su matrici configurazioni × date.
+"""
+
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import Nearer_My_God_to_Thee_2 as model
+from batch_eval import span_years, eval_rows
+from feature_store import feature
+from indicators import rolling_mean
+
+# ================= GRIGLIA DI DEFAULT =================
+GRID_FACTORS_LONG  = np.round(np.arange(0.60, 1.01, 0.05), 2)
+GRID_FACTORS_SHORT = np.round(np.arange(0.60, 1.01, 0.05), 2)
+GRID_WINDOWS_LONG  = (10,)
+GRID_WINDOWS_SHORT = (5,)
+GRID_SPX_THRESHOLDS = (-0.5, -0.25, 0.0, 0.25, 0.5)
+
+CHUNK = 2048  # configurazioni valutate per blocco (limita la memoria)
+
+SHORT_PATTERN = "PIRELLI"  # unico titolo con il pattern MA corta
+
+
+def load_data() -> tuple[pd.DataFrame, list]:
+    """Dati del modello (letti dalla cache prezzi) con timeline FTSE valida."""
+    data, used = model.fetch_data()
+    return data.dropna(subset=["FTSE_Close"]).copy(), used
+
+
+def all_subsets(names: list) -> list[tuple]:
+    """Tutti i sottoinsiemi di `names` (incluso quello vuoto: solo FTSE)."""
+    return [c for r in range(len(names) + 1) for c in itertools.combinations(names, r)]
+
+
+def _rolling_means(vol: np.ndarray, windows, index: pd.DatetimeIndex) -> dict[int, np.ndarray]:
+    # Stesse medie di vol_ma_le_factor, tutte le colonne in un passaggio (feature store)
+    return {w: feature("rolling_mean", rolling_mean, index, [vol], {"window": w}, lookback=w)
+            for w in sorted(set(windows))}
+
+
+def _pack(vol: np.ndarray, ma: np.ndarray, factor: float) -> np.ndarray:
+    """Condizioni vol <= factor * ma dei K titoli, bit k -> colonna k."""
+    with np.errstate(invalid="ignore"):
+        cond = vol <= factor * ma
+    weights = np.left_shift(np.uint64(1), np.arange(vol.shape[1], dtype=np.uint64))
+    return (cond.astype(np.uint64) * weights).sum(axis=1, dtype=np.uint64)
+
+
+def _run_blocks(blocks, codes, spx_ok, subset_masks, ret_next, years, chunk, with_slope=True):
+    """
+    Valuta i blocchi (chiave, codice per riga). Ogni blocco produce
+    n_subset × n_soglie configurazioni; si accumulano fino a `chunk`.
+    """
+    n_cfg = len(subset_masks) * spx_ok.shape[0]
+    out, buf, keys = [], [], []
+
+    def flush():
+        if not buf:
+            return
+        m = eval_rows(ret_next, np.concatenate(buf, axis=0), years, with_slope=with_slope)
+        out.append((list(keys), m))
+        buf.clear()
+        keys.clear()
+
+    for key in blocks:
+        sig_or = (subset_masks[:, None] & codes[key][None, :]) != 0         # S × T
+        sig = (sig_or[:, None, :] & spx_ok[None, :, :]).reshape(n_cfg, len(ret_next))
+        buf.append(sig)
+        keys.append(key)
+        if len(keys) * n_cfg >= chunk:
+            flush()
+    flush()
+    return out
+
+
+def prepare(data: pd.DataFrame,
+            used: list,
+            factors_long=GRID_FACTORS_LONG,
+            factors_short=GRID_FACTORS_SHORT,
+            windows_long=GRID_WINDOWS_LONG,
+            windows_short=GRID_WINDOWS_SHORT,
+            spx_thresholds=GRID_SPX_THRESHOLDS,
+            subsets=None) -> dict:
+    """
+    Matrici della griglia su tutta la storia (tutte causali):
+      keys, codes   chiavi (wl, fl, ws, fs) e codici impacchettati (chiavi × date, uint64)
+      subsets, subset_masks, thresholds, spx_ok (soglie × date), ret_next (date)
+    Configurazione g = (k * n_subset + s) * n_soglie + h, come in _run_blocks.
+    """
+    names = list(used)
+    if len(names) > 62:
+        raise ValueError("Griglia limitata a 62 titoli (codici uint64): per universi ampi usa screen.py")
+    short_bit = len(names) + 1  # bit 0..K-1 titoli, bit K FTSE, bit K+1 MA corta
+    vol = np.column_stack(
+        [model.column(data, f"{n}_Volume") for n in names] + [model.column(data, "FTSE_Volume")]
+    )
+
+    ma = _rolling_means(vol, list(windows_long) + list(windows_short), data.index)
+    short_col = names.index(SHORT_PATTERN) if SHORT_PATTERN in names else None
+
+    keys, codes = [], []
+    for wl, fl in itertools.product(windows_long, factors_long):
+        base = _pack(vol, ma[wl], fl)
+        for ws, fs in itertools.product(windows_short, factors_short):
+            if short_col is None:
+                code = base
+            else:
+                c5 = _pack(vol[:, [short_col]], ma[ws][:, [short_col]], fs)
+                code = base | (c5 << np.uint64(short_bit))
+            keys.append((wl, fl, ws, fs))
+            codes.append(code)
+
+    if subsets is None:
+        subsets = all_subsets(names)
+    subsets = [tuple(s) for s in subsets]
+    subset_masks = np.zeros(len(subsets), dtype=np.uint64)
+    for i, sub in enumerate(subsets):
+        m = 1 << len(names)  # FTSE sempre nell'OR
+        for n in sub:
+            if n in names:
+                m |= 1 << names.index(n)
+        if SHORT_PATTERN in sub and short_col is not None:
+            m |= 1 << short_bit
+        subset_masks[i] = m
+
+    spx_ret = pd.Series(model.column(data, "SPX_Close")).pct_change(fill_method=None).to_numpy() * 100.0
+    thresholds = np.asarray(spx_thresholds, float)
+    with np.errstate(invalid="ignore"):
+        spx_ok = thresholds[:, None] <= spx_ret[None, :]                # soglie × T
+
+    o, c = model.column(data, "FTSE_Open"), model.column(data, "FTSE_Close")
+    return {
+        "keys": keys,
+        "codes": np.array(codes, dtype=np.uint64).reshape(len(keys), len(data)),
+        "subsets": subsets,
+        "subset_masks": subset_masks,
+        "thresholds": thresholds,
+        "spx_ok": spx_ok,
+        "ret_next": np.append(o[1:], np.nan) / c - 1.0,
+    }
+
+
+def params_frame(keys: list, subsets: list, thresholds) -> pd.DataFrame:
+    """Parametri delle configurazioni di `keys`, nell'ordine di _run_blocks."""
+    return pd.DataFrame(
+        [(wl, fl, ws, fs, "+".join(sub) or "-", thr)
+         for (wl, fl, ws, fs) in keys for sub in subsets for thr in thresholds],
+        columns=["ma_long", "factor_long", "ma_short", "factor_short", "tickers", "spx_thr_%"],
+    )
+
+
+def sweep(data: pd.DataFrame,
+          used: list,
+          factors_long=GRID_FACTORS_LONG,
+          factors_short=GRID_FACTORS_SHORT,
+          windows_long=GRID_WINDOWS_LONG,
+          windows_short=GRID_WINDOWS_SHORT,
+          spx_thresholds=GRID_SPX_THRESHOLDS,
+          subsets=None,
+          chunk: int = CHUNK,
+          workers: int = 0) -> pd.DataFrame:
+    """
+    Valuta tutte le combinazioni e restituisce un DataFrame con una riga
+    per configurazione (parametri + metriche). `subsets` è una lista di
+    tuple di nomi di TICKERS (default: tutti i sottoinsiemi di `used`);
+    `workers` > 1 distribuisce i blocchi su un pool di processi.
+    """
+    g = prepare(data, used, factors_long, factors_short, windows_long, windows_short,
+                spx_thresholds, subsets)
+    codes = dict(zip(g["keys"], g["codes"]))
+    years = span_years(data.index)
+
+    blocks = g["keys"]
+    args = (codes, g["spx_ok"], g["subset_masks"], g["ret_next"], years, chunk)
+    if workers and workers > 1:
+        parts = [blocks[i::workers] for i in range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = [r for res in pool.map(_run_blocks, parts, *[[a] * workers for a in args])
+                       for r in res]
+    else:
+        results = _run_blocks(blocks, *args)
+
+    frames = []
+    for keys, m in results:
+        params = params_frame(keys, g["subsets"], g["thresholds"])
+        frames.append(pd.concat([params, pd.DataFrame(m)], axis=1))
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    data, used = load_data()
+    res = sweep(data, used)
+    print(f"\n=== SWEEP: {len(res)} configurazioni ===")
+    top = res[res["n_trades"] >= 100].sort_values("sharpe", ascending=False).head(20)
+    print(top.to_string(index=False))
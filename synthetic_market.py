@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+SYNTHETIC MARKET — mercato OHLCV sintetico e deterministico per test offline
+Genera serie giornaliere per tutti i ticker usati dai modelli (FTSE, titoli
+del paniere, ^GSPC, SPY, ^VIX) su due calendari distinti (Borsa Italiana e
+NYSE, con festività non allineate) e con una quota di barre mancanti per
+ticker. `install()` sostituisce lo store prezzi condiviso con uno che legge
+da questo mercato, così tutta la pipeline gira senza rete.
+"""
+
+import tempfile
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import price_store
+
+MILAN_TICKERS = ["FTSEMIB.MI", "PST.MI", "UNI.MI", "PIRC.MI", "STLAM.MI", "STLA.MI",
+                 "IG.MI", "ENEL.MI", "NEXI.MI"]
+NYSE_TICKERS = ["^GSPC", "SPY", "^VIX"]
+
+# Festività fisse (mese, giorno) dei due calendari
+MILAN_HOLIDAYS = [(1, 1), (4, 25), (5, 1), (8, 15), (12, 24), (12, 25), (12, 26), (12, 31)]
+NYSE_HOLIDAYS = [(1, 1), (1, 19), (2, 16), (5, 25), (6, 19), (7, 4), (9, 7), (11, 26), (12, 25)]
+PROVISIONAL_MOVE = 0.002  # scarto della chiusura provvisoria da quella definitiva
+
+
+def trading_days(start: str, end: str, holidays: list) -> pd.DatetimeIndex:
+    days = pd.bdate_range(start, end)
+    md = list(zip(days.month, days.day))
+    return days[[d not in holidays for d in md]]
+
+
+def _seed(seed: int, ticker: str) -> int:
+    return (seed * 1_000_003 + zlib.crc32(ticker.encode())) & 0xFFFFFFFF
+
+
+def synthetic_ohlcv(ticker: str, days: pd.DatetimeIndex, seed: int = 0,
+                    missing_rate: float = 0.02) -> pd.DataFrame:
+    """Random walk log-normale con gap overnight e volumi interi."""
+    rng = np.random.default_rng(_seed(seed, ticker))
+    n = len(days)
+    vix = ticker == "^VIX"
+    vol = 0.05 if vix else 0.012
+    drift = 0.0 if vix else 0.0003
+    r = rng.normal(drift, vol, n)
+    if vix:
+        # AR(1) sul log-livello: volatilità che torna verso 20
+        x = np.empty(n)
+        acc = 0.0
+        for i in range(n):
+            acc = 0.97 * acc + r[i]
+            x[i] = acc
+        close = 20.0 * np.exp(x)
+    else:
+        close = 100.0 * np.exp(np.cumsum(r))
+    open_ = close * np.exp(rng.normal(0.0, vol / 3, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, vol / 4, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, vol / 4, n)))
+    volume = np.round(rng.lognormal(14.0, 0.4, n)) if not vix else np.zeros(n)
+    df = pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume},
+                      index=days)
+    if missing_rate > 0:
+        df = df[rng.random(n) >= missing_rate]
+    return df
+
+
+class SyntheticMarket:
+    """Insieme di serie sintetiche, usabile come fetcher di PriceStore."""
+
+    def __init__(self, years: int = 26, end: str = "2025-10-15", seed: int = 0,
+                 missing_rate: float = 0.02, extra_tickers: list | None = None,
+                 unavailable: tuple = ("STLAM.MI",), provisional: tuple = ()):
+        end_ts = pd.Timestamp(end)
+        start = (end_ts - pd.DateOffset(years=years)).strftime("%Y-%m-%d")
+        self.milan = trading_days(start, end, MILAN_HOLIDAYS)
+        self.nyse = trading_days(start, end, NYSE_HOLIDAYS)
+        self.unavailable = set(unavailable)
+        # Ticker la cui barra alla "data odierna" è ancora in corso (es. ^GSPC
+        # alle 16:30 UTC): Close diverso da quello che arriverà il giorno dopo
+        self.provisional = set(provisional)
+        self.frames = {}
+        for t in MILAN_TICKERS + list(extra_tickers or []):
+            # L'indice non ha buchi: è la timeline principale
+            rate = 0.0 if t == "FTSEMIB.MI" else missing_rate
+            self.frames[t] = synthetic_ohlcv(t, self.milan, seed, rate)
+        for t in NYSE_TICKERS:
+            self.frames[t] = synthetic_ohlcv(t, self.nyse, seed, 0.0)
+        self.end = end_ts
+        self.calls = 0
+
+    def __call__(self, ticker: str, start: str, auto_adjust: bool) -> pd.DataFrame | None:
+        self.calls += 1
+        if ticker in self.unavailable or ticker not in self.frames:
+            return None
+        df = self.frames[ticker]
+        out = df[(df.index >= pd.Timestamp(start)) & (df.index <= self.end)].copy()
+        if ticker in self.provisional and len(out) and out.index[-1] == self.end:
+            out.iloc[-1, out.columns.get_loc("Close")] *= 1.0 + PROVISIONAL_MOVE
+        return out
+
+    def truncate(self, end) -> None:
+        """Sposta la "data odierna" del mercato (simula l'arrivo di nuove barre)."""
+        self.end = pd.Timestamp(end)
+
+
+def install(market: SyntheticMarket | None = None, root: str | None = None) -> SyntheticMarket:
+    """Sostituisce lo store prezzi condiviso con uno alimentato da `market`."""
+    market = market or SyntheticMarket()
+    price_store.set_default_store(price_store.PriceStore(root or tempfile.mkdtemp(), market))
+    return market
+
+
+def synthetic_intraday(daily: pd.DataFrame, seed: int = 0, open_: str = "09:00",
+                       close: str = "17:30", step: str = "1min") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Barre intraday (ts int64 in ora locale, OHLCV) coerenti con `daily`:
+    prezzo fermo all'Open nei primi 15 minuti e al Close negli ultimi 5,
+    lineare in mezzo. I VWAP di quelle finestre danno i prezzi daily.
+    """
+    rng = np.random.default_rng(seed)
+    t0, t1 = (pd.Timedelta(f"{x}:00").value for x in (open_, close))
+    tod = np.arange(t0, t1, pd.Timedelta(step).value)
+    a, b = t0 + pd.Timedelta("15min").value, t1 - pd.Timedelta("5min").value
+    w = np.clip((tod - a) / (b - a), 0.0, 1.0)
+    o = daily["Open"].to_numpy(float)[:, None]
+    c = daily["Close"].to_numpy(float)[:, None]
+    price = (o + (c - o) * w).ravel()
+    days = daily.index.values.astype("datetime64[ns]").view(np.int64)
+    ts = (days[:, None] + tod).ravel()
+    volume = np.round(rng.lognormal(8.0, 0.5, len(ts)))
+    return ts, np.column_stack([price, price, price, price, volume])
@@ -1,46 +1,44 @@
-
 """
 update_site.py
 Esegue il modello "Nearer_My_God_to_Thee_2", calcola equity normalizzata (base=1),
 e aggiorna i file JSON usati dal sito statico:
- - equity.json
+ - equity.json + equity/<anno>.json (formato compatto, vedi equity_export.py)
  - signals.json
-Pensato per essere eseguito da GitHub Actions ogni giorno alle 17:30 italiane.
+Gira dentro pipeline.py (VolumeStrategy), che il workflow GitHub Actions
+esegue ogni giorno alle 17:30 italiane insieme alle altre strategie.
+
+Modalità:
+ - incrementale (default se model_state.json è valido): ingerisce solo le
+   barre successive al checkpoint (ultima barra confermata), rielabora le
+   ultime REFRESH_BARS barre che lo store riscarica e riscrive solo il
+   blocco equity dell'anno corrente
+ - completa (--full, o stato assente/incoerente): riesegue tutto il modello
+   e ricostruisce lo stato
+In entrambe le modalità, quando c'è il modello batch (pipeline.py),
+signals.json pubblica il suo segnale e le sue metriche; lo stato deve
+coincidere (ModelState.verify), altrimenti il job fallisce.
 """
 
-import json
+import argparse
+import os
+
 import pandas as pd
-from Nearer_My_God_to_Thee_2 import run_model
+from Nearer_My_God_to_Thee_2 import (AUTO_ADJUST, FALLBACK_TICKERS, FTSE_COLUMNS, MAIN_TICKER,
+                                     SPX_COLUMNS, SPX_TICKER, STOCK_COLUMNS, TICKERS, build_signal,
+                                     fetch_data, run_model, volume_conditions)
 from equity_calculator import compute_equity_from_daily_returns, compute_metrics_from_equity
+from equity_export import append_equity, last_date as equity_last_date, write_equity
+from model_state import ModelState, split_confirmed
+from instrumentation import span
+from pipeline import Strategy, run
 
-def main():
-    res = run_model()
-    data = res["data"]
-    idx = res["idx"]
-    sig_final = res["sig_final"]
-    metrics = res["metrics"]
-    daily_returns = metrics.get("daily_returns")
-
-    # Ricostruisci equity normalizzata base=1 dai daily_returns
-    equity_series = compute_equity_from_daily_returns(daily_returns)
-    equity_series.index = idx  # allinea a idx principale
-
-    # Salva equity.json per Plotly
-    equity_payload = [
-        {"date": str(d.date()), "equity": float(e)}
-        for d, e in zip(equity_series.index, equity_series.values)
-    ]
-    with open("equity.json", "w", encoding="utf-8") as f:
-        json.dump(equity_payload, f, indent=2)
-
-    # Ultimo segnale
-    last_date = idx[-1]
-    last_signal = bool(sig_final.loc[last_date])
+SIGNALS_FILE = "signals.json"
+# File .gz/.br precompressi accanto ai JSON equity
+PRECOMPRESS = os.environ.get("FTSEMIB_PRECOMPRESS", "") == "1"
 
-    # Metriche compatte per il front-end
-    eq_metrics = compute_metrics_from_equity(equity_series)
-
-    signal_payload = {
+def signal_payload(last_date, last_signal, metrics, eq_metrics) -> dict:
+    """Contenuto di signals.json (anche per signal_service.py)."""
+    return {
         "ultima_data": str(last_date.date()),
         "signal": "LONG" if last_signal else "NONE",
         "n_trades": int(metrics.get("n_trades", 0)),
@@ -51,10 +49,138 @@ def main():
         "max_dd_%": float(eq_metrics.get("max_dd_%", 0.0)),
         "cagr_%": float(eq_metrics.get("cagr_%", 0.0)),
     }
-    with open("signals.json", "w", encoding="utf-8") as f:
-        json.dump(signal_payload, f, indent=2)
 
-    print("[OK] equity.json e signals.json aggiornati.")
+def write_signals(writer, last_date, last_signal, metrics, eq_metrics, path=SIGNALS_FILE):
+    writer.write_json(path, signal_payload(last_date, last_signal, metrics, eq_metrics), indent=2)
+
+def batch_metrics(metrics: dict, idx) -> dict:
+    """
+    Metriche pubblicate dal modello batch: quelle di eval_next_open, con
+    max drawdown e CAGR dall'equity normalizzata.
+    """
+    equity_series = compute_equity_from_daily_returns(metrics.get("daily_returns"))
+    equity_series.index = idx
+    return {**metrics, **compute_metrics_from_equity(equity_series)}
+
+def full_update(writer, res=None):
+    """Ricostruzione completa; `res` come run_model() (calcolato se assente)."""
+    if res is None:
+        with span("model"):
+            res = run_model()
+    data = res["data"]
+    idx = res["idx"]
+    sig_final = res["sig_final"]
+    daily_returns = res["metrics"].get("daily_returns")
+
+    # Ricostruisci equity normalizzata base=1 dai daily_returns
+    equity_series = compute_equity_from_daily_returns(daily_returns)
+    equity_series.index = idx  # allinea a idx principale
+
+    # Salva equity.json + blocchi annuali per Plotly
+    with span("equity"):
+        write_equity(equity_series, precompress=PRECOMPRESS, writer=writer)
+
+    # Stato per i successivi aggiornamenti incrementali: checkpoint sulle
+    # barre confermate, ultime barre su una copia. Si pubblica il batch; lo
+    # stato deve coincidere (segnale, trade) o restare entro STATE_RTOL.
+    last_signal = bool(sig_final.loc[idx[-1]])
+    metrics = batch_metrics(res["metrics"], idx)
+    with span("state"):
+        confirmed, tail = split_confirmed(data)
+        state = ModelState.replay(confirmed, res["used"])
+        live, _ = state.live(tail)
+        live.verify(last_signal, metrics)
+    write_signals(writer, idx[-1], last_signal, metrics, metrics)
+    state.published = str(live.last_date.date())
+    state.save(writer=writer)
+
+def incremental_update(writer, data=None, used=None, last_signal=None, metrics=None) -> bool:
+    """
+    Aggiornamento incrementale su `data`/`used` (scaricati se assenti).
+    Il checkpoint avanza sulle barre confermate; le ultime REFRESH_BARS si
+    rielaborano su una copia e i loro punti equity si riscrivono.
+    Con `last_signal`/`metrics` del modello batch (come in pipeline) si
+    pubblicano quelli, dopo averli verificati contro lo stato.
+    Restituisce False se serve una ricostruzione completa (stato
+    mancante, parametri o dati cambiati).
+    """
+    state = ModelState.load()
+    if state is None:
+        print("[INFO] Nessuno stato salvato, eseguo ricostruzione completa.")
+        return False
+    if equity_last_date() != state.published:
+        print("[INFO] equity.json non allineato allo stato, ricostruzione completa.")
+        return False
+
+    if data is None:
+        with span("fetch"):
+            data, used = fetch_data()
+            data = data.dropna(subset=["FTSE_Close"])
+    if not state.matches(data, used):
+        print("[INFO] Storico o parametri cambiati, ricostruzione completa.")
+        return False
+
+    print(f"[INFO] Barre nuove: {int((data.index > pd.Timestamp(state.published)).sum())}")
+    confirmed, tail = split_confirmed(data)
+    with span("model"):
+        points = state.ingest(confirmed[confirmed.index > state.last_date])
+        live, tail_points = state.live(tail[tail.index > state.last_date])
+    if metrics is not None:
+        metrics = batch_metrics(metrics, data.index)
+    if last_signal is not None:
+        live.verify(last_signal, metrics)
+    metrics = live.metrics() if metrics is None else metrics
+
+    # Dal checkpoint in poi i punti salvati potevano essere provvisori (barre
+    # riviste, ritorno next-open non ancora noto): si riscrivono tutti, poi
+    # il nuovo punto provvisorio dell'ultima barra
+    with span("equity"):
+        append_equity(points + tail_points + [(live.last_date, live.equity)],
+                      precompress=PRECOMPRESS, writer=writer)
+        write_signals(writer, live.last_date, live.signal, metrics, metrics)
+        state.published = str(live.last_date.date())
+        state.save(writer=writer)
+    return True
+
+# ================= STRATEGIA PER LA PIPELINE =================
+class VolumeStrategy(Strategy):
+    """Modello volumi (OR dei titoli) + filtro SPX, vedi Nearer_My_God_to_Thee_2."""
+
+    name = "volumi"
+    analytics_file = "analytics.json"
+
+    def sources(self) -> dict:
+        out = {"FTSE": ([MAIN_TICKER], FTSE_COLUMNS, AUTO_ADJUST, False)}
+        for name, ticker in TICKERS.items():
+            out[name] = ([ticker] + FALLBACK_TICKERS.get(name, []), STOCK_COLUMNS, AUTO_ADJUST, True)
+        out["SPX"] = ([SPX_TICKER], SPX_COLUMNS, AUTO_ADJUST, False)
+        return out
+
+    @staticmethod
+    def used(market) -> list:
+        return [n for n in TICKERS if n in market.available]
+
+    def signal(self, market):
+        conds = volume_conditions(market.data, self.used(market))
+        return build_signal(market.data, conds)
+
+    def stream(self, market):
+        return ModelState(self.used(market))
+
+    def export(self, market, sig, metrics, writer, full):
+        used = self.used(market)
+        last = bool(sig.iloc[-1])
+        if full or not incremental_update(writer, market.data, used, last, metrics):
+            res = {"data": market.data, "used": used, "idx": market.idx,
+                   "sig_final": sig, "metrics": metrics}
+            full_update(writer, res)
+
+def main(full: bool = False):
+    """Solo il modello volumi; `python pipeline.py` aggiorna tutte le strategie."""
+    run(["volumi"], full)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--full", action="store_true",
+                        help="ricostruisce tutto lo storico invece di accodare le barre nuove")
+    main(full=parser.parse_args().full)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+WALK FORWARD — validazione out-of-sample del modello volumi
+La storia è divisa in fold consecutivi: per ogni fold si sceglie la
+configurazione migliore della griglia di sweep.py sulla finestra di train
+(rolling o ancorata all'inizio) e la si valuta sulla finestra di test
+successiva. Si riportano le metriche out-of-sample per fold e quelle
+della serie di test ricucita, a confronto con il modello congelato.
+
+Indicatori e segnali sono calcolati una sola volta su tutta la storia
+(sono causali); ogni fold valuta solo le proprie colonne di date. L'ultima
+barra del train è esclusa dalla selezione perché il suo ritorno next-open
+si realizza nel primo giorno di test.
+
+I fold girano su un pool di processi; le matrici della griglia (codici,
+filtro SPX, ritorni) stanno in un blocco di shared memory a cui i worker
+si agganciano, invece di essere serializzate per ogni worker.
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import Nearer_My_God_to_Thee_2 as model
+import sweep
+from batch_eval import METRICS, eval_rows, span_years
+
+TRAIN_YEARS = 5
+TEST_YEARS = 1
+SELECT_METRIC = "sharpe"
+MIN_TRADES = 50  # trade minimi nel train per una configurazione candidabile
+
+# Array condivisi (nome -> vista), impostati nel worker da _attach
+_SHARED = {}
+_SHM = None
+
+
+# ================= FOLD =================
+def make_folds(idx: pd.DatetimeIndex, train_years: int = TRAIN_YEARS,
+               test_years: int = TEST_YEARS, anchored: bool = False) -> list[tuple]:
+    """
+    Fold (train_start, test_start, test_end) come posizioni in idx, con
+    confini ad anni di calendario dalla prima data. `anchored` = il train
+    parte sempre dall'inizio (finestra crescente).
+    """
+    first = idx[0]
+    folds = []
+    k = 0
+    while True:
+        train_from = first if anchored else first + pd.DateOffset(years=k * test_years)
+        test_from = first + pd.DateOffset(years=train_years + k * test_years)
+        test_to = test_from + pd.DateOffset(years=test_years)
+        a, b, c = idx.searchsorted([train_from, test_from, test_to])
+        if b >= len(idx):
+            break
+        folds.append((int(a), int(b), int(c)))
+        k += 1
+    return folds
+
+
+# ================= SHARED MEMORY =================
+def _share(arrays: dict) -> tuple[shared_memory.SharedMemory, dict]:
+    """Copia gli array in un unico blocco condiviso; restituisce (blocco, layout)."""
+    layout, off = {}, 0
+    for k, a in arrays.items():
+        off = (off + 63) // 64 * 64  # allineamento
+        layout[k] = (off, a.shape, a.dtype.str)
+        off += a.nbytes
+    shm = shared_memory.SharedMemory(create=True, size=max(off, 1))
+    for k, a in arrays.items():
+        o, shape, dt = layout[k]
+        np.ndarray(shape, dtype=dt, buffer=shm.buf, offset=o)[...] = a
+    return shm, layout
+
+
+def _views(buf, layout: dict) -> dict:
+    return {k: np.ndarray(shape, dtype=dt, buffer=buf, offset=o)
+            for k, (o, shape, dt) in layout.items()}
+
+
+def _attach(name: str, layout: dict, static: dict) -> None:
+    """Initializer dei worker: aggancia il blocco condiviso (nessuna copia)."""
+    global _SHM
+    _SHM = shared_memory.SharedMemory(name=name)
+    _SHARED.clear()
+    _SHARED.update(_views(_SHM.buf, layout))
+    _SHARED.update(static)
+
+
+# ================= VALUTAZIONE =================
+def _fold_signal(g: int, a: int, c: int) -> np.ndarray:
+    n_thr = len(_SHARED["thresholds"])
+    n_sub = len(_SHARED["subset_masks"])
+    k, rest = divmod(g, n_sub * n_thr)
+    s, h = divmod(rest, n_thr)
+    code = _SHARED["codes"][k, a:c]
+    return ((_SHARED["subset_masks"][s] & code) != 0) & _SHARED["spx_ok"][h, a:c]
+
+
+def _run_fold(fold: tuple, metric: str, min_trades: int, chunk: int) -> dict:
+    """Selezione sul train e valutazione sul test di un fold (nel worker)."""
+    a, b, c = fold
+    dates = _SHARED["dates"]
+    ret = _SHARED["ret_next"]
+    train = slice(a, b - 1)  # l'ultima barra si realizza nel test
+    codes = {i: _SHARED["codes"][i, train] for i in range(len(_SHARED["codes"]))}
+    years = span_years(pd.DatetimeIndex(dates[train]))
+    res = sweep._run_blocks(list(codes), codes, _SHARED["spx_ok"][:, train],
+                            _SHARED["subset_masks"], ret[train], years, chunk,
+                            with_slope=metric == "slope")
+    score = np.concatenate([m[metric] for _, m in res]).astype(float)
+    trades = np.concatenate([m["n_trades"] for _, m in res])
+    score[trades < min_trades] = -np.inf
+    test_years = span_years(pd.DatetimeIndex(dates[b:c]))
+    if (trades < min_trades).all():
+        # Nessuna configurazione candidabile: nessuna selezione, flat nel test
+        best = None
+        out = {"fold": fold, "config": None, "train_score": float("nan"), "train_trades": None,
+               "oos": {k: float("nan") for k in METRICS}, "oos_sig": np.zeros(c - b, dtype=bool)}
+    else:
+        best = int(np.argmax(score))
+        out = {"fold": fold, "config": best, "train_score": float(score[best]),
+               "train_trades": int(trades[best])}
+    for name, g in (("oos", best), ("frozen", _SHARED["frozen"])):
+        if g is None:
+            continue
+        sig = _fold_signal(g, b, c)
+        m = eval_rows(ret[b:c], sig[None, :], test_years)
+        out[name] = {k: float(m[k][0]) for k in METRICS}
+        out[name + "_sig"] = sig
+    return out
+
+
+def _frozen_config(grid: dict, used: list) -> int | None:
+    """Indice g della configurazione congelata del modello, se è nella griglia."""
+    key = (10, model.VOL_MA10_FACTOR, 5, model.VOL_MA5_FACTOR)
+    sub = tuple(n for n in grid["subsets"] if set(n) == set(used))
+    thr = np.flatnonzero(grid["thresholds"] == 0.0)
+    if key not in grid["keys"] or not sub or not len(thr):
+        return None
+    n_thr = len(grid["thresholds"])
+    s = grid["subsets"].index(sub[0])
+    return (grid["keys"].index(key) * len(grid["subsets"]) + s) * n_thr + int(thr[0])
+
+
+def walk_forward(data: pd.DataFrame, used: list,
+                 train_years: int = TRAIN_YEARS, test_years: int = TEST_YEARS,
+                 anchored: bool = False, metric: str = SELECT_METRIC,
+                 min_trades: int = MIN_TRADES, workers: int | None = None,
+                 chunk: int = sweep.CHUNK, **grid_kwargs) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Restituisce (fold, ricucito): una riga per fold con parametri scelti e
+    metriche out-of-sample, e le metriche della serie di test ricucita per
+    la selezione walk-forward ("oos") e per il modello congelato ("frozen").
+    Un fold senza configurazioni con almeno `min_trades` trade nel train
+    non seleziona nulla: parametri e metriche NaN, nessun trade nel test
+    della serie ricucita.
+    `grid_kwargs` sono i parametri di sweep.prepare (griglia ridotta, ecc.).
+    """
+    idx = data.index
+    folds = make_folds(idx, train_years, test_years, anchored)
+    if not folds:
+        raise ValueError("Storia troppo corta per un fold di train + test")
+    grid = sweep.prepare(data, used, **grid_kwargs)
+    arrays = {
+        "codes": grid["codes"],
+        "spx_ok": grid["spx_ok"],
+        "ret_next": grid["ret_next"],
+        "dates": idx.values.astype("datetime64[ns]"),
+    }
+    static = {
+        "subset_masks": grid["subset_masks"],
+        "thresholds": grid["thresholds"],
+        "frozen": _frozen_config(grid, used),
+    }
+    workers = os.cpu_count() if workers is None else workers
+    workers = min(workers, len(folds))
+    args = ([metric] * len(folds), [min_trades] * len(folds), [chunk] * len(folds))
+
+    if workers > 1:
+        shm, layout = _share(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                     initargs=(shm.name, layout, static)) as pool:
+                results = list(pool.map(_run_fold, folds, *args))
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        _SHARED.clear()
+        _SHARED.update(arrays)
+        _SHARED.update(static)
+        results = [_run_fold(f, *a) for f, *a in zip(folds, *args)]
+
+    params = sweep.params_frame(grid["keys"], grid["subsets"], grid["thresholds"])
+    rows = []
+    for r in results:
+        a, b, c = r["fold"]
+        if r["config"] is None:
+            print(f"[WARN] Fold {idx[b].date()}: nessuna configurazione con almeno "
+                  f"{min_trades} trade nel train, nessuna selezione (flat nel test)")
+            chosen = {k: None for k in params.columns}
+        else:
+            chosen = params.iloc[r["config"]].to_dict()
+        row = {
+            "train_start": idx[a].date(), "test_start": idx[b].date(), "test_end": idx[c - 1].date(),
+            **chosen,
+            f"train_{metric}": r["train_score"], "train_trades": r["train_trades"],
+        }
+        row.update(r["oos"])
+        if "frozen" in r:
+            row["frozen_sharpe"] = r["frozen"]["sharpe"]
+            row["frozen_total_ret_%"] = r["frozen"]["total_ret_%"]
+        rows.append(row)
+
+    # Serie di test ricucita (i fold di test sono contigui se step = test)
+    test = np.concatenate([np.arange(b, c) for _, b, c in folds])
+    years = span_years(idx[test])
+    stitched = {}
+    for name in ("oos", "frozen"):
+        if name not in results[0]:
+            continue
+        sig = np.concatenate([r[name + "_sig"] for r in results])
+        m = eval_rows(grid["ret_next"][test], sig[None, :], years)
+        stitched[name] = {k: float(m[k][0]) for k in METRICS}
+    return pd.DataFrame(rows), pd.DataFrame(stitched).T
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Walk-forward del modello volumi")
+    ap.add_argument("--train-years", type=int, default=TRAIN_YEARS)
+    ap.add_argument("--test-years", type=int, default=TEST_YEARS)
+    ap.add_argument("--anchored", action="store_true", help="train sempre dall'inizio della storia")
+    ap.add_argument("--metric", default=SELECT_METRIC, choices=METRICS)
+    ap.add_argument("--min-trades", type=int, default=MIN_TRADES)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--out", default=None, help="CSV dei fold")
+    args = ap.parse_args()
+
+    data, used = sweep.load_data()
+    folds, stitched = walk_forward(data, used, args.train_years, args.test_years, args.anchored,
+                                   args.metric, args.min_trades, args.workers)
+    pd.set_option("display.width", 200)
+    print(f"\n=== WALK FORWARD: {len(folds)} fold ===")
+    print(folds.to_string(index=False))
+    print("\n=== TEST RICUCITO (out-of-sample) ===")
+    print(stitched.to_string())
+    if args.out:
+        folds.to_csv(args.out, index=False)
+        print(f"[OK] Fold salvati in {args.out}")